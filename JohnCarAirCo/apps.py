@@ -4,3 +4,17 @@ from django.apps import AppConfig
 class JohncaraircoConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'JohnCarAirCo'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_migrate, pre_migrate
+
+        # connects the reference cache's invalidation signals
+        from JohnCarAirCo import cache  # noqa: F401
+        from JohnCarAirCo import metrics, slow_queries, versions
+
+        connection_created.connect(versions.install, dispatch_uid='table-versions')
+        connection_created.connect(metrics.install, dispatch_uid='request-metrics')
+        connection_created.connect(slow_queries.install, dispatch_uid='slow-queries')
+        pre_migrate.connect(versions.pause, dispatch_uid='table-versions-pause')
+        post_migrate.connect(versions.resume, dispatch_uid='table-versions-resume')
@@ -0,0 +1,32 @@
+"""
+Django's database backends with the project's hooks added; settings.DATABASES
+uses these in place of django.db.backends.<vendor>.
+"""
+
+
+class TableVersionsMixin:
+    """
+    Bumps the TableVersion rows of the tables a transaction wrote to (see
+    JohnCarAirCo/versions.py) as its last statement before COMMIT, so the
+    new versions commit or roll back together with the data.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # (savepoint ids when written, table) for the open transaction
+        self.written_tables = set()
+
+    def _commit(self):
+        from JohnCarAirCo import versions
+
+        if self.connection is not None:
+            versions.flush(self)
+        return super()._commit()
+
+    def _rollback(self):
+        self.written_tables = set()
+        return super()._rollback()
+
+    def _savepoint_rollback(self, sid):
+        super()._savepoint_rollback(sid)
+        self.written_tables = {(savepoints, table) for savepoints, table in self.written_tables if sid not in savepoints}
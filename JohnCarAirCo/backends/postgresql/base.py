@@ -0,0 +1,8 @@
+"""django.db.backends.postgresql with the table-version bump before COMMIT."""
+from django.db.backends.postgresql import base
+
+from JohnCarAirCo.backends import TableVersionsMixin
+
+
+class DatabaseWrapper(TableVersionsMixin, base.DatabaseWrapper):
+    pass
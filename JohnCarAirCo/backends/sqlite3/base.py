@@ -0,0 +1,49 @@
+"""
+django.db.backends.sqlite3 with a tuning profile applied to every new
+connection, configured through two extra DATABASES OPTIONS:
+
+- 'pragmas': {name: value} run as `PRAGMA name = value` right after
+  connecting, e.g. journal_mode=WAL so readers no longer wait for writers.
+- 'transaction_mode': how transaction.atomic() starts a transaction,
+  'DEFERRED' (sqlite's default), 'IMMEDIATE' or 'EXCLUSIVE'. With IMMEDIATE
+  a writer takes the write lock at BEGIN, where the busy timeout ('timeout',
+  in seconds) makes it wait its turn; a deferred transaction that reads
+  first and writes later fails with "database is locked" at once instead,
+  whatever the timeout.
+
+Every other option is passed to sqlite3.connect() as before. Transactions
+also bump their tables' versions before they commit; see TableVersionsMixin.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+from JohnCarAirCo.backends import TableVersionsMixin
+
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+class DatabaseWrapper(TableVersionsMixin, base.DatabaseWrapper):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        options = self.settings_dict['OPTIONS']
+        self.pragmas = dict(options.get('pragmas', {}))
+        self.transaction_mode = str(options.get('transaction_mode', 'DEFERRED')).upper()
+        if self.transaction_mode not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f"DATABASES['{self.alias}']['OPTIONS']['transaction_mode'] must be one of {', '.join(TRANSACTION_MODES)}."
+            )
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pragmas', None)
+        params.pop('transaction_mode', None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f'BEGIN {self.transaction_mode}')
@@ -0,0 +1,928 @@
+"""
+Benchmark suites run by `manage.py benchmark <suite>`.
+
+Each suite is a function registered with @suite that takes the parsed
+command options and returns a JSON-serialisable report. The command runs it
+inside isolated_database(), a throwaway database created the same way the
+test runner creates one, so seeding large datasets never touches real data.
+"""
+import datetime
+import importlib.util
+import io
+import json
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import DatabaseError, connection, connections, transaction
+from django.test import override_settings
+from django.utils import timezone
+
+from JohnCarAirCo.models import (
+    AirconType,
+    CustomerDetails,
+    ProductUnit,
+    SalesOrder,
+    SalesOrderEntry,
+    SalesOrderPayment,
+    ServiceOrder,
+    ServiceOrderEntry,
+    ServiceOrderPayment,
+    ServiceType,
+    TechnicianDetails,
+)
+
+SUITES = {}
+
+
+def suite(name):
+    def register(func):
+        SUITES[name] = func
+        return func
+    return register
+
+
+@contextmanager
+def isolated_database():
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def api_urlconf(async_reads):
+    """
+    A fresh copy of the POSProject.urls module, with the async read endpoints
+    on or off whatever the settings say, for use as ROOT_URLCONF.
+    """
+    spec = importlib.util.find_spec('POSProject.urls')
+    module = importlib.util.module_from_spec(spec)
+    with override_settings(ASYNC_READ_ENDPOINTS=async_reads):
+        spec.loader.exec_module(module)
+    return module
+
+
+def measure(func, repeat=20):
+    """Call func `repeat` times and return latency percentiles in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'runs': repeat,
+    }
+
+
+def percentile(ordered, pct):
+    index = (len(ordered) - 1) * pct / 100
+    lower = int(index)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (index - lower)
+
+
+def plan_kind(plan):
+    # SQLite: "SEARCH t USING INDEX ..." vs "SCAN t"; PostgreSQL: "Index Scan" etc. vs "Seq Scan"
+    if 'SEARCH' in plan or 'Index Scan' in plan or 'Index Only Scan' in plan:
+        return 'index range scan'
+    return 'full scan'
+
+
+def seed(orders, days=365, batch_size=5000, rng=None):
+    """
+    Fill the current database with `orders` sales orders and as many service
+    orders, one entry and one payment each, spread evenly over the `days`
+    days up to today. Returns the seeded reference rows.
+    """
+    rng = rng or random.Random(0)
+    aircon_type = AirconType.objects.create(type_name='Split')
+    products = ProductUnit.objects.bulk_create([
+        ProductUnit(unit_name=f'Split {hp}HP', unit_price=Decimal(20000 + hp * 1000), unit_type=aircon_type)
+        for hp in range(1, 11)
+    ])
+    services = ServiceType.objects.bulk_create([
+        ServiceType(service_name=name, service_cost=Decimal(cost))
+        for name, cost in [('Cleaning', 800), ('Repair', 2500), ('Installation', 5000)]
+    ])
+    customers = CustomerDetails.objects.bulk_create([
+        CustomerDetails(
+            customer_name=f'Customer {i}', customer_contact='09170000000',
+            customer_email=f'customer{i}@example.com', customer_address='Cebu City',
+        )
+        for i in range(max(orders // 10, 1))
+    ])
+    technicians = TechnicianDetails.objects.bulk_create([
+        TechnicianDetails(
+            tech_name=f'Technician {i}', tech_phone='09270000000',
+            tech_email=f'tech{i}@example.com', tech_sched='MW 3PM - 5PM',
+        )
+        for i in range(20)
+    ])
+
+    today = timezone.localdate()
+    statuses = ['Active', 'Finished', 'Finished', 'Finished', 'Cancelled']
+    for start in range(0, orders, batch_size):
+        count = min(batch_size, orders - start)
+        sales = SalesOrder.objects.bulk_create([
+            SalesOrder(customer=rng.choice(customers), status=rng.choice(statuses), total_price=Decimal('25000.00'))
+            for _ in range(count)
+        ])
+        SalesOrderEntry.objects.bulk_create([
+            SalesOrderEntry(order=order, product=rng.choice(products), quantity=1, entry_price=Decimal('25000.00'))
+            for order in sales
+        ])
+        SalesOrderPayment.objects.bulk_create([
+            SalesOrderPayment(order=order, amount_paid=Decimal('25000.00'), is_cash=True) for order in sales
+        ])
+        service_orders = ServiceOrder.objects.bulk_create([
+            ServiceOrder(
+                customer=rng.choice(customers), technician=rng.choice(technicians),
+                service_date=today + datetime.timedelta(days=rng.randint(-days, 14)),
+                status=rng.choice(statuses), total_price=Decimal('800.00'),
+            )
+            for _ in range(count)
+        ])
+        ServiceOrderEntry.objects.bulk_create([
+            ServiceOrderEntry(order=order, service=rng.choice(services), quantity=1, entry_price=Decimal('800.00'))
+            for order in service_orders
+        ])
+        ServiceOrderPayment.objects.bulk_create([
+            ServiceOrderPayment(order=order, amount_paid=Decimal('800.00'), is_cash=True) for order in service_orders
+        ])
+
+    # auto_now_add stamps everything with today; spread rows over the period by id
+    for model, field in [
+        (SalesOrder, 'date_ordered'), (ServiceOrder, 'date_ordered'),
+        (SalesOrderPayment, 'date_paid'), (ServiceOrderPayment, 'date_paid'),
+    ]:
+        first = model.objects.order_by('pk').values_list('pk', flat=True).first() or 0
+        per_day = max(orders // days, 1)
+        for day in range(days):
+            low = first + day * per_day
+            high = low + per_day if day < days - 1 else first + orders
+            model.objects.filter(pk__gte=low, pk__lt=high).update(
+                **{field: today - datetime.timedelta(days=days - 1 - day)}
+            )
+
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    return {'products': products, 'services': services, 'customers': customers, 'technicians': technicians}
+
+
+def index_queries(technician):
+    today = timezone.localdate()
+    week_start = today - datetime.timedelta(days=today.weekday())
+    tomorrow = today + datetime.timedelta(days=1)
+    month_start = today.replace(day=1)
+    return {
+        'active sales orders this week': (
+            SalesOrder, ['status', 'date_ordered'],
+            SalesOrder.objects.filter(status='Active', date_ordered__gte=week_start, date_ordered__lte=today),
+        ),
+        'active services scheduled tomorrow': (
+            ServiceOrder, ['status', 'service_date'],
+            ServiceOrder.objects.filter(status='Active', service_date=tomorrow),
+        ),
+        "technician's services from tomorrow": (
+            ServiceOrder, ['technician', 'service_date'],
+            ServiceOrder.objects.filter(technician=technician, service_date__gte=tomorrow),
+        ),
+        'sales payments this month': (
+            SalesOrderPayment, ['date_paid'],
+            SalesOrderPayment.objects.filter(date_paid__gte=month_start, date_paid__lte=today),
+        ),
+        'service payments this month': (
+            ServiceOrderPayment, ['date_paid'],
+            ServiceOrderPayment.objects.filter(date_paid__gte=month_start, date_paid__lte=today),
+        ),
+    }
+
+
+def run_query(queryset):
+    return lambda: list(queryset.values_list('pk', flat=True))
+
+
+def profile(queries, repeat):
+    return {
+        label: {'plan': plan, 'access': plan_kind(plan), **measure(run_query(queryset), repeat)}
+        for label, (_, _, queryset) in queries.items()
+        for plan in [queryset.explain()]
+    }
+
+
+@suite('indexes')
+def index_suite(options):
+    """
+    Plan and latency of the dashboard filters with the status/date indexes,
+    then with all of them dropped, on a seeded dataset.
+    """
+    reference = seed(options['scale'])
+    queries = index_queries(reference['technicians'][0])
+    indexes = [
+        (model, next(index for index in model._meta.indexes if index.fields == fields))
+        for model, fields, _ in queries.values()
+    ]
+
+    after = profile(queries, options['repeat'])
+    with connection.schema_editor() as editor:
+        for model, index in indexes:
+            editor.remove_index(model, index)
+    try:
+        before = profile(queries, options['repeat'])
+    finally:
+        with connection.schema_editor() as editor:
+            for model, index in indexes:
+                editor.add_index(model, index)
+
+    return {
+        'scale': options['scale'],
+        'vendor': connection.vendor,
+        'queries': {
+            label: {
+                'index': index.name,
+                'rows': queryset.count(),
+                'before': before[label],
+                'after': after[label],
+            }
+            for (label, (_, _, queryset)), (_, index) in zip(queries.items(), indexes)
+        },
+    }
+
+
+@suite('search')
+def search_suite(options):
+    """Customer search latency with `scale` customers."""
+    from JohnCarAirCo.search import search_customers
+
+    rng = random.Random(0)
+    first_names = ['Juan', 'Maria', 'Jose', 'Ana', 'Pedro', 'Rosa', 'Carlo', 'Liza', 'Mark', 'Grace']
+    last_names = ['Dela Cruz', 'Santos', 'Reyes', 'Garcia', 'Mendoza', 'Torres', 'Flores', 'Ramos']
+    cities = ['Cebu City', 'Mandaue City', 'Lapu-Lapu City', 'Talisay City', 'Danao City']
+    for start in range(0, options['scale'], 10000):
+        CustomerDetails.objects.bulk_create([
+            CustomerDetails(
+                customer_name=f'{rng.choice(first_names)} {rng.choice(last_names)} {i}',
+                customer_contact=f'09{rng.randrange(10 ** 9):09d}',
+                customer_email=f'customer{i}@example.com',
+                customer_address=rng.choice(cities),
+            )
+            for i in range(start, min(start + 10000, options['scale']))
+        ])
+
+    queries = ['juan', 'maria sant', 'customer12345', '0917', 'reyes mandaue']
+    return {
+        'scale': options['scale'],
+        'vendor': connection.vendor,
+        'queries': {
+            query: measure(lambda: search_customers(query, 0, 20), options['repeat'])
+            for query in queries
+        },
+    }
+
+
+@suite('payloads')
+def payload_suite(options):
+    """
+    Sales and service order payloads built by the serializers and by the
+    values() read path on `scale` orders, for the full list (legacy
+    unpaginated mode) and for one page of the largest size. 'end to end'
+    includes the queries; 'serialization' starts from rows already loaded.
+    """
+    from JohnCarAirCo.pagination import KeysetPagination
+    from JohnCarAirCo.payloads import SalesOrderPayload, ServiceOrderPayload
+    from JohnCarAirCo.views import SalesOrderViewSet, ServiceOrderViewSet
+
+    seed(options['scale'])
+    page_size = KeysetPagination.max_page_size
+    report = {'scale': options['scale'], 'vendor': connection.vendor, 'page_size': page_size, 'lists': {}}
+    for label, payload_class, viewset in [
+        ('sales_orders', SalesOrderPayload, SalesOrderViewSet),
+        ('service_orders', ServiceOrderPayload, ServiceOrderViewSet),
+    ]:
+        ordered = viewset.queryset.order_by(*viewset.pagination_ordering)
+        payload = payload_class()
+        for scope, queryset in [('full list', ordered), ('page', ordered[:page_size])]:
+            instances, fetched = list(queryset), payload.fetch(payload.rows(queryset))
+            report['lists'][f'{label} {scope}'] = {
+                'end to end': compare(
+                    # all() so each run queries again instead of reading list()'s cache
+                    lambda: payload_class.serializer_class(queryset.all(), many=True).data,
+                    lambda: payload.build(payload.rows(queryset)),
+                    options['repeat'],
+                ),
+                'serialization': compare(
+                    lambda: payload_class.serializer_class(instances, many=True).data,
+                    lambda: payload.assemble(*fetched),
+                    options['repeat'],
+                ),
+            }
+    return report
+
+
+def compare(serializer, values, repeat):
+    serializer, values = measure(serializer, repeat), measure(values, repeat)
+    return {'serializer': serializer, 'values': values, 'speedup': round(serializer['p50_ms'] / values['p50_ms'], 1)}
+
+
+@suite('rendering')
+def rendering_suite(options):
+    """
+    Render time of the large list payloads with DRF's JSONRenderer and with
+    FastJSONRenderer, and their size and compression time per encoding.
+    """
+    from rest_framework.renderers import JSONRenderer
+
+    from JohnCarAirCo.middleware import available_encodings, compressor, get_config
+    from JohnCarAirCo.payloads import SalesOrderPayload, ServiceOrderPayload
+    from JohnCarAirCo.renderers import FastJSONRenderer, orjson
+    from JohnCarAirCo.serializers import SalesOrderPaymentSerializer
+    from JohnCarAirCo.views import SalesOrderPaymentViewSet, SalesOrderViewSet, ServiceOrderViewSet
+
+    seed(options['scale'])
+    config = get_config()
+    sales, service = SalesOrderPayload(), ServiceOrderPayload()
+    payloads = {
+        'sales_orders': sales.build(sales.rows(SalesOrderViewSet.queryset.order_by('-date_ordered', '-id'))),
+        'service_orders': service.build(service.rows(ServiceOrderViewSet.queryset.order_by('-date_ordered', '-id'))),
+        'sales_order_payments': SalesOrderPaymentSerializer(SalesOrderPaymentViewSet.queryset.order_by('id'), many=True).data,
+    }
+
+    def compress(content, encoding):
+        stream = compressor(encoding, config)
+        return stream.compress(content) + stream.flush()
+
+    report = {'scale': options['scale'], 'orjson': orjson is not None, 'lists': {}}
+    for label, data in payloads.items():
+        content = FastJSONRenderer().render(data)
+        report['lists'][label] = {
+            'render': {
+                'stock': measure(lambda: JSONRenderer().render(data), options['repeat']),
+                'fast': measure(lambda: FastJSONRenderer().render(data), options['repeat']),
+            },
+            'bytes': {
+                'identity': len(content),
+                **{encoding: len(compress(content, encoding)) for encoding in available_encodings(config)},
+            },
+            'compress': {
+                encoding: measure(lambda: compress(content, encoding), options['repeat'])
+                for encoding in available_encodings(config)
+            },
+        }
+    return report
+
+
+SQLITE_PROFILES = {
+    # what settings.DATABASES used before the tuned profile: no pragmas, deferred transactions
+    'stock': {'OPTIONS': {}},
+    # as configured in settings.DATABASES
+    'tuned': {},
+}
+
+
+class Traffic:
+    """
+    Concurrent POS traffic against the database `alias`: reader threads page
+    through orders while writer threads check out, each thread doing
+    `repeat` operations. A checkout reads the product before writing, the
+    pattern SQLite's deferred transactions fail outright on.
+    """
+    readers = 4
+    writers = 4
+
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self.product_ids = list(ProductUnit.objects.values_list('id', flat=True))
+        self.customer_ids = list(CustomerDetails.objects.values_list('id', flat=True)[:100])
+        self.max_order = SalesOrder.objects.order_by('-id').values_list('id', flat=True).first()
+
+    def read(self, alias, rng):
+        start = rng.randint(1, self.max_order)
+        orders = list(
+            SalesOrder.objects.using(alias).filter(id__gte=start).order_by('id')
+            .values('id', 'customer__customer_name', 'total_price', 'status')[:50]
+        )
+        list(SalesOrderEntry.objects.using(alias).filter(order_id__in=[order['id'] for order in orders]).values())
+
+    def write(self, alias, rng):
+        with transaction.atomic(using=alias):
+            product = ProductUnit.objects.using(alias).get(pk=rng.choice(self.product_ids))
+            order = SalesOrder.objects.using(alias).create(
+                customer_id=rng.choice(self.customer_ids), total_price=product.unit_price,
+            )
+            SalesOrderEntry.objects.using(alias).create(
+                order=order, product=product, quantity=1, entry_price=product.unit_price,
+            )
+
+    def worker(self, alias, operation, seed_value, results):
+        rng = random.Random(seed_value)
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            try:
+                operation(alias, rng)
+            except DatabaseError:
+                # "database is locked" on SQLite, deadlocks or serialization failures elsewhere
+                results['failed'] += 1
+            else:
+                results['timings'].append((time.perf_counter() - start) * 1000)
+        connections[alias].close()
+
+    def run(self, alias):
+        results = {kind: {'timings': [], 'failed': 0} for kind in ('reads', 'writes')}
+        operations = [('reads', self.read)] * self.readers + [('writes', self.write)] * self.writers
+        threads = [
+            threading.Thread(target=self.worker, args=(alias, operation, index, results[kind]))
+            for index, (kind, operation) in enumerate(operations)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        report = {'seconds': round(elapsed, 3)}
+        for kind, result in results.items():
+            timings = sorted(result['timings'])
+            report[kind] = {
+                'completed': len(timings),
+                'failed': result['failed'],
+                'per_second': round(len(timings) / elapsed, 1),
+                'p50_ms': round(percentile(timings, 50), 3) if timings else None,
+                'p95_ms': round(percentile(timings, 95), 3) if timings else None,
+            }
+        return report
+
+
+@contextmanager
+def sqlite_copy(directory, name, overrides):
+    """
+    An alias for an on-disk copy of the current (in-memory) SQLite database,
+    with `overrides` applied to its settings.
+    """
+    alias = f'benchmark_{name}'
+    path = f'{directory}/{name}.db'
+    with sqlite3.connect(path) as target:
+        connection.ensure_connection()
+        connection.connection.backup(target)
+    connections.settings[alias] = {**connection.settings_dict, **overrides, 'NAME': path}
+    try:
+        yield alias
+    finally:
+        del connections.settings[alias]
+
+
+@suite('sqlite')
+def sqlite_suite(options):
+    """
+    Traffic against an on-disk copy of the seeded database, once with
+    Django's stock SQLite backend and once with the configured profile (see
+    JohnCarAirCo/backends/sqlite3).
+    """
+    if connection.vendor != 'sqlite':
+        return {'skipped': f'{connection.vendor} database'}
+
+    seed(options['scale'])
+    traffic = Traffic(options['repeat'])
+    directory = tempfile.mkdtemp()
+    report = {'scale': options['scale'], 'threads': {'readers': traffic.readers, 'writers': traffic.writers}, 'profiles': {}}
+    try:
+        for name, overrides in SQLITE_PROFILES.items():
+            with sqlite_copy(directory, name, overrides) as alias:
+                report['profiles'][name] = traffic.run(alias)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return report
+
+
+@suite('throughput')
+def throughput_suite(options):
+    """
+    The same traffic against the configured database, to compare
+    deployments: run it once per DB_ENGINE (see settings.DATABASES) with
+    --output and compare the reports. SQLite runs on an on-disk copy, since
+    its test database lives in memory.
+    """
+    seed(options['scale'])
+    traffic = Traffic(options['repeat'])
+    report = {
+        'scale': options['scale'], 'vendor': connection.vendor,
+        'threads': {'readers': traffic.readers, 'writers': traffic.writers},
+    }
+    if connection.vendor != 'sqlite':
+        # leave the main thread's connection free for the workers' own
+        connection.close()
+        report['traffic'] = traffic.run(connection.alias)
+        return report
+
+    directory = tempfile.mkdtemp()
+    try:
+        with sqlite_copy(directory, 'configured', {}) as alias:
+            report['traffic'] = traffic.run(alias)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return report
+
+
+# a typical threaded WSGI worker (e.g. gunicorn --threads 8); more
+# simultaneous connections wait for a free thread
+WSGI_THREADS = 8
+CONCURRENCY_LEVELS = (10, 100, 500)
+ASGI_PATHS = ('/sales_orders/', '/service_orders/', '/product_units/', '/customer_details/')
+
+
+class InFlight:
+    """Counts requests inside the handler, and the most there were at once."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.current = self.peak = 0
+
+    def __enter__(self):
+        with self.lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+
+    def __exit__(self, *exc_info):
+        with self.lock:
+            self.current -= 1
+
+
+class ThreadSampler(threading.Thread):
+    """Samples threading.active_count() until stopped; .peak is the highest seen."""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.peak = threading.active_count()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(0.005):
+            self.peak = max(self.peak, threading.active_count())
+
+
+def wsgi_get(handler, path, query, token):
+    return wsgi_request(handler, 'GET', path, query, token)
+
+
+def wsgi_request(handler, method, path, query='', token=None, data=None):
+    """Send one request straight to a WSGI handler; returns its status code and body."""
+    body = json.dumps(data).encode() if data is not None else b''
+    environ = {
+        'REQUEST_METHOD': method, 'PATH_INFO': path, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+        'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': 'testserver', 'REMOTE_ADDR': '127.0.0.1',
+        'CONTENT_TYPE': 'application/json', 'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': io.BytesIO(body), 'wsgi.errors': sys.stderr, 'wsgi.url_scheme': 'http',
+        'wsgi.version': (1, 0), 'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+    }
+    if token:
+        environ['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+    status = []
+    body = b''.join(handler(environ, lambda code, headers, exc_info=None: status.append(code)))
+    return int(status[0].split()[0]), body
+
+
+async def asgi_get(application, path, query, token, in_flight):
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+        'headers': [(b'host', b'testserver'), (b'authorization', f'Bearer {token}'.encode())],
+        'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    with in_flight:
+        await application(scope, receive, send)
+    body = b''.join(message.get('body', b'') for message in messages if message['type'] == 'http.response.body')
+    return messages[0]['status'], body
+
+
+def concurrency_report(timings, statuses, elapsed, in_flight, sampler):
+    timings.sort()
+    return {
+        'requests': len(timings),
+        'errors': sum(status != 200 for status in statuses),
+        'per_second': round(len(timings) / elapsed, 1),
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'peak_in_flight': in_flight.peak,
+        'peak_threads': sampler.peak,
+    }
+
+
+@suite('asgi')
+def asgi_suite(options):
+    """
+    How many simultaneous connections one process serves, and how fast, for
+    the read endpoints behind the WSGI handler with WSGI_THREADS worker
+    threads and behind the ASGI handler with the async read views. At each
+    of CONCURRENCY_LEVELS, that many clients each send `repeat` GETs, one at
+    a time, cycling through ASGI_PATHS as page_size=50 pages. Requests go
+    through the full middleware stack with JWT authentication, but not
+    through a socket.
+    """
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+
+    from django.contrib.auth.models import User
+    from django.core.handlers.asgi import ASGIHandler
+    from django.core.handlers.wsgi import WSGIHandler
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    seed(options['scale'])
+    token = str(AccessToken.for_user(User.objects.create_user(username='benchmark')))
+    repeat, query = options['repeat'], 'page_size=50'
+    report = {'scale': options['scale'], 'wsgi_threads': WSGI_THREADS, 'requests_per_client': repeat, 'levels': {}}
+
+    for clients in CONCURRENCY_LEVELS:
+        paths = [ASGI_PATHS[index % len(ASGI_PATHS)] for index in range(clients * repeat)]
+        level = report['levels'][clients] = {}
+
+        with override_settings(ROOT_URLCONF=api_urlconf(async_reads=False), ALLOWED_HOSTS=['testserver']):
+            wsgi_handler, in_flight, sampler = WSGIHandler(), InFlight(), ThreadSampler()
+            # one thread per connection, but only WSGI_THREADS of them inside the handler at once
+            worker_threads = threading.BoundedSemaphore(WSGI_THREADS)
+            timings, statuses = [], []
+
+            def handler(environ, start_response):
+                with worker_threads, in_flight:
+                    return wsgi_handler(environ, start_response)
+
+            def client(start):
+                for path in paths[start::clients]:
+                    began = time.perf_counter()
+                    status, _ = wsgi_get(handler, path, query, token)
+                    timings.append((time.perf_counter() - began) * 1000)
+                    statuses.append(status)
+                connections.close_all()
+
+            sampler.start()
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=clients) as executor:
+                list(executor.map(client, range(clients)))
+            elapsed = time.perf_counter() - started
+            sampler.stopped.set()
+            level['wsgi'] = concurrency_report(timings, statuses, elapsed, in_flight, sampler)
+
+        with override_settings(ROOT_URLCONF=api_urlconf(async_reads=True), ALLOWED_HOSTS=['testserver']):
+            application, in_flight, sampler = ASGIHandler(), InFlight(), ThreadSampler()
+            timings, statuses = [], []
+
+            async def async_client(start):
+                for path in paths[start::clients]:
+                    began = time.perf_counter()
+                    status, _ = await asgi_get(application, path, query, token, in_flight)
+                    timings.append((time.perf_counter() - began) * 1000)
+                    statuses.append(status)
+
+            async def run_clients():
+                await asyncio.gather(*(async_client(start) for start in range(clients)))
+
+            sampler.start()
+            started = time.perf_counter()
+            asyncio.run(run_clients())
+            elapsed = time.perf_counter() - started
+            sampler.stopped.set()
+            level['asgi'] = concurrency_report(timings, statuses, elapsed, in_flight, sampler)
+    return report
+
+
+@suite('metrics')
+def metrics_suite(options):
+    """
+    What recording request metrics costs: a histogram observation alone, on
+    one thread and on WSGI_THREADS threads sharing it, and `repeat` rounds
+    of GETs over ASGI_PATHS (page_size=50) through the WSGI handler with
+    MetricsMiddleware on and off.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    from django.contrib.auth.models import User
+    from django.core.handlers.wsgi import WSGIHandler
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    from JohnCarAirCo import metrics
+
+    histogram = metrics.Histogram('benchmark', '', ('route', 'method'), metrics.LATENCY_BUCKETS)
+    observations = 200000
+    report = {'scale': options['scale'], 'observe_ns': {}}
+
+    def observe(count):
+        for index in range(count):
+            histogram.observe(('salesorder-list', 'GET'), (index % 1000) / 1000)
+
+    for threads in (1, WSGI_THREADS):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(observe, [observations // threads] * threads))
+        report['observe_ns'][f'{threads}_threads'] = round((time.perf_counter() - started) / observations * 1e9)
+
+    seed(options['scale'])
+    token = str(AccessToken.for_user(User.objects.create_user(username='benchmark')))
+    with override_settings(ROOT_URLCONF=api_urlconf(async_reads=False), ALLOWED_HOSTS=['testserver']):
+        handlers = {}
+        for enabled in (False, True):
+            # the middleware reads its setting when the handler loads it
+            with override_settings(METRICS={'ENABLED': enabled}):
+                handlers[enabled] = WSGIHandler()
+        # alternate between the two, so drift over the run hits both alike
+        timings = {False: [], True: []}
+        for round_number in range(options['repeat'] + 1):
+            for path in ASGI_PATHS:
+                for enabled, handler in handlers.items():
+                    began = time.perf_counter()
+                    status, _ = wsgi_get(handler, path, 'page_size=50', token)
+                    elapsed = (time.perf_counter() - began) * 1000
+                    assert status == 200, (path, status)
+                    # the first round warms up caches and connections
+                    if round_number:
+                        timings[enabled].append(elapsed)
+
+    for enabled, values in timings.items():
+        values.sort()
+        report['metrics_on' if enabled else 'metrics_off'] = {
+            'requests': len(values),
+            'mean_ms': round(statistics.fmean(values), 3),
+            'p50_ms': round(percentile(values, 50), 3),
+            'p95_ms': round(percentile(values, 95), 3),
+        }
+    return report
+
+
+BENCHMARK_PASSWORD = 'benchmark-pass'
+# the router endpoints timed by the endpoints suite, with the model behind
+# each and the body of a valid POST to it
+ENDPOINTS = {
+    'sales_orders': (SalesOrder, lambda refs, bounds, rng: {'customer_id': rng.choice(refs['customers']).pk}),
+    'sales_order_entries': (SalesOrderEntry, lambda refs, bounds, rng: {
+        'order_id': rng.randint(*bounds[SalesOrder]), 'product_id': rng.choice(refs['products']).pk, 'quantity': 1,
+    }),
+    'sales_order_payments': (SalesOrderPayment, lambda refs, bounds, rng: {
+        'order_id': rng.randint(*bounds[SalesOrder]), 'amount_paid': '100.00', 'is_cash': True,
+    }),
+    'service_orders': (ServiceOrder, lambda refs, bounds, rng: {
+        'customer_id': rng.choice(refs['customers']).pk, 'technician_id': rng.choice(refs['technicians']).pk,
+        'service_date': (timezone.localdate() + datetime.timedelta(days=7)).isoformat(),
+    }),
+    'service_order_entries': (ServiceOrderEntry, lambda refs, bounds, rng: {
+        'order_id': rng.randint(*bounds[ServiceOrder]), 'service_id': rng.choice(refs['services']).pk, 'quantity': 1,
+    }),
+    'service_order_payments': (ServiceOrderPayment, lambda refs, bounds, rng: {
+        'order_id': rng.randint(*bounds[ServiceOrder]), 'amount_paid': '100.00', 'is_cash': True,
+    }),
+}
+# latency differences below this are run-to-run noise on a shared machine, whatever the percentage
+NOISE_FLOOR_MS = 5.0
+# below this many requests p95 and p99 are just the slowest one or two, so one pause moves them
+TAIL_MIN_REQUESTS = 100
+
+
+def time_requests(handler, token, requests):
+    """
+    Send `requests`, (method, path, data) tuples, one after another; returns
+    their latency, throughput and queries per request, and the response bodies.
+    """
+    timings, bodies, errors, queries = [], [], 0, 0
+
+    def count(execute, sql, params, many, context):
+        nonlocal queries
+        queries += 1
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    with connection.execute_wrapper(count):
+        for method, url, data in requests:
+            path, _, query = url.partition('?')
+            began = time.perf_counter()
+            status, body = wsgi_request(handler, method, path, query, token, data)
+            timings.append((time.perf_counter() - began) * 1000)
+            errors += status >= 400
+            bodies.append(body)
+    elapsed = time.perf_counter() - started
+
+    timings.sort()
+    return {
+        'requests': len(timings),
+        'errors': errors,
+        'per_second': round(len(timings) / elapsed, 1),
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'queries_per_request': round(queries / len(timings), 2),
+    }, bodies
+
+
+def created_ids(bodies):
+    items = (json.loads(body) for body in bodies if body)
+    return [item['id'] for item in items if isinstance(item, dict) and 'id' in item]
+
+
+@suite('endpoints')
+def endpoint_suite(options):
+    """
+    Latency, throughput and queries per request of the API: list (the first
+    page of 50; a request without ?page_size= gets every row while
+    PAGINATION_LEGACY_MODE is on), retrieve, create and delete for sales and service orders, their
+    entries and their payments, and obtaining, refreshing and verifying a
+    JWT. Each is sent `repeat` times by one client through the WSGI handler
+    and the full middleware stack. The rows created are the ones deleted, so
+    the database keeps its seeded size throughout. Run it with several
+    --scale values, and keep the report to pass as --baseline later.
+    """
+    from django.contrib.auth.models import User
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.db.models import Max, Min
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    rng = random.Random(0)
+    refs = seed(options['scale'])
+    repeat = options['repeat']
+    # enough stock for every entry the create runs add
+    ProductUnit.objects.release({product.pk: repeat for product in refs['products']}, kind='Receipt')
+    bounds = {
+        model: tuple(model.objects.aggregate(low=Min('pk'), high=Max('pk')).values())
+        for model, _ in ENDPOINTS.values()
+    }
+    refresh = RefreshToken.for_user(User.objects.create_user(username='benchmark', password=BENCHMARK_PASSWORD))
+    token = str(refresh.access_token)
+    report = {'scale': options['scale'], 'requests_per_measurement': repeat, 'endpoints': {}}
+
+    with override_settings(ROOT_URLCONF=api_urlconf(async_reads=False), ALLOWED_HOSTS=['testserver']):
+        handler = WSGIHandler()
+        for name, (model, payload) in ENDPOINTS.items():
+            path, (low, high) = f'/{name}/', bounds[model]
+            # the first request warms up caches and connections
+            wsgi_request(handler, 'GET', path, token=token)
+            results = report['endpoints'][name] = {}
+            results['list'], _ = time_requests(handler, token, [('GET', f'{path}?page_size=50', None)] * repeat)
+            results['retrieve'], _ = time_requests(
+                handler, token, [('GET', f'{path}{rng.randint(low, high)}/', None) for _ in range(repeat)],
+            )
+            results['create'], bodies = time_requests(
+                handler, token, [('POST', path, payload(refs, bounds, rng)) for _ in range(repeat)],
+            )
+            results['delete'], _ = time_requests(
+                handler, token, [('DELETE', f'{path}{pk}/', None) for pk in created_ids(bodies)],
+            )
+
+        credentials = {'username': 'benchmark', 'password': BENCHMARK_PASSWORD}
+        report['endpoints']['token'] = {
+            'obtain': time_requests(handler, None, [('POST', '/api/token/', credentials)] * repeat)[0],
+            'refresh': time_requests(handler, None, [('POST', '/api/token/refresh/', {'refresh': str(refresh)})] * repeat)[0],
+            'verify': time_requests(handler, None, [('POST', '/api/token/verify/', {'token': token})] * repeat)[0],
+        }
+    return report
+
+
+def regressions(baseline, report, tolerance=0.5, path=''):
+    """
+    The measurements in `report` that are worse than in `baseline`, an
+    earlier report of the same suite: latencies (*_ms) and throughput
+    (per_second) by more than `tolerance`, and by NOISE_FLOOR_MS for
+    latencies; queries per request and errors by any amount. p95 and p99
+    only count when measured over TAIL_MIN_REQUESTS requests or more.
+    """
+    found = []
+    samples = report.get('requests', report.get('runs', 0))
+    for key, value in report.items():
+        old = baseline.get(key) if isinstance(baseline, dict) else None
+        name = f'{path}.{key}' if path else key
+        if isinstance(value, dict):
+            found += regressions(old, value, tolerance, name)
+            continue
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not isinstance(old, (int, float)):
+            continue
+        if key in ('p95_ms', 'p99_ms') and samples < TAIL_MIN_REQUESTS:
+            continue
+        if key.endswith('_ms'):
+            worse = value > old * (1 + tolerance) and value - old >= NOISE_FLOOR_MS
+        elif key == 'per_second':
+            worse = value < old / (1 + tolerance)
+        elif key in ('queries_per_request', 'errors'):
+            worse = value > old
+        else:
+            continue
+        if worse:
+            found.append({'metric': name, 'baseline': old, 'current': value})
+    return found
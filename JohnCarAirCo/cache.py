@@ -0,0 +1,190 @@
+"""
+Read-through cache for the serialized list payloads of the reference
+tables' viewsets (AirconType, ServiceType, ProductUnit). Writes never read
+from it: foreign keys and prices on order writes are looked up in the
+database, so a stale entry can at worst show an old list, never price an
+order or reject a pk.
+
+Every key carries per-model generation numbers. post_save/post_delete bump
+the model's 'rows' generation, so all cached payloads of that model go
+stale at once; stock movements only bump ProductUnit's 'stock' generation,
+which the product list payloads depend on. The bump happens both
+immediately and again on commit, so a reader that cached pre-commit rows in
+between is discarded too. Queryset .update()/.delete() on these models
+bypass signals and must call invalidate() themselves.
+
+The list payloads are keyed by the ETag of the conditional GET (see
+CachedListMixin), which follows the table versions in the database, so a
+per-process LocMemCache can't serve one worker's stale list after another
+worker's write. wsgi.py and asgi.py warm each serving process's cache as it
+starts; point CACHES at a shared backend such as Redis or Memcached to
+share the payloads between workers instead.
+"""
+import hashlib
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import DatabaseError, transaction
+from django.db.models.signals import post_delete, post_save
+
+from JohnCarAirCo.models import AirconType, ProductUnit, ServiceType, StockMovement, stock_changed
+
+REFERENCE_MODELS = (AirconType, ServiceType, ProductUnit)
+# how long a rebuild may hold the lock, and how long others wait for it
+LOCK_TIMEOUT = 10
+LOCK_WAIT = 2.0
+POLL_INTERVAL = 0.02
+
+logger = logging.getLogger(__name__)
+_MISSING = object()
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def get_cache():
+    return caches[getattr(settings, 'REFERENCE_CACHE_ALIAS', 'default')]
+
+
+def is_shared():
+    """Whether other processes read the same cache, so warming it from one fills theirs."""
+    return not isinstance(get_cache(), (LocMemCache, DummyCache))
+
+
+def _count(model, outcome):
+    with _stats_lock:
+        _stats[(model._meta.label_lower, outcome)] += 1
+
+
+def stats():
+    """{'<app_label.model>': {'hit': n, 'miss': n, 'wait': n}}, keyed by model label, for this process."""
+    with _stats_lock:
+        report = {}
+        for (label, outcome), count in _stats.items():
+            report.setdefault(label, {'hit': 0, 'miss': 0, 'wait': 0})[outcome] = count
+        return report
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def _generation_key(model, scope):
+    return f'ref:{model._meta.label_lower}:{scope}:generation'
+
+
+def generation(model, scope='rows'):
+    cache = get_cache()
+    key = _generation_key(model, scope)
+    value = cache.get(key)
+    if value is None:
+        # a fresh clock value can't collide with a generation that was evicted
+        cache.add(key, time.time_ns(), timeout=None)
+        value = cache.get(key)
+    return value
+
+
+def invalidate(model, scope='rows'):
+    def bump():
+        cache = get_cache()
+        key = _generation_key(model, scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), timeout=None)
+
+    bump()
+    transaction.on_commit(bump)
+
+
+def get_or_build(model, name, build, scopes=('rows',)):
+    """
+    Return the cached value `name` for `model`, building it with `build()` on a
+    miss; it goes stale when any of `scopes` is invalidated. Only one caller
+    rebuilds a missing key at a time; the others wait up to LOCK_WAIT seconds
+    for its result before building it themselves.
+    """
+    cache = get_cache()
+    digest = hashlib.sha1(name.encode('utf-8')).hexdigest()
+    generations = ':'.join(str(generation(model, scope)) for scope in scopes)
+    key = f'ref:{model._meta.label_lower}:{generations}:{digest}'
+
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        _count(model, 'hit')
+        return value
+    _count(model, 'miss')
+
+    if cache.add(f'{key}:lock', 1, timeout=LOCK_TIMEOUT):
+        try:
+            value = build()
+            cache.set(key, value, timeout=getattr(settings, 'REFERENCE_CACHE_TIMEOUT', 300))
+        finally:
+            cache.delete(f'{key}:lock')
+        return value
+
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        value = cache.get(key, _MISSING)
+        if value is not _MISSING:
+            _count(model, 'wait')
+            return value
+    return build()
+
+
+def warm_up():
+    """
+    Load the default list payloads for every host in ALLOWED_HOSTS, so the
+    first requests after a deploy hit the cache. Run by wsgi.py and asgi.py
+    in every serving process, and by `manage.py warm_reference_cache` for a
+    shared cache.
+    """
+    from django.test import RequestFactory
+    from rest_framework.request import Request
+
+    from JohnCarAirCo.views import AirconTypeViewSet, ProductUnitViewSet, ServiceTypeViewSet
+
+    hosts = [host for host in settings.ALLOWED_HOSTS if host not in ('*', '') and not host.startswith('.')]
+    viewsets = {
+        AirconTypeViewSet: '/aircon_types/',
+        ServiceTypeViewSet: '/services/',
+        ProductUnitViewSet: '/product_units/',
+    }
+    try:
+        for host in hosts:
+            factory = RequestFactory(HTTP_HOST=host)
+            for viewset, path in viewsets.items():
+                request = Request(factory.get(path))
+                view = viewset(request=request, format_kwarg=None, action='list', args=(), kwargs={})
+                # the same cache key a client's GET gets
+                request.accepted_renderer, request.accepted_media_type = view.perform_content_negotiation(request)
+                view.validators = view.get_validators(request)
+                view.list(request)
+    except DatabaseError:
+        # e.g. migrations not applied yet; the cache fills on first use instead
+        logger.warning("Reference cache warm-up skipped", exc_info=True)
+
+
+def _invalidate_sender(sender, **kwargs):
+    invalidate(sender)
+    if sender is AirconType:
+        # product payloads show the type, which deleting it nulls out via a plain UPDATE
+        invalidate(ProductUnit)
+
+
+def _invalidate_stock(sender, **kwargs):
+    invalidate(ProductUnit, 'stock')
+
+
+for _model in REFERENCE_MODELS:
+    post_save.connect(_invalidate_sender, sender=_model, dispatch_uid=f'reference-cache-save-{_model.__name__}')
+    post_delete.connect(_invalidate_sender, sender=_model, dispatch_uid=f'reference-cache-delete-{_model.__name__}')
+stock_changed.connect(_invalidate_stock, sender=ProductUnit, dispatch_uid='reference-cache-stock')
+post_save.connect(_invalidate_stock, sender=StockMovement, dispatch_uid='reference-cache-stock-movement')
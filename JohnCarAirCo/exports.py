@@ -0,0 +1,114 @@
+"""
+Streaming CSV / NDJSON exports of orders, entries and payments.
+
+Rows come from values_list() over QuerySet.iterator(), so neither model
+instances nor the whole result are ever held in memory; output is yielded
+in chunks of about `chunk_size` rows. Card numbers, expiry dates and CVVs
+are never exported.
+"""
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from JohnCarAirCo.models import (
+    SalesOrder,
+    SalesOrderEntry,
+    ServiceOrder,
+    ServiceOrderEntry,
+    SalesOrderPayment,
+    ServiceOrderPayment,
+)
+
+# export name -> (model, [(column header, values_list path), ...])
+EXPORTS = {
+    'sales_orders': (SalesOrder, [
+        ('id', 'id'),
+        ('customer_id', 'customer_id'),
+        ('customer', 'customer__customer_name'),
+        ('date_ordered', 'date_ordered'),
+        ('status', 'status'),
+        ('total_price', 'total_price'),
+    ]),
+    'service_orders': (ServiceOrder, [
+        ('id', 'id'),
+        ('customer_id', 'customer_id'),
+        ('customer', 'customer__customer_name'),
+        ('technician_id', 'technician_id'),
+        ('technician', 'technician__tech_name'),
+        ('date_ordered', 'date_ordered'),
+        ('service_date', 'service_date'),
+        ('status', 'status'),
+        ('total_price', 'total_price'),
+    ]),
+    'sales_order_entries': (SalesOrderEntry, [
+        ('id', 'id'),
+        ('order_id', 'order_id'),
+        ('product_id', 'product_id'),
+        ('product', 'product__unit_name'),
+        ('quantity', 'quantity'),
+        ('entry_price', 'entry_price'),
+    ]),
+    'service_order_entries': (ServiceOrderEntry, [
+        ('id', 'id'),
+        ('order_id', 'order_id'),
+        ('service_id', 'service_id'),
+        ('service', 'service__service_name'),
+        ('quantity', 'quantity'),
+        ('entry_price', 'entry_price'),
+    ]),
+    'sales_order_payments': (SalesOrderPayment, [
+        ('id', 'id'),
+        ('order_id', 'order_id'),
+        ('amount_paid', 'amount_paid'),
+        ('date_paid', 'date_paid'),
+        ('is_cash', 'is_cash'),
+        ('cc_name', 'cc_name'),
+    ]),
+    'service_order_payments': (ServiceOrderPayment, [
+        ('id', 'id'),
+        ('order_id', 'order_id'),
+        ('amount_paid', 'amount_paid'),
+        ('date_paid', 'date_paid'),
+        ('is_cash', 'is_cash'),
+        ('cc_name', 'cc_name'),
+    ]),
+}
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+
+
+class _Buffer:
+    # csv.writer wants a file; this one just hands each line back
+    def write(self, value):
+        return value
+
+
+def export_rows(name, chunk_size=2000):
+    model, columns = EXPORTS[name]
+    paths = [path for _, path in columns]
+    return model.objects.order_by('pk').values_list(*paths).iterator(chunk_size=chunk_size)
+
+
+def stream_export(name, fmt, chunk_size=2000):
+    """Yield the export `name` as `fmt` text, one string per chunk of rows."""
+    headers = [header for header, _ in EXPORTS[name][1]]
+    if fmt == 'csv':
+        writer = csv.writer(_Buffer())
+        encode = writer.writerow
+        yield encode(headers)
+    else:
+        encoder = DjangoJSONEncoder(separators=(',', ':'))
+        def encode(row):
+            return encoder.encode(dict(zip(headers, row))) + '\n'
+
+    chunk = []
+    for row in export_rows(name, chunk_size):
+        chunk.append(encode(row))
+        if len(chunk) >= chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
@@ -0,0 +1,34 @@
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+
+class QueryParamFilter(BaseFilterBackend):
+    """
+    Filters a view's queryset from query parameters it declares as
+    `filter_params = {'date_from': 'date_ordered__gte', ...}`. Values are
+    converted by the model field, so a malformed value is a 400 rather than
+    a database error. Lookups are plain column comparisons so they can use
+    the indexes declared on the models.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        filters = {}
+        for param, lookup in getattr(view, 'filter_params', {}).items():
+            value = request.query_params.get(param)
+            if value in (None, ''):
+                continue
+            field = self.get_field(queryset.model, lookup)
+            try:
+                filters[lookup] = field.to_python(value)
+            except DjangoValidationError as exc:
+                raise ValidationError({param: exc.messages})
+        return queryset.filter(**filters)
+
+    @staticmethod
+    def get_field(model, lookup):
+        field_name = lookup.split('__')[0]
+        try:
+            return model._meta.get_field(field_name)
+        except FieldDoesNotExist:
+            raise ValueError(f"{model.__name__}.filter_params refers to unknown field {field_name!r}")
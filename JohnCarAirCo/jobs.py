@@ -0,0 +1,182 @@
+"""
+Background jobs stored in the Job table.
+
+Work that can outlast a proxy timeout (exports, rebuilds, reconciliation,
+large bulk imports) is queued with enqueue() and run by `manage.py
+run_jobs`, on a thread or process pool, without a separate broker. Task
+functions are registered with @task in JohnCarAirCo/tasks.py; each gets the
+Job and its params and returns a JSON-serializable result, and may write a
+downloadable file with result_file().
+
+A worker claims a job with a conditional UPDATE on its status, so two
+workers (or two processes) never run the same attempt. A task that raises
+is queued again after RETRY_DELAY seconds, doubled on every further
+attempt, until the job's max_attempts is used up; JobError fails it
+straight away. Jobs left Running for STALE_AFTER seconds, by a worker that
+died, are treated as a failed attempt.
+"""
+import logging
+import os
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import F
+from django.utils import timezone
+
+from JohnCarAirCo.models import Job
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'RESULTS_DIR': 'job_results',
+    'MAX_ATTEMPTS': 3,
+    'RETRY_DELAY': 30,
+    'STALE_AFTER': 3600,
+}
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = 'Queued', 'Running', 'Succeeded', 'Failed'
+
+
+class JobError(Exception):
+    """Raised by a task for a failure that retrying won't fix."""
+
+
+class Task:
+    def __init__(self, name, func, params=None, staff_only=False):
+        self.name = name
+        self.func = func
+        # Serializer class for the params of jobs created through the API;
+        # None keeps the task off the API (bulk imports are queued by their endpoint)
+        self.params = params
+        # table-wide maintenance that only staff may queue through the API
+        self.staff_only = staff_only
+
+
+TASKS = {}
+
+
+def task(name, params=None, staff_only=False):
+    def register(func):
+        TASKS[name] = Task(name, func, params, staff_only)
+        return func
+    return register
+
+
+def get_tasks():
+    # the task modules register themselves on import
+    from JohnCarAirCo import tasks  # noqa: F401
+    return TASKS
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'JOB_QUEUE', {})}
+
+
+def results_dir():
+    return Path(settings.BASE_DIR) / get_config()['RESULTS_DIR']
+
+
+def enqueue(kind, params=None, user=None, max_attempts=None):
+    if kind not in get_tasks():
+        raise ValueError(f"Unknown job kind {kind!r}")
+    return Job.objects.create(
+        kind=kind,
+        params=params or {},
+        created_by=user,
+        max_attempts=max_attempts or get_config()['MAX_ATTEMPTS'],
+    )
+
+
+def claim(worker, limit=1):
+    """Mark up to `limit` due jobs as Running for `worker`; returns their ids, oldest first."""
+    now = timezone.now()
+    due = Job.objects.filter(status=QUEUED, run_after__lte=now).order_by('run_after', 'id')
+    claimed = []
+    # a few spare candidates, in case other workers take some of them first
+    for pk in due.values_list('pk', flat=True)[:limit * 4]:
+        taken = Job.objects.filter(pk=pk, status=QUEUED).update(
+            status=RUNNING, worker=worker, started_at=now, finished_at=None, attempts=F('attempts') + 1,
+        )
+        if taken:
+            claimed.append(pk)
+            if len(claimed) == limit:
+                break
+    return claimed
+
+
+def execute(pk):
+    """Run the claimed job `pk` in this thread and record how it went."""
+    job = Job.objects.get(pk=pk)
+    task = get_tasks().get(job.kind)
+    try:
+        if task is None:
+            raise JobError(f"Unknown job kind {job.kind!r}")
+        result = task.func(job, **job.params)
+    except Exception as exc:
+        logger.warning("Job %s (%s) failed on attempt %s", job.pk, job.kind, job.attempts, exc_info=True)
+        fail(job, traceback.format_exc(), retry=not isinstance(exc, JobError))
+    else:
+        finish(job, result)
+    return job
+
+
+def run_claimed(pk):
+    # entry point on a pool thread/process: don't keep its connections open once the job is done
+    try:
+        return execute(pk).status
+    finally:
+        connections.close_all()
+
+
+def finish(job, result):
+    record(job, status=SUCCEEDED, result=result, error='', finished_at=timezone.now(),
+           result_file=job.result_file, result_content_type=job.result_content_type)
+
+
+def fail(job, error, retry=True):
+    return record(job, **failure(job, error, retry))
+
+
+def failure(job, error, retry=True):
+    now = timezone.now()
+    changes = {'status': FAILED, 'error': error, 'finished_at': now}
+    if retry and job.attempts < job.max_attempts:
+        delay = get_config()['RETRY_DELAY'] * 2 ** (job.attempts - 1)
+        changes.update(status=QUEUED, run_after=now + timedelta(seconds=delay))
+    return changes
+
+
+def record(job, **changes):
+    # only while this attempt still holds the job, which reclaim_stale() may have given up on
+    updated = Job.objects.filter(pk=job.pk, status=RUNNING, started_at=job.started_at).update(**changes)
+    for field, value in changes.items():
+        setattr(job, field, value)
+    return updated
+
+
+def reclaim_stale():
+    """Fail the current attempt of jobs whose worker stopped before finishing them; returns how many."""
+    cutoff = timezone.now() - timedelta(seconds=get_config()['STALE_AFTER'])
+    return sum(
+        fail(job, f"Worker {job.worker!r} stopped responding.")
+        for job in Job.objects.filter(status=RUNNING, started_at__lt=cutoff).order_by('id')
+    )
+
+
+@contextmanager
+def result_file(job, filename, content_type):
+    """Open `filename` for the job's downloadable result; the job points at it once the task succeeds."""
+    directory = results_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    name = f'{job.pk}-{os.path.basename(filename)}'
+    with open(directory / name, 'w', encoding='utf-8', newline='') as output:
+        yield output
+    job.result_file, job.result_content_type = name, content_type
+
+
+def result_path(job):
+    return results_dir() / job.result_file if job.result_file else None
@@ -0,0 +1,53 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from JohnCarAirCo.benchmarks import SUITES, isolated_database, regressions
+
+
+class Command(BaseCommand):
+    help = "Run a benchmark suite against a freshly seeded throwaway database and print a JSON report."
+
+    def add_arguments(self, parser):
+        parser.add_argument('suite', choices=sorted(SUITES))
+        parser.add_argument(
+            '--scale', type=int, nargs='+', default=[100000],
+            help="Number of orders to seed; with several, the suite runs once per scale, each on a new database.",
+        )
+        parser.add_argument('--repeat', type=int, default=20, help="Timed runs per measurement.")
+        parser.add_argument('--output', help="File to write the report to; defaults to stdout.")
+        parser.add_argument(
+            '--baseline',
+            help="A report saved earlier with --output to compare with; fails listing what got worse.",
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=0.5,
+            help="How much worse than the baseline latency and throughput may get, as a fraction; "
+                 "queries per request and errors may not grow at all.",
+        )
+
+    def handle(self, *args, **options):
+        reports = {}
+        for scale in options['scale']:
+            with isolated_database():
+                reports[scale] = SUITES[options['suite']]({**options, 'scale': scale})
+        report = reports[scale] if len(reports) == 1 else {'scales': reports}
+        # as it reads back from a file, so it compares like for like with a baseline
+        report = json.loads(json.dumps(report, default=str))
+
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as baseline:
+                report['regressions'] = regressions(json.load(baseline), report, options['tolerance'])
+
+        text = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                output.write(text + '\n')
+        else:
+            self.stdout.write(text)
+
+        if report.get('regressions'):
+            raise CommandError(
+                f"{len(report['regressions'])} measurements regressed against {options['baseline']}: "
+                + ', '.join(regression['metric'] for regression in report['regressions'])
+            )
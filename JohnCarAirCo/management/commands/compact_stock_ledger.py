@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from JohnCarAirCo.models import ProductUnit, StockMovement, StockSnapshot
+
+
+class Command(BaseCommand):
+    help = "Roll stock movements recorded since each product's last snapshot into a new snapshot."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            # fold everything up to a fixed point so movements inserted while we
+            # run are left for the next compaction rather than half-counted
+            cutoff = StockMovement.objects.aggregate(last=Max('id'))['last']
+            if cutoff is None:
+                self.stdout.write("No stock movements to compact.")
+                return
+
+            snapshot = StockSnapshot.objects.filter(product=OuterRef('pk')).order_by('-last_movement_id')
+            products = ProductUnit.objects.annotate(
+                snapshot_quantity=Coalesce(Subquery(snapshot.values('quantity')[:1]), 0),
+                snapshot_movement_id=Coalesce(Subquery(snapshot.values('last_movement_id')[:1]), 0),
+            )
+            pending = StockMovement.objects.filter(
+                product=OuterRef('pk'),
+                id__gt=OuterRef('snapshot_movement_id'),
+                id__lte=cutoff,
+            ).order_by().values('product')
+
+            products = products.annotate(
+                pending_quantity=Subquery(pending.annotate(total=Sum('quantity')).values('total')),
+                pending_movement_id=Subquery(pending.annotate(last=Max('id')).values('last')),
+                pending_at=Subquery(pending.annotate(last=Max('created_at')).values('last')),
+            ).filter(pending_movement_id__isnull=False)
+
+            snapshots = StockSnapshot.objects.bulk_create(
+                StockSnapshot(
+                    product_id=product.pk,
+                    quantity=product.snapshot_quantity + product.pending_quantity,
+                    last_movement_id=product.pending_movement_id,
+                    taken_at=product.pending_at,
+                )
+                for product in products
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {len(snapshots)} stock snapshots up to movement #{cutoff}."
+        ))
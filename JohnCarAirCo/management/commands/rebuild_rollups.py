@@ -0,0 +1,85 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, Sum
+
+from JohnCarAirCo.models import (
+    DailySalesOrderRollup,
+    DailySalesRollup,
+    DailyServiceOrderRollup,
+    DailyServiceRollup,
+    SalesOrderEntry,
+    ServiceOrderEntry,
+)
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily sales and service rollup tables, and their per-day order counts, from order entries."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        with transaction.atomic():
+            sales = (
+                SalesOrderEntry.objects.exclude(order__status='Cancelled')
+                .values('product_id', day=F('order__date_ordered'), type_id=F('product__unit_type_id'))
+                .annotate(units=Sum('quantity'), revenue=Sum('entry_price'), orders=Count('order_id', distinct=True))
+                .order_by()
+            )
+            DailySalesRollup.objects.all().delete()
+            written = self.write(DailySalesRollup, batch_size, (
+                DailySalesRollup(
+                    date=row['day'], product_id=row['product_id'], aircon_type_id=row['type_id'],
+                    units=row['units'], revenue=row['revenue'], order_count=row['orders'],
+                )
+                for row in sales.iterator(chunk_size=batch_size)
+            ))
+            self.stdout.write(f"daily sales rollup: {written} rows")
+            written = self.write_order_counts(DailySalesOrderRollup, SalesOrderEntry, batch_size)
+            self.stdout.write(f"daily sales order rollup: {written} rows")
+
+            services = (
+                ServiceOrderEntry.objects.exclude(order__status='Cancelled')
+                .values('service_id', day=F('order__date_ordered'))
+                .annotate(units=Sum('quantity'), revenue=Sum('entry_price'), orders=Count('order_id', distinct=True))
+                .order_by()
+            )
+            DailyServiceRollup.objects.all().delete()
+            written = self.write(DailyServiceRollup, batch_size, (
+                DailyServiceRollup(
+                    date=row['day'], service_id=row['service_id'],
+                    units=row['units'], revenue=row['revenue'], order_count=row['orders'],
+                )
+                for row in services.iterator(chunk_size=batch_size)
+            ))
+            self.stdout.write(f"daily service rollup: {written} rows")
+            written = self.write_order_counts(DailyServiceOrderRollup, ServiceOrderEntry, batch_size)
+            self.stdout.write(f"daily service order rollup: {written} rows")
+
+        self.stdout.write(self.style.SUCCESS("Rollups rebuilt."))
+
+    def write_order_counts(self, model, entry_model, batch_size):
+        days = (
+            entry_model.objects.exclude(order__status='Cancelled')
+            .values(day=F('order__date_ordered'))
+            .annotate(orders=Count('order_id', distinct=True))
+            .order_by()
+        )
+        model.objects.all().delete()
+        return self.write(model, batch_size, (
+            model(date=row['day'], order_count=row['orders'])
+            for row in days.iterator(chunk_size=batch_size)
+        ))
+
+    @staticmethod
+    def write(model, batch_size, rows):
+        written, batch = 0, []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                model.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        model.objects.bulk_create(batch)
+        return written + len(batch)
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from JohnCarAirCo.models import SalesOrder, ServiceOrder
+
+
+class Command(BaseCommand):
+    help = "Recompute every sales and service order total from the sum of its entries."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help="Only report how many orders have drifted; don't write anything.",
+        )
+
+    def handle(self, *args, **options):
+        for model in (SalesOrder, ServiceOrder):
+            label = model._meta.verbose_name_plural
+            drifted = model.objects.drifted().count()
+            if options['check']:
+                self.stdout.write(f"{label}: {drifted} drifted")
+                continue
+
+            with transaction.atomic():
+                updated = model.objects.recompute_totals()
+            self.stdout.write(self.style.SUCCESS(
+                f"{label}: recomputed {updated} totals ({drifted} had drifted)"
+            ))
@@ -0,0 +1,105 @@
+import os
+import signal
+import socket
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from JohnCarAirCo import jobs
+
+
+def init_process():
+    # a spawned worker process starts without the app registry
+    django.setup()
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (exports, reports, rebuilds, bulk imports) until stopped."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help="Jobs run at once.")
+        parser.add_argument(
+            '--pool', choices=['thread', 'process'], default='thread',
+            help="process keeps CPU-heavy jobs from sharing one interpreter lock.",
+        )
+        parser.add_argument('--poll-interval', type=float, default=2.0, help="Seconds between checks of an empty queue.")
+        parser.add_argument('--once', action='store_true', help="Exit once no job is due, instead of waiting for more.")
+        parser.add_argument(
+            '--inline', action='store_true',
+            help="Run each job in this thread, one at a time; for debugging a task.",
+        )
+
+    def handle(self, *args, **options):
+        worker = f'{socket.gethostname()}:{os.getpid()}'
+        # stop like on Ctrl-C when a process manager asks
+        previous = signal.signal(signal.SIGTERM, self.stop)
+        try:
+            if options['inline']:
+                ran = self.run_inline(worker, options)
+            else:
+                ran = self.run_pool(worker, options)
+        finally:
+            signal.signal(signal.SIGTERM, previous)
+        self.stdout.write(self.style.SUCCESS(f"Ran {ran} jobs."))
+
+    def run_inline(self, worker, options):
+        ran = 0
+        while True:
+            jobs.reclaim_stale()
+            claimed = jobs.claim(worker)
+            if not claimed:
+                if options['once']:
+                    return ran
+                time.sleep(options['poll_interval'])
+                continue
+            self.report(claimed[0], jobs.execute(claimed[0]).status)
+            ran += 1
+
+    def run_pool(self, worker, options):
+        size = max(options['workers'], 1)
+        if options['pool'] == 'process':
+            # the children open their own connections
+            connections.close_all()
+            executor = ProcessPoolExecutor(max_workers=size, initializer=init_process)
+        else:
+            executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='job')
+
+        running, ran = {}, 0
+        try:
+            while True:
+                jobs.reclaim_stale()
+                if len(running) < size:
+                    for pk in jobs.claim(worker, size - len(running)):
+                        running[executor.submit(jobs.run_claimed, pk)] = pk
+                if not running:
+                    if options['once']:
+                        return ran
+                    time.sleep(options['poll_interval'])
+                    continue
+                done, _ = wait(running, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                for future in done:
+                    pk = running.pop(future)
+                    try:
+                        status = future.result()
+                    except Exception as exc:
+                        # recording the outcome failed; reclaim_stale() gives the job another go later
+                        status = f'not recorded ({exc})'
+                    self.report(pk, status)
+                    ran += 1
+        except KeyboardInterrupt:
+            self.stdout.write(f"Stopping; waiting for {len(running)} running jobs.")
+            return ran
+        finally:
+            # jobs already started are finished; nothing new is claimed
+            executor.shutdown(wait=True)
+            connections.close_all()
+
+    def stop(self, signum, frame):
+        raise KeyboardInterrupt
+
+    def report(self, pk, status):
+        style = self.style.SUCCESS if status == jobs.SUCCEEDED else self.style.WARNING
+        self.stdout.write(style(f"job {pk}: {status}"))
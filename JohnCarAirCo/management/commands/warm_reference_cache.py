@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from JohnCarAirCo.cache import get_cache, is_shared, warm_up
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the reference cache with the default aircon type, service and product lists, "
+        "so the first requests after a deploy hit it. Needs a CACHES backend shared with the web workers."
+    )
+
+    def handle(self, *args, **options):
+        if not is_shared():
+            # the cache would be filled in this command's process and thrown away with it
+            raise CommandError(
+                f"The reference cache uses {type(get_cache()).__name__}, which each process keeps to itself; "
+                "the web processes warm their own when they start. Configure a shared CACHES backend to warm it from here."
+            )
+        warm_up()
+        self.stdout.write(self.style.SUCCESS("Reference cache warmed."))
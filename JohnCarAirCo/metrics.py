@@ -0,0 +1,307 @@
+"""
+Per-endpoint request metrics in the Prometheus text format.
+
+MetricsMiddleware records, for every request, its latency, the number and
+total time of its database queries and the size of its response, as
+histograms labelled with the route (the URL pattern's name, such as
+"salesorder-list") and method, plus a request counter that also carries
+the status code for error rates. Queries are counted by an execute_wrapper
+installed on every connection, which finds the current request's tally
+through a context variable, so queries made by async views on the ORM's
+worker thread are counted too. A streaming response's size is recorded
+once its last chunk has been sent, and its latency covers the time to the
+first byte only.
+
+Histograms keep a count per bucket rather than samples, so recording is
+a bisect and a locked increment, and the percentiles Prometheus derives
+with histogram_quantile() don't degrade under load; their precision is set
+by the bucket bounds below. Every process keeps its own numbers: with
+several worker processes, scrape each one (or sum them with a shared
+multiprocess collector).
+
+GET /metrics serves them, along with the reference cache's hit/miss
+counters and the number of background jobs per status, to staff users
+(authenticated as for the API) and to scrapers sending "Authorization:
+Bearer <token>" when METRICS['TOKEN'] is set. METRICS['PUBLIC'] opens it to
+anyone.
+"""
+import bisect
+import hmac
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db.models import Count
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.deprecation import MiddlewareMixin
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+DEFAULTS = {
+    'ENABLED': True,
+    'TOKEN': '',
+    'PUBLIC': False,
+}
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_current = ContextVar('request_metrics', default=None)
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'METRICS', {})}
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self.lock:
+            samples = list(self.samples())
+        for suffix, labels, value in samples:
+            lines.append(f'{self.name}{suffix}{format_labels(labels)} {value}')
+        return '\n'.join(lines)
+
+    def reset(self):
+        with self.lock:
+            self.values.clear()
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in sorted(self.values.items()):
+            yield '_total', zip(self.labelnames, labels), value
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, labels, value):
+        with self.lock:
+            self.values[labels] = value
+
+    def samples(self):
+        for labels, value in sorted(self.values.items()):
+            yield '', zip(self.labelnames, labels), value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames, buckets):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, labels, value):
+        # counts per bucket here; made cumulative when rendered
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(labels)
+            if state is None:
+                state = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def samples(self):
+        for labels, (counts, total) in sorted(self.values.items()):
+            names = list(zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                yield '_bucket', names + [('le', bound)], cumulative
+            yield '_sum', names, total
+            yield '_count', names, cumulative
+
+
+def format_labels(labels):
+    labels = list(labels)
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+REQUESTS = Counter('pos_http_requests', "Requests by route, method and status code.", ('route', 'method', 'status'))
+LATENCY = Histogram(
+    'pos_http_request_duration_seconds', "Time from the request reaching Django to the response (or its first byte).",
+    ('route', 'method'), LATENCY_BUCKETS,
+)
+QUERIES = Histogram('pos_http_request_db_queries', "Database queries per request.", ('route', 'method'), QUERY_BUCKETS)
+QUERY_TIME = Histogram(
+    'pos_http_request_db_duration_seconds', "Time spent in database queries per request.",
+    ('route', 'method'), LATENCY_BUCKETS,
+)
+RESPONSE_SIZE = Histogram(
+    'pos_http_response_size_bytes', "Response body size as sent, i.e. after compression.",
+    ('route', 'method'), SIZE_BUCKETS,
+)
+REQUEST_METRICS = (REQUESTS, LATENCY, QUERIES, QUERY_TIME, RESPONSE_SIZE)
+
+
+class RequestTally:
+    __slots__ = ('request', 'queries', 'query_time')
+
+    def __init__(self, request):
+        self.request = request
+        self.queries = 0
+        self.query_time = 0.0
+
+
+def current_request():
+    """The request the current thread or task is serving, if MetricsMiddleware is measuring it."""
+    tally = _current.get()
+    return tally.request if tally is not None else None
+
+
+def count_queries(execute, sql, params, many, context):
+    tally = _current.get()
+    if tally is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        tally.queries += 1
+        tally.query_time += time.perf_counter() - started
+
+
+def install(sender, connection, **kwargs):
+    # connection_created receiver
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+def route_of(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        # unresolved URLs share one label so scanners can't blow up the series count
+        return 'unmatched'
+    return match.view_name or match.route
+
+
+class MetricsMiddleware(MiddlewareMixin):
+    """Goes first in MIDDLEWARE, so the latency and size cover everything the other middleware do."""
+
+    def __init__(self, get_response):
+        if not get_config()['ENABLED']:
+            raise MiddlewareNotUsed()
+        super().__init__(get_response)
+
+    def __call__(self, request):
+        if self._is_coroutine:
+            return self.__acall__(request)
+        tally, started = RequestTally(request), time.perf_counter()
+        token = _current.set(tally)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.record(request, response, tally, started)
+
+    async def __acall__(self, request):
+        tally, started = RequestTally(request), time.perf_counter()
+        token = _current.set(tally)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.record(request, response, tally, started)
+
+    def record(self, request, response, tally, started):
+        route, method = route_of(request), request.method
+        labels = (route, method)
+        LATENCY.observe(labels, time.perf_counter() - started)
+        REQUESTS.inc((route, method, str(response.status_code)))
+        QUERIES.observe(labels, tally.queries)
+        QUERY_TIME.observe(labels, tally.query_time)
+        if response.streaming:
+            response.streaming_content = sized(response.streaming_content, labels)
+        else:
+            RESPONSE_SIZE.observe(labels, len(response.content))
+        return response
+
+
+def sized(chunks, labels):
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        yield chunk
+    RESPONSE_SIZE.observe(labels, size)
+
+
+def reference_cache_metric():
+    from JohnCarAirCo import cache as reference_cache
+
+    metric = Counter('pos_reference_cache_requests', "Reference cache lookups by model and outcome.", ('model', 'outcome'))
+    for model, outcomes in reference_cache.stats().items():
+        for outcome, count in outcomes.items():
+            metric.inc((model, outcome), count)
+    return metric
+
+
+def job_metric():
+    from JohnCarAirCo.models import Job
+
+    metric = Gauge('pos_jobs', "Background jobs by status.", ('status',))
+    counts = dict(Job.objects.order_by().values_list('status').annotate(count=Count('id')))
+    for status, _ in Job.status_choices:
+        metric.set((status,), counts.get(status, 0))
+    return metric
+
+
+def render():
+    metrics = REQUEST_METRICS + (reference_cache_metric(), job_metric())
+    return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+def reset():
+    for metric in REQUEST_METRICS:
+        metric.reset()
+
+
+def can_scrape(request):
+    config = get_config()
+    token = config['TOKEN']
+    if token and hmac.compare_digest(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'):
+        return True
+    if config['PUBLIC']:
+        return True
+    # otherwise staff only, like /slow_queries/
+    authenticators = [authenticator() for authenticator in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    try:
+        user = Request(request, authenticators=authenticators).user
+    except APIException:
+        return False
+    return bool(user and user.is_staff)
+
+
+def metrics_view(request):
+    if not can_scrape(request):
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type=CONTENT_TYPE)
@@ -0,0 +1,118 @@
+"""
+Response compression negotiated through Accept-Encoding.
+
+Like django.middleware.gzip.GZipMiddleware, but it also offers Brotli when
+the `brotli` package is installed and takes its encodings, levels and
+minimum size from settings.RESPONSE_COMPRESSION. Streaming responses (the
+exports) are compressed chunk by chunk.
+"""
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+DEFAULTS = {
+    'ENCODINGS': ['br', 'gzip'],
+    'MIN_LENGTH': 1024,
+    'GZIP_LEVEL': 6,
+    'BROTLI_QUALITY': 5,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'RESPONSE_COMPRESSION', {})}
+
+
+def available_encodings(config):
+    return [encoding for encoding in config['ENCODINGS'] if encoding == 'gzip' or (encoding == 'br' and brotli)]
+
+
+def negotiate(accept_encoding, encodings):
+    """The encoding in `encodings` (most preferred first) the client rates highest, or None."""
+    ratings = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name.strip():
+            ratings[name.strip().lower()] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in encodings:
+        quality = ratings.get(encoding, ratings.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compressor(encoding, config):
+    """An object with compress(bytes) -> bytes and flush() -> bytes for `encoding`."""
+    if encoding == 'br':
+        return BrotliCompressor(config['BROTLI_QUALITY'])
+    # wbits=31 writes the gzip container rather than raw zlib
+    return zlib.compressobj(config['GZIP_LEVEL'], zlib.DEFLATED, 31)
+
+
+class BrotliCompressor:
+    def __init__(self, quality):
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self.compressor.process(data)
+
+    def flush(self):
+        return self.compressor.finish()
+
+
+def compress_sequence(chunks, encoding, config):
+    stream = compressor(encoding, config)
+    for chunk in chunks:
+        data = stream.compress(chunk)
+        if data:
+            yield data
+    yield stream.flush()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    def process_response(self, request, response):
+        if response.has_header('Content-Encoding'):
+            return response
+        config = get_config()
+        if not response.streaming and len(response.content) < config['MIN_LENGTH']:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''), available_encodings(config))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = compress_sequence(response.streaming_content, encoding, config)
+            del response.headers['Content-Length']
+        else:
+            stream = compressor(encoding, config)
+            content = stream.compress(response.content) + stream.flush()
+            # not worth it for content that doesn't shrink
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response.headers['Content-Length'] = str(len(content))
+
+        # a strong ETag must not be shared by two different encodings
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
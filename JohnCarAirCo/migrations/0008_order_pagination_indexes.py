@@ -0,0 +1,21 @@
+# Generated by Django 4.1.7 on 2026-10-18 07:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('JohnCarAirCo', '0007_alter_serviceorder_customer_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='salesorder',
+            index=models.Index(fields=['date_ordered', 'id'], name='JohnCarAirC_date_or_5d6735_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='serviceorder',
+            index=models.Index(fields=['date_ordered', 'id'], name='JohnCarAirC_date_or_7716d6_idx'),
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 4.1.7 on 2026-10-18 07:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def snapshot_unit_stock(apps, schema_editor):
+    # the old unit_stock counters become each product's opening snapshot
+    ProductUnit = apps.get_model('JohnCarAirCo', 'ProductUnit')
+    StockSnapshot = apps.get_model('JohnCarAirCo', 'StockSnapshot')
+    StockSnapshot.objects.bulk_create(
+        StockSnapshot(product_id=pk, quantity=stock, last_movement_id=0)
+        for pk, stock in ProductUnit.objects.values_list('pk', 'unit_stock')
+    )
+
+
+def restore_unit_stock(apps, schema_editor):
+    ProductUnit = apps.get_model('JohnCarAirCo', 'ProductUnit')
+    StockSnapshot = apps.get_model('JohnCarAirCo', 'StockSnapshot')
+    StockMovement = apps.get_model('JohnCarAirCo', 'StockMovement')
+    for product in ProductUnit.objects.all():
+        snapshot = StockSnapshot.objects.filter(product=product).order_by('-last_movement_id').first()
+        last_movement_id = snapshot.last_movement_id if snapshot else 0
+        movements = StockMovement.objects.filter(product=product, id__gt=last_movement_id)
+        product.unit_stock = (snapshot.quantity if snapshot else 0) + sum(movements.values_list('quantity', flat=True))
+        product.save(update_fields=['unit_stock'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('JohnCarAirCo', '0008_order_pagination_indexes'),
+    ]
+
+    operations = [
+        # default only so the column can be re-added when this is reversed
+        migrations.AlterField(
+            model_name='productunit',
+            name='unit_stock',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField()),
+                ('last_movement_id', models.BigIntegerField(default=0)),
+                ('taken_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='JohnCarAirCo.productunit')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('Receipt', 'Receipt'), ('Sale', 'Sale'), ('Return', 'Return'), ('Adjustment', 'Adjustment')], max_length=20)),
+                ('quantity', models.IntegerField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='JohnCarAirCo.productunit')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='stocksnapshot',
+            index=models.Index(fields=['product', 'last_movement_id'], name='JohnCarAirC_product_584a21_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stocksnapshot',
+            index=models.Index(fields=['product', 'taken_at'], name='JohnCarAirC_product_193027_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['product', 'id'], name='JohnCarAirC_product_f69cde_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['product', 'created_at'], name='JohnCarAirC_product_b1abc0_idx'),
+        ),
+        migrations.RunPython(snapshot_unit_stock, restore_unit_stock),
+        migrations.RemoveField(
+            model_name='productunit',
+            name='unit_stock',
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.1.7 on 2026-10-18 07:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('JohnCarAirCo', '0009_stock_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyServiceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('units', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('order_count', models.IntegerField(default=0)),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='JohnCarAirCo.servicetype')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('units', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('order_count', models.IntegerField(default=0)),
+                ('aircon_type', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='JohnCarAirCo.aircontype')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='JohnCarAirCo.productunit')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='dailyservicerollup',
+            constraint=models.UniqueConstraint(fields=('date', 'service'), name='unique_daily_service_rollup'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailysalesrollup',
+            constraint=models.UniqueConstraint(fields=('date', 'product'), name='unique_daily_sales_rollup'),
+        ),
+    ]
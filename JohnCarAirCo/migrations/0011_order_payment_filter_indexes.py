@@ -0,0 +1,33 @@
+# Generated by Django 4.1.7 on 2026-10-18 07:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('JohnCarAirCo', '0010_daily_rollups'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='salesorder',
+            index=models.Index(fields=['status', 'date_ordered'], name='JohnCarAirC_status_ecf5fd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salesorderpayment',
+            index=models.Index(fields=['date_paid'], name='JohnCarAirC_date_pa_a72e91_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='serviceorder',
+            index=models.Index(fields=['status', 'service_date'], name='JohnCarAirC_status_fd1cfb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='serviceorder',
+            index=models.Index(fields=['technician', 'service_date'], name='JohnCarAirC_technic_ef3d35_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='serviceorderpayment',
+            index=models.Index(fields=['date_paid'], name='JohnCarAirC_date_pa_4c5400_idx'),
+        ),
+    ]
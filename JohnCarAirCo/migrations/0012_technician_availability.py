@@ -0,0 +1,119 @@
+# Generated by Django 4.1.7 on 2026-10-18 07:41
+
+import re
+from datetime import time
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# A copy of JohnCarAirCo.schedules as it was when this migration was written,
+# so later changes to the parser do not change what this migration does.
+DAY_CODES = [
+    ('Th', 3), ('Sa', 5), ('Su', 6),
+    ('M', 0), ('T', 1), ('W', 2), ('F', 4), ('S', 5),
+]
+DAY_PATTERN = re.compile('|'.join(code for code, _ in DAY_CODES), re.IGNORECASE)
+TIME = r'\d{1,2}(?::\d{2})?\s*[AP]\.?M\.?'
+WINDOW_PATTERN = re.compile(
+    rf'^\s*(?P<days>[A-Za-z]+)\s+(?P<start>{TIME})\s*(?:-|to)\s*(?P<end>{TIME})\s*$', re.IGNORECASE
+)
+
+
+class ScheduleError(ValueError):
+    pass
+
+
+def parse_schedule(text):
+    windows = []
+    for part in re.split(r'[;,]', text or ''):
+        if not part.strip():
+            continue
+        match = WINDOW_PATTERN.match(part)
+        if not match:
+            raise ScheduleError(part)
+        start, end = parse_time(match['start']), parse_time(match['end'])
+        if end <= start:
+            raise ScheduleError(part)
+        for weekday in parse_days(match['days']):
+            windows.append((weekday, start, end))
+    return windows
+
+
+def parse_days(days):
+    codes = {code.lower(): weekday for code, weekday in DAY_CODES}
+    weekdays, position = [], 0
+    for match in DAY_PATTERN.finditer(days):
+        if match.start() != position:
+            break
+        weekdays.append(codes[match.group().lower()])
+        position = match.end()
+    if position != len(days) or not weekdays:
+        raise ScheduleError(days)
+    return weekdays
+
+
+def parse_time(value):
+    value = value.upper().replace('.', '').replace(' ', '')
+    clock, meridiem = value[:-2], value[-2:]
+    hour, _, minute = clock.partition(':')
+    hour, minute = int(hour), int(minute or 0)
+    if not 1 <= hour <= 12 or minute > 59:
+        raise ScheduleError(value)
+    return time(hour % 12 + (12 if meridiem == 'PM' else 0), minute)
+
+
+def parse_tech_sched(apps, schema_editor):
+    # schedules that cannot be read keep their text and get no windows
+    TechnicianDetails = apps.get_model('JohnCarAirCo', 'TechnicianDetails')
+    TechnicianAvailability = apps.get_model('JohnCarAirCo', 'TechnicianAvailability')
+    windows = []
+    for pk, tech_sched in TechnicianDetails.objects.values_list('pk', 'tech_sched'):
+        try:
+            parsed = parse_schedule(tech_sched)
+        except ScheduleError:
+            continue
+        windows.extend(
+            TechnicianAvailability(technician_id=pk, weekday=weekday, start_time=start, end_time=end)
+            for weekday, start, end in parsed
+        )
+    TechnicianAvailability.objects.bulk_create(windows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('JohnCarAirCo', '0011_order_payment_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TechnicianAvailabilityException',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('available', models.BooleanField(default=False)),
+                ('start_time', models.TimeField(blank=True, null=True)),
+                ('end_time', models.TimeField(blank=True, null=True)),
+                ('technician', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='availability_exceptions', to='JohnCarAirCo.techniciandetails')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TechnicianAvailability',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekday', models.PositiveSmallIntegerField(choices=[(0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'), (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday')])),
+                ('start_time', models.TimeField()),
+                ('end_time', models.TimeField()),
+                ('technician', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='availability', to='JohnCarAirCo.techniciandetails')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='technicianavailabilityexception',
+            index=models.Index(fields=['date', 'technician'], name='JohnCarAirC_date_258c8c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='technicianavailability',
+            index=models.Index(fields=['weekday', 'technician'], name='JohnCarAirC_weekday_e7dd82_idx'),
+        ),
+        migrations.RunPython(parse_tech_sched, migrations.RunPython.noop),
+    ]
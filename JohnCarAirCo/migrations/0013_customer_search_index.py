@@ -0,0 +1,58 @@
+from django.db import migrations
+
+TABLE = 'JohnCarAirCo_customerdetails'
+FTS_TABLE = 'JohnCarAirCo_customerdetails_fts'
+COLUMNS = 'customer_name, customer_email, customer_contact, customer_address'
+NEW_ROW = 'new.id, new.customer_name, new.customer_email, new.customer_contact, new.customer_address'
+OLD_ROW = 'old.id, old.customer_name, old.customer_email, old.customer_contact, old.customer_address'
+
+CREATE = [
+    # external-content table: the text lives in the customer table, FTS5 keeps only the index
+    f'''CREATE VIRTUAL TABLE "{FTS_TABLE}" USING fts5(
+        {COLUMNS}, content="{TABLE}", content_rowid="id",
+        tokenize="unicode61 remove_diacritics 2", prefix="2 3"
+    )''',
+    f'''CREATE TRIGGER "{FTS_TABLE}_ai" AFTER INSERT ON "{TABLE}" BEGIN
+        INSERT INTO "{FTS_TABLE}"(rowid, {COLUMNS}) VALUES ({NEW_ROW});
+    END''',
+    f'''CREATE TRIGGER "{FTS_TABLE}_ad" AFTER DELETE ON "{TABLE}" BEGIN
+        INSERT INTO "{FTS_TABLE}"("{FTS_TABLE}", rowid, {COLUMNS}) VALUES ('delete', {OLD_ROW});
+    END''',
+    f'''CREATE TRIGGER "{FTS_TABLE}_au" AFTER UPDATE ON "{TABLE}" BEGIN
+        INSERT INTO "{FTS_TABLE}"("{FTS_TABLE}", rowid, {COLUMNS}) VALUES ('delete', {OLD_ROW});
+        INSERT INTO "{FTS_TABLE}"(rowid, {COLUMNS}) VALUES ({NEW_ROW});
+    END''',
+    # name matches outrank email/contact, which outrank the address
+    f'''INSERT INTO "{FTS_TABLE}"("{FTS_TABLE}", rank) VALUES ('rank', 'bm25(10.0, 5.0, 5.0, 1.0)')''',
+    f'''INSERT INTO "{FTS_TABLE}"("{FTS_TABLE}") VALUES ('rebuild')''',
+]
+
+DROP = [
+    f'DROP TRIGGER IF EXISTS "{FTS_TABLE}_au"',
+    f'DROP TRIGGER IF EXISTS "{FTS_TABLE}_ad"',
+    f'DROP TRIGGER IF EXISTS "{FTS_TABLE}_ai"',
+    f'DROP TABLE IF EXISTS "{FTS_TABLE}"',
+]
+
+
+# SQLite drops triggers when a migration rebuilds the customer table, so any
+# later AlterField on CustomerDetails has to run CREATE's triggers again.
+def run(statements):
+    def apply(apps, schema_editor):
+        # FTS5 is SQLite only; other backends search without an index
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return apply
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('JohnCarAirCo', '0012_technician_availability'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(CREATE), run(DROP)),
+    ]
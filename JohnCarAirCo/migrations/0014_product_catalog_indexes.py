@@ -0,0 +1,64 @@
+# Generated by Django 4.1.7 on 2026-10-18 07:45
+
+from django.db import migrations, models
+
+TABLE = 'JohnCarAirCo_productunit'
+FTS_TABLE = 'JohnCarAirCo_productunit_fts'
+
+CREATE = [
+    f'''CREATE VIRTUAL TABLE "{FTS_TABLE}" USING fts5(
+        unit_name, content="{TABLE}", content_rowid="id",
+        tokenize="unicode61 remove_diacritics 2", prefix="1 2 3"
+    )''',
+    f'''CREATE TRIGGER "{FTS_TABLE}_ai" AFTER INSERT ON "{TABLE}" BEGIN
+        INSERT INTO "{FTS_TABLE}"(rowid, unit_name) VALUES (new.id, new.unit_name);
+    END''',
+    f'''CREATE TRIGGER "{FTS_TABLE}_ad" AFTER DELETE ON "{TABLE}" BEGIN
+        INSERT INTO "{FTS_TABLE}"("{FTS_TABLE}", rowid, unit_name) VALUES ('delete', old.id, old.unit_name);
+    END''',
+    f'''CREATE TRIGGER "{FTS_TABLE}_au" AFTER UPDATE OF unit_name ON "{TABLE}" BEGIN
+        INSERT INTO "{FTS_TABLE}"("{FTS_TABLE}", rowid, unit_name) VALUES ('delete', old.id, old.unit_name);
+        INSERT INTO "{FTS_TABLE}"(rowid, unit_name) VALUES (new.id, new.unit_name);
+    END''',
+    f'''INSERT INTO "{FTS_TABLE}"("{FTS_TABLE}") VALUES ('rebuild')''',
+]
+
+DROP = [
+    f'DROP TRIGGER IF EXISTS "{FTS_TABLE}_au"',
+    f'DROP TRIGGER IF EXISTS "{FTS_TABLE}_ad"',
+    f'DROP TRIGGER IF EXISTS "{FTS_TABLE}_ai"',
+    f'DROP TABLE IF EXISTS "{FTS_TABLE}"',
+]
+
+
+# as with customers, a later table rebuild of ProductUnit on SQLite must recreate the triggers
+def run(statements):
+    def apply(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return apply
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('JohnCarAirCo', '0013_customer_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='productunit',
+            index=models.Index(fields=['unit_name', 'id'], name='JohnCarAirC_unit_na_5e8e31_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productunit',
+            index=models.Index(fields=['unit_price', 'id'], name='JohnCarAirC_unit_pr_79c6f2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productunit',
+            index=models.Index(fields=['unit_type', 'unit_price'], name='JohnCarAirC_unit_ty_4496fe_idx'),
+        ),
+        migrations.RunPython(run(CREATE), run(DROP)),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.1.7 on 2026-10-18 09:15
+
+from django.db import migrations, models
+from django.db.models import Count, F
+
+
+def count_orders(apps, schema_editor):
+    # the same counts rebuild_rollups writes, so reports have them from the start
+    for entry_name, rollup_name in (
+        ('SalesOrderEntry', 'DailySalesOrderRollup'),
+        ('ServiceOrderEntry', 'DailyServiceOrderRollup'),
+    ):
+        entries = apps.get_model('JohnCarAirCo', entry_name)
+        rollup = apps.get_model('JohnCarAirCo', rollup_name)
+        days = (
+            entries.objects.exclude(order__status='Cancelled')
+            .values(day=F('order__date_ordered'))
+            .annotate(orders=Count('order_id', distinct=True))
+            .order_by()
+        )
+        rollup.objects.bulk_create(rollup(date=row['day'], order_count=row['orders']) for row in days)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('JohnCarAirCo', '0016_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesOrderRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('order_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyServiceOrderRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('order_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(count_orders, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations
+
+FTS_TABLE = 'JohnCarAirCo_customerdetails_fts'
+
+
+def index(prefixes):
+    # the 0013 table with other prefix indexes; its triggers name the table and carry over
+    return [
+        f'DROP TABLE IF EXISTS "{FTS_TABLE}"',
+        f'''CREATE VIRTUAL TABLE "{FTS_TABLE}" USING fts5(
+            customer_name, customer_email, customer_contact, customer_address,
+            content="JohnCarAirCo_customerdetails", content_rowid="id",
+            tokenize="unicode61 remove_diacritics 2", prefix="{prefixes}"
+        )''',
+        f'''INSERT INTO "{FTS_TABLE}"("{FTS_TABLE}", rank) VALUES ('rank', 'bm25(10.0, 5.0, 5.0, 1.0)')''',
+        f'''INSERT INTO "{FTS_TABLE}"("{FTS_TABLE}") VALUES ('rebuild')''',
+    ]
+
+
+def run(statements):
+    def apply(apps, schema_editor):
+        # FTS5 is SQLite only; other backends search without an index
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return apply
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('JohnCarAirCo', '0017_daily_order_rollups'),
+    ]
+
+    # search_customers streams the newest matches of each word prefix; with an
+    # index per prefix length up to search.LONGEST_PREFIX that reads only the
+    # first page of each doclist instead of merging every token's
+    operations = [
+        migrations.RunPython(run(index('2 3 4 5 6')), run(index('2 3'))),
+    ]
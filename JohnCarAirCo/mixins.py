@@ -0,0 +1,504 @@
+import hashlib
+from functools import update_wrapper
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.db.models import Prefetch
+from django.http import Http404
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.fields import BooleanField
+from rest_framework.generics import get_object_or_404
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.response import Response
+from rest_framework.reverse import reverse
+
+from JohnCarAirCo import cache as reference_cache
+from JohnCarAirCo import jobs
+from JohnCarAirCo.serializers import JobSerializer, PreloadedPrimaryKeyRelatedField, preload
+from JohnCarAirCo.versions import table_versions
+
+
+class BulkModelMixin:
+    """
+    List-shaped POST/PATCH/DELETE for a ModelViewSet, routed by BulkRouter.
+
+    Foreign keys for the whole batch are loaded with one query per related
+    model, rows are written with bulk_create/bulk_update, and every item that
+    fails validation is reported by index while the rest are still written.
+    Responses are 201/200 when everything succeeded, 207 when only some
+    items did and 400 when none did.
+
+    A list POSTed with ?background=true (up to `bulk_job_max_items` items)
+    is queued as a bulk_import job instead and answered 202 with the job,
+    whose result carries the created count and the errors.
+    """
+    bulk_max_items = 500
+    bulk_job_max_items = 20000
+
+    def create(self, request, *args, **kwargs):
+        if isinstance(request.data, list):
+            if request.query_params.get('background') in BooleanField.TRUE_VALUES:
+                return self.bulk_create_job(request)
+            return self.bulk_create(request, *args, **kwargs)
+        return super().create(request, *args, **kwargs)
+
+    def bulk_create_job(self, request):
+        items = self.get_bulk_items(request, self.bulk_job_max_items)
+        viewset = f'{type(self).__module__}.{type(self).__qualname__}'
+        # not retried: the batches written before a failure would be written twice
+        job = jobs.enqueue('bulk_import', {'viewset': viewset, 'items': items}, user=request.user, max_attempts=1)
+        data = JobSerializer(job, context=self.get_serializer_context()).data
+        location = reverse('job-detail', args=[job.pk], request=request)
+        return Response(data, status=status.HTTP_202_ACCEPTED, headers={'Location': location})
+
+    def bulk_create(self, request, *args, **kwargs):
+        items = self.get_bulk_items(request)
+        serializers, errors = self.validate_bulk_items(items)
+        instances = self.perform_bulk_create(serializers) if serializers else []
+        return self.bulk_response(instances, errors, status.HTTP_201_CREATED)
+
+    def bulk_update(self, request, *args, **kwargs):
+        items = self.get_bulk_items(request)
+        instances = self.get_queryset().in_bulk([pk for pk in self.get_bulk_ids(items) if pk is not None])
+        serializers, errors = self.validate_bulk_items(items, instances)
+        if serializers:
+            self.perform_bulk_update(serializers)
+        return self.bulk_response([s.instance for s in serializers], errors, status.HTTP_200_OK)
+
+    def bulk_destroy(self, request, *args, **kwargs):
+        items = self.get_bulk_items(request)
+        ids = self.get_bulk_ids(items)
+        instances = self.get_queryset().in_bulk([pk for pk in ids if pk is not None])
+
+        errors = [
+            {'index': index, 'errors': {'id': ['Not found.']}}
+            for index, pk in enumerate(ids) if pk not in instances
+        ]
+        if instances:
+            self.perform_bulk_destroy(list(instances.values()))
+
+        status_code = self.bulk_status(bool(instances), errors, status.HTTP_200_OK)
+        return Response({'deleted': list(instances), 'errors': errors}, status=status_code)
+
+    def get_bulk_items(self, request, max_items=None):
+        items = request.data
+        max_items = max_items or self.bulk_max_items
+        if not isinstance(items, list):
+            raise ValidationError({'non_field_errors': ['Expected a list of items.']})
+        if len(items) > max_items:
+            raise ValidationError({'non_field_errors': [f'At most {max_items} items per request.']})
+        return items
+
+    def get_bulk_ids(self, items):
+        # DELETE accepts bare ids as well as objects carrying an id
+        model_pk = self.get_queryset().model._meta.pk
+        ids = []
+        for item in items:
+            value = item.get('id') if isinstance(item, dict) else item
+            try:
+                ids.append(model_pk.to_python(value))
+            except (DjangoValidationError, TypeError):
+                ids.append(None)
+        return ids
+
+    def validate_bulk_items(self, items, instances=None):
+        serializer_class = self.get_serializer_class()
+        context = self.get_serializer_context()
+        context['preloaded'] = self.preload_related(serializer_class(context=context), items)
+
+        ids = self.get_bulk_ids(items) if instances is not None else [None] * len(items)
+        valid, errors = [], []
+        for index, (item, pk) in enumerate(zip(items, ids)):
+            if instances is not None and pk not in instances:
+                errors.append({'index': index, 'errors': {'id': ['Not found.']}})
+                continue
+
+            instance = instances[pk] if instances is not None else None
+            serializer = serializer_class(instance, data=item, partial=instance is not None, context=context)
+            if serializer.is_valid():
+                valid.append(serializer)
+            else:
+                errors.append({'index': index, 'errors': serializer.errors})
+        return valid, errors
+
+    def preload_related(self, serializer, items):
+        preloaded = {}
+        for field in serializer.fields.values():
+            if isinstance(field, PreloadedPrimaryKeyRelatedField) and not field.read_only:
+                values = [item.get(field.field_name) for item in items if isinstance(item, dict)]
+                preloaded[field.queryset.model] = preload(field.queryset, values)
+        return preloaded
+
+    def perform_bulk_create(self, serializers):
+        model = self.get_queryset().model
+        return model.objects.bulk_create([model(**s.validated_data) for s in serializers])
+
+    def perform_bulk_update(self, serializers):
+        fields = set()
+        for serializer in serializers:
+            fields.update(self.apply_validated_data(serializer))
+        if fields:
+            self.get_queryset().model.objects.bulk_update([s.instance for s in serializers], fields)
+
+    def perform_bulk_destroy(self, instances):
+        self.get_queryset().model.objects.filter(pk__in=[i.pk for i in instances]).delete()
+
+    @staticmethod
+    def apply_validated_data(serializer):
+        for attr, value in serializer.validated_data.items():
+            setattr(serializer.instance, attr, value)
+        return serializer.validated_data.keys()
+
+    def bulk_response(self, instances, errors, success_status):
+        data = self.get_serializer(instances, many=True).data
+        status_code = self.bulk_status(bool(instances), errors, success_status)
+        return Response({'results': data, 'errors': errors}, status=status_code)
+
+    @staticmethod
+    def bulk_status(written, errors, success_status):
+        if not errors:
+            return success_status
+        return status.HTTP_207_MULTI_STATUS if written else status.HTTP_400_BAD_REQUEST
+
+
+class CachedListMixin:
+    """
+    Serves list responses of a reference-data viewset from the reference
+    cache, dropped whenever the model changes (or anything else in
+    `cache_scopes` does). Behind ConditionalGetMixin they are keyed by the
+    ETag, so by the table versions read from the database on every
+    request: a write made in another process is a new key even where this
+    process never saw the invalidation. Otherwise they are keyed by host
+    and full query string.
+    """
+    cache_scopes = ('rows',)
+
+    def list(self, request, *args, **kwargs):
+        validators = getattr(self, 'validators', None)
+        name = f'list:{validators[0]}' if validators else f'list:{request.get_host()}{request.get_full_path()}'
+        data = reference_cache.get_or_build(
+            self.queryset.model, name,
+            lambda: super(CachedListMixin, self).list(request, *args, **kwargs).data,
+            self.cache_scopes,
+        )
+        return Response(data)
+
+    async def alist(self, request, *args, **kwargs):
+        # a hit is a cache read; a miss renders the list synchronously, once
+        return await sync_to_async(self.list)(request, *args, **kwargs)
+
+
+class SparseFieldsViewMixin:
+    """
+    ?fields=id,status,total_price trims the payload of the read actions to
+    the named fields, and ?expand=entries embeds the serializer's expandable
+    fields next to them (see serializers.SparseFieldsSerializerMixin). The
+    queryset is cut down to match: only the columns the kept fields read are
+    selected, and joins and prefetches are kept only for relations that are
+    rendered.
+    """
+    sparse_actions = ('list', 'retrieve')
+
+    def get_sparse_fields(self):
+        """(fields or None, expand) from the query string; unknown names are a 400."""
+        if not hasattr(self, '_sparse_fields'):
+            self._sparse_fields = self.parse_sparse_fields()
+        return self._sparse_fields
+
+    def parse_sparse_fields(self):
+        params = self.request.query_params
+        if self.action not in self.sparse_actions or not ('fields' in params or 'expand' in params):
+            return None, ()
+
+        serializer_class = self.get_serializer_class()
+        names = set(serializer_class().fields)
+        fields = self.split_param(params['fields']) if 'fields' in params else None
+        expand = self.split_param(params.get('expand', ''))
+        errors = {}
+        unknown = [name for name in fields or () if name not in names]
+        if unknown:
+            errors['fields'] = [f"Unknown field {name!r}." for name in unknown]
+        unknown = [name for name in expand if name not in serializer_class.expandable_fields]
+        if unknown:
+            errors['expand'] = [f"Cannot expand {name!r}." for name in unknown]
+        if errors:
+            raise ValidationError(errors)
+        return fields, expand
+
+    @staticmethod
+    def split_param(value):
+        return [name.strip() for name in value.split(',') if name.strip()]
+
+    def get_serializer(self, *args, **kwargs):
+        fields, expand = self.get_sparse_fields()
+        if fields is not None:
+            kwargs.setdefault('fields', fields)
+            kwargs.setdefault('expand', expand)
+        return super().get_serializer(*args, **kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fields, expand = self.get_sparse_fields()
+        if fields is None:
+            return queryset
+        serializer = self.get_serializer_class()(fields=fields, expand=expand)
+        # keyset pagination reads its ordering columns off the last row
+        ordering = [name.lstrip('-') for name in getattr(self, 'pagination_ordering', ())]
+        return sparse_queryset(queryset, serializer.fields.values(), ordering)
+
+
+def sparse_queryset(queryset, fields, required=()):
+    """
+    Narrow `queryset` to what the serializer `fields` read: only() their
+    columns plus `required`, and only the select_related/prefetch_related
+    lookups of relations rendered beyond their pk. Nested rows that render
+    their parent as a string keep the parent serializer's `str_relations`.
+    Returns the queryset unchanged if some field reads something other than
+    a model field.
+    """
+    opts = queryset.model._meta
+    columns, relations = {opts.pk.name, *required}, set()
+    for field in fields:
+        name = field.source.split('.')[0]
+        try:
+            model_field = opts.get_field(name)
+        except FieldDoesNotExist:
+            return queryset
+        if not model_field.concrete:
+            relations.add(name)
+            # e.g. each entry's "order": "Order #1 - Juan Dela Cruz"
+            if renders_parent(field, model_field.field.name):
+                for relation in getattr(field.parent, 'str_relations', ()):
+                    columns.add(relation)
+                    relations.add(relation)
+            continue
+        columns.add(name)
+        if model_field.is_relation and not isinstance(field, PrimaryKeyRelatedField):
+            relations.add(name)
+
+    lookups = [
+        lookup for lookup in queryset._prefetch_related_lookups
+        if (lookup.prefetch_through if isinstance(lookup, Prefetch) else lookup).split('__')[0] in relations
+    ]
+    queryset = queryset.prefetch_related(None).prefetch_related(*lookups)
+
+    select = queryset.query.select_related
+    if isinstance(select, dict):
+        paths = [path for path in related_paths(select) if path.split('__')[0] in relations]
+        # select_related() without arguments would follow every relation
+        queryset = queryset.select_related(None)
+        if paths:
+            queryset = queryset.select_related(*paths)
+    return queryset.only(*columns)
+
+
+def renders_parent(field, parent_name):
+    """Whether the nested serializer `field` renders the row's `parent_name` relation beyond its pk."""
+    child = getattr(field, 'child', field)
+    return any(
+        nested.source.split('.')[0] == parent_name and not isinstance(nested, PrimaryKeyRelatedField)
+        for nested in child.fields.values()
+    )
+
+
+def related_paths(tree, prefix=''):
+    # {'order': {'customer': {}}} -> ['order__customer']
+    paths = []
+    for name, children in tree.items():
+        path = prefix + name
+        paths.extend(related_paths(children, path + '__') if children else [path])
+    return paths
+
+
+class PayloadReadMixin:
+    """
+    Answers list and retrieve with `payload_class` (see JohnCarAirCo.payloads),
+    which builds the serializer's JSON from values() rows, and pages with
+    KeysetPagination. Requests naming ?fields= still go through the
+    serializer.
+    """
+    payload_class = None
+
+    def use_payload(self):
+        fields, _ = self.get_sparse_fields() if hasattr(self, 'get_sparse_fields') else (None, ())
+        return fields is None
+
+    def list(self, request, *args, **kwargs):
+        if not self.use_payload():
+            return super().list(request, *args, **kwargs)
+        payload = self.payload_class()
+        rows = payload.rows(self.filter_queryset(self.get_queryset()))
+        page = self.page_rows(rows)
+        if page is None:
+            return Response(payload.build(rows))
+        orders, entries = payload.fetch(page)
+        return self.get_paginated_response(payload.assemble(self.paginator.set_page(orders), entries))
+
+    def page_rows(self, rows):
+        """
+        The unevaluated slice of `rows` for the requested page, or None when
+        the list is not paginated, so the page is read in the same query as
+        its entries; the paginator gets the order rows through set_page().
+        """
+        if self.paginator is None:
+            return None
+        return self.paginator.page_queryset(rows, self.request, view=self)
+
+    def retrieve(self, request, *args, **kwargs):
+        if not self.use_payload():
+            return super().retrieve(request, *args, **kwargs)
+        payload = self.payload_class()
+        rows = payload.rows(self.filter_queryset(self.get_queryset()))
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        row = get_object_or_404(rows, **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        self.check_object_permissions(request, row)
+        return Response(payload.build([row])[0])
+
+    async def alist(self, request, *args, **kwargs):
+        if not self.use_payload():
+            return await super().alist(request, *args, **kwargs)
+        payload = self.payload_class()
+        rows = payload.rows(self.filter_queryset(self.get_queryset()))
+        page = self.page_rows(rows)
+        if page is None:
+            return Response(await payload.abuild(rows))
+        orders, entries = await payload.afetch(page)
+        return self.get_paginated_response(payload.assemble(self.paginator.set_page(orders), entries))
+
+    async def aretrieve(self, request, *args, **kwargs):
+        if not self.use_payload():
+            return await super().aretrieve(request, *args, **kwargs)
+        payload = self.payload_class()
+        row = await self.aget_object(payload.rows(self.filter_queryset(self.get_queryset())))
+        return Response((await payload.abuild([row]))[0])
+
+
+class ConditionalResponse(Exception):
+    def __init__(self, response):
+        self.response = response
+
+
+class ConditionalGetMixin:
+    """
+    Strong ETag and Last-Modified headers on the GET actions in
+    `conditional_actions`, derived from the TableVersion rows of
+    `version_models` (default: the queryset's model) plus the URL and media
+    type. The check runs before the action, so a matching If-None-Match or
+    If-Modified-Since is answered 304 without loading or rendering rows.
+    """
+    conditional_actions = ('list', 'retrieve')
+    version_models = ()
+
+    def get_version_models(self):
+        return self.version_models or (self.queryset.model,)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.validators = None
+        if request.method not in ('GET', 'HEAD') or self.action not in self.conditional_actions:
+            return
+
+        self.validators = etag, timestamp = self.get_validators(request)
+        response = get_conditional_response(request._request, etag=etag, last_modified=timestamp)
+        if response is not None:
+            raise ConditionalResponse(response)
+
+    def get_validators(self, request):
+        """(ETag, Last-Modified timestamp or None) of the current response to `request`."""
+        token, last_modified = table_versions(self.get_version_models())
+        key = f'{token}|{request.get_host()}{request.get_full_path()}|{request.accepted_media_type}'
+        etag = quote_etag(hashlib.sha1(key.encode('utf-8')).hexdigest())
+        return etag, int(last_modified.timestamp()) if last_modified else None
+
+    def handle_exception(self, exc):
+        if isinstance(exc, ConditionalResponse):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if getattr(self, 'validators', None) and response.status_code in (200, 304):
+            etag, timestamp = self.validators
+            response['ETag'] = etag
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+        return response
+
+
+class AsyncReadMixin:
+    """
+    Serves the GET actions in `async_actions` from a native async view when
+    settings.ASYNC_READ_ENDPOINTS is on (POSProject.asgi turns it on), so
+    a request waiting on the database holds a coroutine instead of a worker
+    thread. Authentication, permissions and the conditional GET check still
+    run as one synchronous step; the rows are then loaded with the async ORM
+    by the `a<action>` handlers and rendered exactly as the sync actions
+    would. Every other method and action goes to the regular sync view.
+
+    Must come after the mixins that define their own `alist`/`aretrieve`.
+    """
+    async_actions = ('list', 'retrieve')
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        view = super().as_view(actions, **initkwargs)
+        if not getattr(settings, 'ASYNC_READ_ENDPOINTS', False) or actions.get('get') not in cls.async_actions:
+            return view
+        sync_view = sync_to_async(view)
+        read_actions = {'get': actions['get'], 'head': actions.get('head', actions['get'])}
+
+        async def async_view(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return await sync_view(request, *args, **kwargs)
+            self = cls(**initkwargs)
+            self.action_map = read_actions
+            return await self.adispatch(request, *args, **kwargs)
+
+        # keeps .cls, .actions and csrf_exempt for the router and CsrfViewMiddleware
+        return update_wrapper(async_view, view)
+
+    async def adispatch(self, request, *args, **kwargs):
+        """dispatch() awaiting the action's `a<action>` handler."""
+        self.args, self.kwargs = args, kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+        try:
+            # authentication and the version lookup query the database
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            response = await getattr(self, f'a{self.action}')(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def apaginate_queryset(self, queryset):
+        if self.paginator is None:
+            return None
+        return await self.paginator.apaginate_queryset(queryset, self.request, view=self)
+
+    async def aget_object(self, queryset=None):
+        """get_object() through the async ORM, on `queryset` if given."""
+        if queryset is None:
+            queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            obj = await queryset.aget(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except (queryset.model.DoesNotExist, TypeError, ValueError, DjangoValidationError):
+            raise Http404
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+    async def alist(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = await self.apaginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer([obj async for obj in queryset], many=True).data)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        return Response(self.get_serializer(await self.aget_object()).data)
@@ -1,7 +1,123 @@
-from django.db import models
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connections, models
+from django.db.models import Exists, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.dispatch import Signal
+from django.utils import timezone
 
 # Create your models here.
 
+# sent with product_ids after movements are written in bulk, which post_save doesn't see
+stock_changed = Signal()
+
+class InsufficientStock(Exception):
+    def __init__(self, product_id):
+        super().__init__(f"Insufficient stock for product {product_id}")
+        self.product_id = product_id
+
+class ProductUnitQuerySet(models.QuerySet):
+    """
+    Stock lives in the StockMovement ledger: current stock is the product's
+    latest StockSnapshot plus every movement recorded after it. Sales and
+    returns are plain inserts; nothing updates a hot product row.
+    """
+
+    def with_stock(self, as_of=None):
+        # annotated as unit_stock so serializers read it like the old column
+        return self.annotate(unit_stock=self.stock_expression(as_of))
+
+    @staticmethod
+    def stock_expression(as_of=None):
+        def latest_snapshot(product):
+            snapshots = StockSnapshot.objects.filter(product=product)
+            if as_of is not None:
+                snapshots = snapshots.filter(taken_at__lte=as_of)
+            return snapshots.order_by('-last_movement_id')
+
+        movements = StockMovement.objects.filter(
+            product=OuterRef('pk'),
+            id__gt=Coalesce(
+                Subquery(latest_snapshot(OuterRef(OuterRef('pk'))).values('last_movement_id')[:1]),
+                Value(0),
+            ),
+        )
+        if as_of is not None:
+            movements = movements.filter(created_at__lte=as_of)
+
+        return (
+            Coalesce(Subquery(latest_snapshot(OuterRef('pk')).values('quantity')[:1]), Value(0))
+            + Coalesce(
+                Subquery(movements.order_by().values('product').annotate(total=Sum('quantity')).values('total')),
+                Value(0),
+            )
+        )
+
+    def reserve(self, quantities, kind='Sale'):
+        """
+        Record outgoing movements for {product_id: quantity}, failing with
+        InsufficientStock if any product can't cover its quantity. Must run
+        inside transaction.atomic(): on Postgres the product rows are locked
+        so the check and the insert can't interleave; SQLite only lets one
+        writer commit, so a racing reservation fails instead of overselling.
+        """
+        if not quantities:
+            return
+        product_ids = sorted(quantities)
+        if connections[self.db].features.has_select_for_update:
+            # lock before reading the stock, in a separate statement: the
+            # subqueries of a FOR UPDATE query still see the snapshot taken
+            # before it waited for the lock, i.e. the movements of the
+            # reservation it waited on are missing
+            list(self.select_for_update().filter(pk__in=product_ids).order_by('pk').values_list('pk', flat=True))
+        available = dict(self.filter(pk__in=product_ids).with_stock().values_list('pk', 'unit_stock'))
+        for product_id in product_ids:
+            if available.get(product_id, 0) < quantities[product_id]:
+                raise InsufficientStock(product_id)
+        StockMovement.objects.bulk_create(
+            StockMovement(product_id=product_id, kind=kind, quantity=-quantities[product_id])
+            for product_id in product_ids
+        )
+        stock_changed.send(sender=ProductUnit, product_ids=product_ids)
+
+    def release(self, quantities, kind='Return'):
+        movements = StockMovement.objects.bulk_create(
+            StockMovement(product_id=product_id, kind=kind, quantity=quantity)
+            for product_id, quantity in sorted(quantities.items()) if quantity
+        )
+        if movements:
+            stock_changed.send(sender=ProductUnit, product_ids=[m.product_id for m in movements])
+
+class OrderQuerySet(models.QuerySet):
+    """
+    Total maintenance for SalesOrder and ServiceOrder. Both methods issue a
+    single UPDATE so concurrent entry writes cannot lose each other's changes.
+    """
+
+    def add_to_total(self, amount):
+        return self.update(total_price=F('total_price') + amount)
+
+    def entry_totals(self):
+        entries = self.model._meta.get_field('entries').related_model
+        return Coalesce(
+            Subquery(
+                entries.objects.filter(order=OuterRef('pk'))
+                .order_by()
+                .values('order')
+                .annotate(total=Sum('entry_price'))
+                .values('total')
+            ),
+            Value(Decimal('0')),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2),
+        )
+
+    def drifted(self):
+        return self.alias(entry_total=self.entry_totals()).exclude(total_price=F('entry_total'))
+
+    def recompute_totals(self):
+        return self.update(total_price=self.entry_totals())
+
 class AirconType(models.Model):
     type_name = models.CharField(max_length=255, null=False, primary_key=True)
 
@@ -12,11 +128,62 @@ class ProductUnit(models.Model):
     unit_name = models.CharField(max_length=255, null=False)
     unit_price = models.DecimalField(max_digits=12, decimal_places=2)
     unit_type = models.ForeignKey(AirconType, on_delete=models.SET_NULL, null=True)
-    unit_stock = models.IntegerField()
+
+    objects = ProductUnitQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # catalog sort orders, with id as the keyset tie-breaker
+            models.Index(fields=['unit_name', 'id']),
+            models.Index(fields=['unit_price', 'id']),
+            # type plus price range
+            models.Index(fields=['unit_type', 'unit_price']),
+        ]
 
     def __str__(self):
         return self.unit_name
 
+class StockMovement(models.Model):
+    kind_choices = [
+        ('Receipt', 'Receipt'),
+        ('Sale', 'Sale'),
+        ('Return', 'Return'),
+        ('Adjustment', 'Adjustment'),
+    ]
+    product = models.ForeignKey(ProductUnit, on_delete=models.CASCADE, related_name='stock_movements')
+    kind = models.CharField(max_length=20, choices=kind_choices)
+    # signed: receipts and returns add stock, sales take it away
+    quantity = models.IntegerField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'id']),
+            models.Index(fields=['product', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.quantity:+d} {self.product}"
+
+class StockSnapshot(models.Model):
+    """
+    Stock of a product once every movement up to last_movement_id is applied.
+    Written by the compact_stock_ledger command.
+    """
+    product = models.ForeignKey(ProductUnit, on_delete=models.CASCADE, related_name='stock_snapshots')
+    quantity = models.IntegerField()
+    last_movement_id = models.BigIntegerField(default=0)
+    taken_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'last_movement_id']),
+            models.Index(fields=['product', 'taken_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.product}: {self.quantity} at {self.taken_at}"
+
 class CustomerDetails(models.Model):
     customer_name = models.CharField(max_length=255)
     customer_contact = models.CharField(max_length=12)
@@ -26,15 +193,79 @@ class CustomerDetails(models.Model):
     def __str__(self):
         return self.customer_name
 
+class TechnicianDetailsQuerySet(models.QuerySet):
+    def available_on(self, day, start=None, end=None):
+        """
+        Technicians who work on `day` (covering start-end when given) and have
+        no service order booked that day, as a single query.
+        """
+        windows = TechnicianAvailability.objects.filter(technician=OuterRef('pk'), weekday=day.weekday())
+        extra = TechnicianAvailabilityException.objects.filter(technician=OuterRef('pk'), date=day, available=True)
+        if start is not None:
+            windows = windows.filter(start_time__lte=start)
+            extra = extra.filter(Q(start_time__isnull=True) | Q(start_time__lte=start))
+        if end is not None:
+            windows = windows.filter(end_time__gte=end)
+            extra = extra.filter(Q(end_time__isnull=True) | Q(end_time__gte=end))
+        day_off = TechnicianAvailabilityException.objects.filter(technician=OuterRef('pk'), date=day, available=False)
+        booked = ServiceOrder.objects.filter(technician=OuterRef('pk'), service_date=day).exclude(status='Cancelled')
+        return self.filter((Exists(windows) & ~Exists(day_off)) | Exists(extra)).exclude(Exists(booked))
+
 class TechnicianDetails(models.Model):
     tech_name = models.CharField(max_length=255)
     tech_phone = models.CharField(max_length=12)
     tech_email = models.CharField(max_length=255)
+    # free text kept for existing clients; TechnicianAvailability is derived from it
     tech_sched = models.CharField(max_length=255)
 
+    objects = TechnicianDetailsQuerySet.as_manager()
+
     def __str__(self):
         return self.tech_name
 
+class TechnicianAvailability(models.Model):
+    """A weekly window in which a technician takes jobs."""
+    weekday_choices = [
+        (0, 'Monday'),
+        (1, 'Tuesday'),
+        (2, 'Wednesday'),
+        (3, 'Thursday'),
+        (4, 'Friday'),
+        (5, 'Saturday'),
+        (6, 'Sunday'),
+    ]
+    technician = models.ForeignKey(TechnicianDetails, on_delete=models.CASCADE, related_name='availability')
+    weekday = models.PositiveSmallIntegerField(choices=weekday_choices)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['weekday', 'technician']),
+        ]
+
+    def __str__(self):
+        return f"{self.technician}: {self.get_weekday_display()} {self.start_time}-{self.end_time}"
+
+class TechnicianAvailabilityException(models.Model):
+    """
+    Overrides the weekly windows on one date: a day off when `available` is
+    False, or an extra working window (all day if no times) when True.
+    """
+    technician = models.ForeignKey(TechnicianDetails, on_delete=models.CASCADE, related_name='availability_exceptions')
+    date = models.DateField()
+    available = models.BooleanField(default=False)
+    start_time = models.TimeField(null=True, blank=True)
+    end_time = models.TimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date', 'technician']),
+        ]
+
+    def __str__(self):
+        return f"{self.technician}: {'available' if self.available else 'off'} on {self.date}"
+
 class ServiceType(models.Model):
     service_name = models.CharField(max_length=50, null=False)
     service_cost = models.DecimalField(max_digits=12, decimal_places=2)
@@ -42,12 +273,19 @@ class ServiceType(models.Model):
     def __str__(self):
         return f"{self.service_name}"
 
+class SalesOrderEntryQuerySet(models.QuerySet):
+    def stock_quantities(self):
+        rows = self.order_by().values('product_id').annotate(total=Sum('quantity'))
+        return {row['product_id']: row['total'] for row in rows}
+
 class SalesOrderEntry(models.Model):
     order = models.ForeignKey('SalesOrder', on_delete=models.CASCADE, related_name='entries')
     product = models.ForeignKey(ProductUnit, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField()
     entry_price = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 
+    objects = SalesOrderEntryQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.product} x{self.quantity}"
 
@@ -63,6 +301,16 @@ class SalesOrder(models.Model):
 
     status = models.CharField(max_length=255, choices=status_choices, default='Active')
 
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # backs keyset pagination on ('-date_ordered', '-id')
+            models.Index(fields=['date_ordered', 'id']),
+            # "active orders this week"
+            models.Index(fields=['status', 'date_ordered']),
+        ]
+
     def __str__(self):
         return f"Order #{self.id} - {self.customer}"
 
@@ -89,6 +337,17 @@ class ServiceOrder(models.Model):
     total_price = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     status = models.CharField(max_length=255, choices=status_choices, default='Active')
 
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # backs keyset pagination on ('-date_ordered', '-id')
+            models.Index(fields=['date_ordered', 'id']),
+            # "services scheduled tomorrow", overall and per technician
+            models.Index(fields=['status', 'service_date']),
+            models.Index(fields=['technician', 'service_date']),
+        ]
+
     def __str__(self):
         return f"Order #{self.id} - {self.customer}"
     
@@ -104,6 +363,11 @@ class SalesOrderPayment(models.Model):
 
     is_cash = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['date_paid']),
+        ]
+
     def __str__(self):
         return f"Payment for Sales Order #{self.order.id}"
     
@@ -119,5 +383,121 @@ class ServiceOrderPayment(models.Model):
 
     is_cash = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['date_paid']),
+        ]
+
+    def __str__(self):
+        return f"Payment for Service Order #{self.order.id}"
+
+class DailySalesRollup(models.Model):
+    """
+    Per-day, per-product totals of sales entries on orders that aren't
+    cancelled. Kept current by JohnCarAirCo.rollups as entries are written;
+    rebuild_rollups recomputes it from scratch.
+    """
+    date = models.DateField()
+    product = models.ForeignKey(ProductUnit, on_delete=models.CASCADE)
+    aircon_type = models.ForeignKey(AirconType, on_delete=models.SET_NULL, null=True)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    # orders that day containing this product
+    order_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'product'], name='unique_daily_sales_rollup'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.product}: {self.units} units"
+
+class DailyServiceRollup(models.Model):
+    """Per-day, per-service totals of service entries, like DailySalesRollup."""
+    date = models.DateField()
+    service = models.ForeignKey(ServiceType, on_delete=models.CASCADE)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    order_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'service'], name='unique_daily_service_rollup'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.service}: {self.units} units"
+
+class DailySalesOrderRollup(models.Model):
+    """
+    Per-day count of the orders with entries in DailySalesRollup, each once
+    however many products it has, for order counts not broken down by product.
+    """
+    date = models.DateField(unique=True)
+    order_count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.date}: {self.order_count} sales orders"
+
+class DailyServiceOrderRollup(models.Model):
+    """Per-day count of the orders with entries in DailyServiceRollup, like DailySalesOrderRollup."""
+    date = models.DateField(unique=True)
+    order_count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.date}: {self.order_count} service orders"
+
+
+class TableVersion(models.Model):
+    """
+    Write counter per database table, bumped by each transaction that
+    wrote to it, just before it commits (see JohnCarAirCo/versions.py). Conditional GETs derive
+    their ETag and Last-Modified from these rows.
+    """
+    table_name = models.CharField(max_length=255, primary_key=True)
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.table_name} v{self.version}"
+
+
+class Job(models.Model):
+    """
+    A unit of background work (an export, a rebuild, a bulk import) run by
+    `manage.py run_jobs`; see JohnCarAirCo/jobs.py. A failed attempt is
+    queued again after a growing delay until max_attempts is used up.
+    """
+    status_choices = [
+        ('Queued', 'Queued'),
+        ('Running', 'Running'),
+        ('Succeeded', 'Succeeded'),
+        ('Failed', 'Failed'),
+    ]
+    kind = models.CharField(max_length=64)
+    params = models.JSONField(default=dict)
+    status = models.CharField(max_length=16, choices=status_choices, default='Queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    # not picked up before this; pushed back after a failed attempt
+    run_after = models.DateTimeField(default=timezone.now)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+    worker = models.CharField(max_length=255, blank=True)
+    result = models.JSONField(null=True)
+    # relative to JOB_QUEUE['RESULTS_DIR']
+    result_file = models.CharField(max_length=255, blank=True)
+    result_content_type = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            # the worker's "next due job" lookup
+            models.Index(fields=['status', 'run_after']),
+        ]
+
     def __str__(self):
-        return f"Payment for Service Order #{self.order.id}"
\ No newline at end of file
+        return f"Job #{self.id} {self.kind} ({self.status})"
@@ -0,0 +1,158 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination that seeks on the ordering columns instead of using an
+    offset, so page N costs the same as page 1 as long as the ordering is
+    backed by an index.
+
+    Viewsets pick their ordering with `pagination_ordering`, e.g.
+    ('-date_ordered', '-id'). The last column must be unique.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = ('pk',)
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self.set_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset() loading the page with the async ORM."""
+        queryset = self.page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self.set_page([row async for row in queryset])
+
+    def page_queryset(self, queryset, request, view=None):
+        """The unevaluated slice of `queryset` for the requested page, or None in legacy mode."""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        if self.use_legacy_mode(request):
+            return None
+
+        self.ordering = tuple(getattr(view, 'pagination_ordering', self.ordering))
+        self.position, self.reverse = self.decode_cursor(request)
+
+        fields = [self._split(field, self.reverse) for field in self.ordering]
+        queryset = queryset.order_by(*[('-' if desc else '') + name for name, desc in fields])
+        if self.position is not None:
+            try:
+                queryset = queryset.filter(self._seek(fields, self.position))
+            except (ValidationError, TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+        # one extra row tells whether there is a page after this one
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, rows):
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if self.reverse:
+            rows.reverse()
+
+        # a cursor means we arrived from a neighbouring page, so that side exists
+        self.has_next = self.position is not None if self.reverse else has_more
+        self.has_previous = has_more if self.reverse else self.position is not None
+        self.page = rows
+        return rows
+
+    def use_legacy_mode(self, request):
+        # clients that predate pagination never send these params; while the
+        # compatibility flag is on they keep getting the full list
+        if not getattr(settings, 'PAGINATION_LEGACY_MODE', False):
+            return False
+        params = request.query_params
+        return self.cursor_query_param not in params and self.page_size_query_param not in params
+
+    def get_page_size(self, request):
+        page_size = settings.REST_FRAMEWORK.get('PAGE_SIZE') or 10
+        try:
+            requested = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return page_size
+        return max(1, min(requested, self.max_page_size))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            position = payload['p']
+            reverse = bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        # encode_cursor only writes scalars; anything else was not made by us
+        if not all(isinstance(value, (str, int, float)) for value in position):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def encode_cursor(self, row, reverse):
+        # rows are model instances, or dicts when a view paginates values()
+        names = [field.lstrip('-') for field in self.ordering]
+        position = [row[name] if isinstance(row, dict) else getattr(row, name) for name in names]
+        payload = json.dumps({'p': position, 'r': int(reverse)}, cls=DjangoJSONEncoder)
+        encoded = base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    @staticmethod
+    def _split(field, reverse):
+        descending = field.startswith('-')
+        return field.lstrip('-'), descending != reverse
+
+    @classmethod
+    def _seek(cls, fields, position):
+        # (a, b) > (x, y) written as a >= x AND (a > x OR b > y) so the leading
+        # column can drive an index range scan
+        (name, descending), value = fields[0], position[0]
+        strict = Q(**{f"{name}__{'lt' if descending else 'gt'}": value})
+        if len(fields) == 1:
+            return strict
+        inclusive = Q(**{f"{name}__{'lte' if descending else 'gte'}": value})
+        return inclusive & (strict | cls._seek(fields[1:], position[1:]))
@@ -0,0 +1,237 @@
+"""
+Serializer-free read path for the order list/retrieve endpoints.
+
+Building a page of orders through SalesOrderSerializer costs a model
+instance and a dozen field objects per row and per entry; here the same
+JSON is built from values_list() rows, with one query joining the orders
+to their entries. The output must stay identical to the serializer's
+(JohnCarAirCo.tests.OrderPayloadTests compares the rendered bytes), so a
+field added to SalesOrderSerializer/ServiceOrderSerializer has to be added
+here too. Dates and decimals are formatted by the serializers' own fields,
+and products and services are named from the column their __str__
+returns, joined into the same query, as StringRelatedField would name
+them.
+"""
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import QuerySet
+from rest_framework.settings import ISO_8601, api_settings
+
+from JohnCarAirCo.models import SalesOrderEntry, ServiceOrderEntry
+from JohnCarAirCo.serializers import SalesOrderSerializer, ServiceOrderSerializer
+
+
+def decimal_formatter(field):
+    """
+    field.to_representation for a serializers.DecimalField, skipping its
+    quantize for values that already have the field's scale and fit its
+    precision, as the database returns them.
+    """
+    places, max_digits = field.decimal_places, field.max_digits
+    if not getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING) or field.localize:
+        return field.to_representation
+
+    def render(value):
+        if type(value) is Decimal:
+            text = f'{value:f}'
+            whole, _, fraction = text.partition('.')
+            if len(fraction) == places and len(whole.lstrip('-')) + places <= max_digits:
+                return text
+        return field.to_representation(value)
+    return render
+
+
+def date_formatter(field):
+    """field.to_representation for a serializers.DateField with the ISO format, without its per-call checks."""
+    output_format = getattr(field, 'format', api_settings.DATE_FORMAT)
+    if not isinstance(output_format, str) or output_format.lower() != ISO_8601:
+        return field.to_representation
+
+    def render(value):
+        if isinstance(value, datetime.date) and not isinstance(value, datetime.datetime):
+            return value.isoformat()
+        return field.to_representation(value)
+    return render
+
+
+class OrderPayload:
+    serializer_class = None
+    entry_model = None
+    # the entry column holding the product/service it points at, and the
+    # lookup of the column that product/service's __str__ returns
+    item_column = None
+    item_name_column = None
+    # order columns, 'id' first
+    columns = ()
+
+    def __init__(self):
+        self.fields = self.serializer_class().fields
+        self.entry_fields = self.fields['entries'].child.fields
+
+    def rows(self, queryset):
+        """`queryset` (of orders) as the values() rows build() takes."""
+        return queryset.select_related(None).prefetch_related(None).values(*self.columns)
+
+    def build(self, rows):
+        """One payload dict per order row, in the serializer's field order."""
+        return self.assemble(*self.fetch(rows))
+
+    def fetch(self, rows):
+        """
+        (order rows, entry rows) for `rows`: a list of rows, or an
+        unevaluated rows() queryset (a page of one may be sliced), which is
+        read with a single query joining each order to its entries.
+        """
+        if isinstance(rows, QuerySet):
+            return self.split(self.joined(rows))
+        loaded = list(rows)
+        if not loaded:
+            return loaded, []
+        return loaded, list(self.entries([row['id'] for row in loaded]))
+
+    async def abuild(self, rows):
+        """build() with the queries run through the async ORM."""
+        return self.assemble(*await self.afetch(rows))
+
+    async def afetch(self, rows):
+        if isinstance(rows, QuerySet):
+            return self.split([row async for row in self.joined(rows)])
+        loaded = list(rows)
+        if not loaded:
+            return loaded, []
+        return loaded, [row async for row in self.entries([row['id'] for row in loaded])]
+
+    def entries(self, order_ids):
+        return (
+            self.entry_model.objects.filter(order_id__in=order_ids).order_by('id')
+            .values_list('id', self.item_column, 'order_id', 'quantity', 'entry_price', self.item_name_column)
+        )
+
+    def joined(self, rows):
+        """
+        `rows` with their entries LEFT JOINed: one tuple per entry, the
+        order's columns followed by the entry's, in the order of `rows`
+        and then of the entries' ids. An order without entries has one
+        tuple, with Nones for the entry.
+        """
+        # ordered by the entries alone, an unordered list would come in their order
+        ordering = rows.query.order_by or ('pk',)
+        if rows.query.is_sliced:
+            # a page: its orders are picked by the slice, the entries can't be counted into it
+            rows = rows.model._base_manager.filter(pk__in=rows.values('pk')).values(*self.columns)
+        return rows.order_by(*ordering, 'entries__id').values_list(
+            *self.columns,
+            'entries__id', f'entries__{self.item_column}', 'entries__quantity', 'entries__entry_price',
+            f'entries__{self.item_name_column}',
+        )
+
+    def split(self, joined):
+        """joined() tuples back into (order rows, entry rows) as fetch() returns them."""
+        width = len(self.columns)
+        orders, entry_rows = {}, []
+        for row in joined:
+            order_id = row[0]
+            if order_id not in orders:
+                orders[order_id] = dict(zip(self.columns, row[:width]))
+            entry_id, item_id, quantity, price, item_name = row[width:]
+            if entry_id is not None:
+                entry_rows.append((entry_id, item_id, order_id, quantity, price, item_name))
+        return list(orders.values()), entry_rows
+
+    def assemble(self, rows, entry_rows):
+        titles = {row['id']: f"Order #{row['id']} - {row['customer__customer_name']}" for row in rows}
+        entry_price = decimal_formatter(self.entry_fields['entry_price'])
+        entries = defaultdict(list)
+        for entry_id, item_id, order_id, quantity, price, item_name in entry_rows:
+            # a page read one order past its size to see whether more follow
+            if order_id not in titles:
+                continue
+            entries[order_id].append(self.entry(
+                entry_id, item_name, item_id, titles[order_id], order_id, quantity, entry_price(price),
+            ))
+        return [self.order(row, entries[row['id']]) for row in rows]
+
+    def entry(self, entry_id, item_name, item_id, title, order_id, quantity, price):
+        raise NotImplementedError
+
+    def order(self, row, entries):
+        raise NotImplementedError
+
+
+class SalesOrderPayload(OrderPayload):
+    serializer_class = SalesOrderSerializer
+    entry_model = SalesOrderEntry
+    item_column = 'product_id'
+    item_name_column = 'product__unit_name'
+    columns = ('id', 'customer_id', 'customer__customer_name', 'date_ordered', 'total_price', 'status')
+
+    def __init__(self):
+        super().__init__()
+        self.date_ordered = date_formatter(self.fields['date_ordered'])
+        self.total_price = decimal_formatter(self.fields['total_price'])
+
+    def entry(self, entry_id, item_name, item_id, title, order_id, quantity, price):
+        return {
+            'id': entry_id,
+            'product': item_name,
+            'product_id': item_id,
+            'order': title,
+            'order_id': order_id,
+            'quantity': quantity,
+            'entry_price': price,
+        }
+
+    def order(self, row, entries):
+        return {
+            'id': row['id'],
+            'customer': row['customer__customer_name'],
+            'customer_id': row['customer_id'],
+            'date_ordered': self.date_ordered(row['date_ordered']),
+            'total_price': self.total_price(row['total_price']),
+            'entries': entries,
+            'status': row['status'],
+        }
+
+
+class ServiceOrderPayload(OrderPayload):
+    serializer_class = ServiceOrderSerializer
+    entry_model = ServiceOrderEntry
+    item_column = 'service_id'
+    item_name_column = 'service__service_name'
+    columns = (
+        'id', 'customer_id', 'customer__customer_name', 'date_ordered', 'status',
+        'technician_id', 'technician__tech_name', 'service_date', 'total_price',
+    )
+
+    def __init__(self):
+        super().__init__()
+        self.date_ordered = date_formatter(self.fields['date_ordered'])
+        self.service_date = date_formatter(self.fields['service_date'])
+        self.total_price = decimal_formatter(self.fields['total_price'])
+
+    def entry(self, entry_id, item_name, item_id, title, order_id, quantity, price):
+        return {
+            'id': entry_id,
+            'service': item_name,
+            'service_id': item_id,
+            'order': title,
+            'order_id': order_id,
+            'quantity': quantity,
+            'entry_price': price,
+        }
+
+    def order(self, row, entries):
+        return {
+            'id': row['id'],
+            'customer': row['customer__customer_name'],
+            'customer_id': row['customer_id'],
+            'date_ordered': self.date_ordered(row['date_ordered']),
+            'entries': entries,
+            'status': row['status'],
+            'technician': row['technician__tech_name'],
+            'technician_id': row['technician_id'],
+            'service_date': self.service_date(row['service_date']),
+            'total_price': self.total_price(row['total_price']),
+        }
@@ -0,0 +1,48 @@
+"""
+JSON rendering with orjson when it is installed.
+
+orjson writes dicts, lists, strings and numbers in C; anything else
+(Decimal, dates, timedelta, querysets, lazy strings...) goes through DRF's
+own encoder, so the output matches rest_framework.renderers.JSONRenderer
+for the compact, unicode output configured by default. The exceptions are
+NaN/Infinity floats, which orjson writes as null, and floats printed in
+exponent form. Without orjson, or when a client asks for an indented
+response, the stock renderer is used.
+"""
+from rest_framework import renderers
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    encoder = JSONEncoder()
+    # dates go through DRF's encoder too, which writes UTC as "Z"
+    options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME if orjson else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or not self.can_use_orjson(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+
+        try:
+            content = orjson.dumps(data, default=self.encoder.default, option=self.options)
+        except TypeError:
+            # e.g. integers beyond 64 bits, which the stdlib encoder still handles
+            return super().render(data, accepted_media_type, renderer_context)
+        # like the stock renderer, keep the output safe to embed in JavaScript
+        if b'\xe2\x80\xa8' in content or b'\xe2\x80\xa9' in content:
+            content = content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return content
+
+    def can_use_orjson(self, accepted_media_type, renderer_context):
+        # orjson only writes compact UTF-8
+        return (
+            self.get_indent(accepted_media_type, renderer_context or {}) is None
+            and not self.ensure_ascii
+            and self.compact
+        )
@@ -0,0 +1,127 @@
+"""
+Incremental maintenance of DailySalesRollup and DailyServiceRollup, and of
+the per-day order counts next to them (DailySalesOrderRollup and
+DailyServiceOrderRollup).
+
+Every code path that writes, moves or deletes order entries, or cancels an
+order, describes the change as signed Lines and passes them to
+record_sales/record_services inside the same transaction, after the entry
+rows themselves have been written. Entries on cancelled orders never count.
+"""
+from collections import defaultdict, namedtuple
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from JohnCarAirCo.models import (
+    DailySalesOrderRollup,
+    DailySalesRollup,
+    DailyServiceOrderRollup,
+    DailyServiceRollup,
+    SalesOrderEntry,
+    ServiceOrderEntry,
+)
+
+# sign is +1 for a line that now counts and -1 for one that no longer does
+Line = namedtuple('Line', ['date', 'order_id', 'item_id', 'type_id', 'units', 'revenue', 'sign'])
+
+
+def sales_lines(entries, sign):
+    # entries need .order and .product loaded; callers already have both
+    return [
+        Line(
+            entry.order.date_ordered, entry.order_id, entry.product_id, entry.product.unit_type_id,
+            sign * entry.quantity, sign * entry.entry_price, sign,
+        )
+        for entry in entries
+    ]
+
+
+def service_lines(entries, sign):
+    return [
+        Line(
+            entry.order.date_ordered, entry.order_id, entry.service_id, None,
+            sign * entry.quantity, sign * entry.entry_price, sign,
+        )
+        for entry in entries
+    ]
+
+
+def record_sales(lines):
+    _record(DailySalesRollup, DailySalesOrderRollup, SalesOrderEntry, 'product', lines, type_field='aircon_type')
+
+
+def record_services(lines):
+    _record(DailyServiceRollup, DailyServiceOrderRollup, ServiceOrderEntry, 'service', lines)
+
+
+def _record(rollup_model, order_rollup_model, entry_model, item_field, lines, type_field=None):
+    if not lines:
+        return
+
+    totals = defaultdict(lambda: [0, Decimal('0'), 0])
+    pair_changes = defaultdict(int)
+    pair_keys = {}
+    order_changes = defaultdict(int)
+    order_dates = {}
+    for line in lines:
+        key = (line.date, line.item_id, line.type_id)
+        totals[key][0] += line.units
+        totals[key][1] += line.revenue
+        pair = (line.order_id, line.item_id)
+        pair_changes[pair] += line.sign
+        pair_keys[pair] = key
+        order_changes[line.order_id] += line.sign
+        order_dates[line.order_id] = line.date
+
+    # an order counts once per item however many of its lines use that item,
+    # and once per day however many items it has, so compare how many lines
+    # each (order, item) and each order has now with before the change
+    current, order_lines = {}, defaultdict(int)
+    rows = (
+        entry_model.objects
+        .filter(order_id__in=order_changes)
+        .exclude(order__status='Cancelled')
+        .order_by()
+        .values_list('order_id', f'{item_field}_id')
+        .annotate(lines=Count('id'))
+    )
+    for order_id, item_id, lines in rows:
+        current[(order_id, item_id)] = lines
+        order_lines[order_id] += lines
+    for pair, change in pair_changes.items():
+        now = current.get(pair, 0)
+        totals[pair_keys[pair]][2] += int(now > 0) - int(now - change > 0)
+    day_orders = defaultdict(int)
+    for order_id, change in order_changes.items():
+        now = order_lines[order_id]
+        day_orders[order_dates[order_id]] += int(now > 0) - int(now - change > 0)
+
+    # in key order, so concurrent writers lock the rollup rows in the same order
+    # and can't deadlock on PostgreSQL
+    for (date, item_id, type_id), (units, revenue, orders) in sorted(totals.items(), key=lambda item: item[0][:2]):
+        if not (units or revenue or orders):
+            continue
+        amounts = {'units': units, 'revenue': revenue, 'order_count': orders}
+        if type_field:
+            amounts[f'{type_field}_id'] = type_id
+        _add(rollup_model, {'date': date, f'{item_field}_id': item_id}, amounts)
+
+    for date, orders in sorted(day_orders.items()):
+        if orders:
+            _add(order_rollup_model, {'date': date}, {'order_count': orders})
+
+
+def _add(rollup_model, key, amounts):
+    # amounts holds the counters to add to, plus columns set only on a new row
+    counters = ('units', 'revenue', 'order_count')
+    increments = {name: F(name) + value for name, value in amounts.items() if name in counters}
+    if rollup_model.objects.filter(**key).update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            rollup_model.objects.create(**key, **amounts)
+    except IntegrityError:
+        # another writer created the row first
+        rollup_model.objects.filter(**key).update(**increments)
@@ -0,0 +1,14 @@
+from rest_framework import routers
+
+
+class BulkRouter(routers.DefaultRouter):
+    """
+    DefaultRouter that also maps PATCH and DELETE on the list URL to
+    `bulk_update` / `bulk_destroy`. Viewsets without those actions are routed
+    exactly as before.
+    """
+    routes = [
+        route._replace(mapping={**route.mapping, 'patch': 'bulk_update', 'delete': 'bulk_destroy'})
+        if route.name == '{basename}-list' else route
+        for route in routers.DefaultRouter.routes
+    ]
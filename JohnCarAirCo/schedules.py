@@ -0,0 +1,65 @@
+"""
+Parsing of the free-text TechnicianDetails.tech_sched strings, such as
+"MW 3PM - 5PM" or "TTh 1PM - 3PM; Sa 9:30AM - 12PM", into weekly windows.
+"""
+import re
+from datetime import time
+
+# longest codes first so "Th" is not read as "T" + "h"
+DAY_CODES = [
+    ('Th', 3), ('Sa', 5), ('Su', 6),
+    ('M', 0), ('T', 1), ('W', 2), ('F', 4), ('S', 5),
+]
+DAY_PATTERN = re.compile('|'.join(code for code, _ in DAY_CODES), re.IGNORECASE)
+TIME = r'\d{1,2}(?::\d{2})?\s*[AP]\.?M\.?'
+WINDOW_PATTERN = re.compile(
+    rf'^\s*(?P<days>[A-Za-z]+)\s+(?P<start>{TIME})\s*(?:-|to)\s*(?P<end>{TIME})\s*$', re.IGNORECASE
+)
+
+
+class ScheduleError(ValueError):
+    pass
+
+
+def parse_schedule(text):
+    """
+    Return [(weekday, start_time, end_time), ...] for a schedule string, with
+    Monday as 0. Windows are separated by ";" or ",". Raises ScheduleError if
+    any part cannot be read.
+    """
+    windows = []
+    for part in re.split(r'[;,]', text or ''):
+        if not part.strip():
+            continue
+        match = WINDOW_PATTERN.match(part)
+        if not match:
+            raise ScheduleError(f"Cannot read schedule {part.strip()!r}; expected e.g. 'MW 3PM - 5PM'.")
+        start, end = parse_time(match['start']), parse_time(match['end'])
+        if end <= start:
+            raise ScheduleError(f"Schedule {part.strip()!r} ends before it starts.")
+        for weekday in parse_days(match['days']):
+            windows.append((weekday, start, end))
+    return windows
+
+
+def parse_days(days):
+    codes = {code.lower(): weekday for code, weekday in DAY_CODES}
+    weekdays, position = [], 0
+    for match in DAY_PATTERN.finditer(days):
+        if match.start() != position:
+            break
+        weekdays.append(codes[match.group().lower()])
+        position = match.end()
+    if position != len(days) or not weekdays:
+        raise ScheduleError(f"Cannot read days {days!r}; use M, T, W, Th, F, Sa, Su.")
+    return weekdays
+
+
+def parse_time(value):
+    value = value.upper().replace('.', '').replace(' ', '')
+    clock, meridiem = value[:-2], value[-2:]
+    hour, _, minute = clock.partition(':')
+    hour, minute = int(hour), int(minute or 0)
+    if not 1 <= hour <= 12 or minute > 59:
+        raise ScheduleError(f"Cannot read time {value!r}.")
+    return time(hour % 12 + (12 if meridiem == 'PM' else 0), minute)
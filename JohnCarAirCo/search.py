@@ -0,0 +1,128 @@
+"""
+Word-prefix search over customers and products.
+
+On SQLite the searched columns are indexed by FTS5 tables kept in sync by
+triggers (migrations 0013 and 0014), so inserts from bulk_create and raw
+updates are covered too. Every word of the query must match the start of a
+token in some column, and the newest matches are ranked by the columns they
+match in. Other databases fall back to case-insensitive substring matching.
+"""
+import re
+import unicodedata
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from JohnCarAirCo.models import CustomerDetails, ProductUnit
+
+# model -> (FTS5 table, indexed columns)
+FTS_INDEXES = {
+    CustomerDetails: (
+        'JohnCarAirCo_customerdetails_fts',
+        ['customer_name', 'customer_email', 'customer_contact', 'customer_address'],
+    ),
+    ProductUnit: ('JohnCarAirCo_productunit_fts', ['unit_name']),
+}
+# only the newest matches are ranked; search_customers says when some were
+# left out, and a longer query narrows them down
+MAX_CANDIDATES = 200
+# shorter words match whole customer tokens only
+MIN_PREFIX = 2
+# longest prefix index (migration 0018); longer words are looked up by their
+# first LONGEST_PREFIX letters and checked in full when ranking
+LONGEST_PREFIX = 6
+# per-column weight of a whole-token match; a prefix match counts half
+WEIGHTS = {'customer_name': 10, 'customer_email': 5, 'customer_contact': 5, 'customer_address': 1}
+
+
+def search_terms(text):
+    # the FTS5 tokenizer splits on underscores too
+    return re.findall(r'[^\W_]+', text or '')
+
+
+def match_expression(terms, min_prefix=1):
+    # quoted so FTS5 operators typed by users are taken literally; * makes each a prefix match
+    return ' '.join(f'"{term}"*' if len(term) >= min_prefix else f'"{term}"' for term in terms)
+
+
+def fold(text):
+    """`text` as the unicode61 tokenizer compares it: lower case, without diacritics."""
+    text = text.lower()
+    if text.isascii():
+        return text
+    return ''.join(char for char in unicodedata.normalize('NFKD', text) if not unicodedata.combining(char))
+
+
+def text_filter(model, text):
+    """A Q matching rows of `model` whose indexed columns match `text`; empty when it has no words."""
+    terms = search_terms(text)
+    if not terms:
+        return Q()
+    table, fields = FTS_INDEXES[model]
+    if connection.vendor != 'sqlite':
+        return Q(*[
+            Q(*[(f'{field}__icontains', term) for field in fields], _connector=Q.OR)
+            for term in terms
+        ])
+    return Q(pk__in=RawSQL(f'SELECT rowid FROM "{table}" WHERE "{table}" MATCH %s', [match_expression(terms)]))
+
+
+def score(row, patterns):
+    """Sum over the words of the best column weight each matches in `row`; None when one matches nowhere."""
+    total = 0
+    for whole, prefix in patterns:
+        best = 0
+        for weight, value in zip(WEIGHTS.values(), row):
+            if weight > best and whole.search(value):
+                best = weight
+            elif weight / 2 > best and prefix and prefix.search(value):
+                best = weight / 2
+        if not best:
+            return None
+        total += best
+    return total
+
+
+def search_customers(text, offset=0, limit=20):
+    """
+    (customers, truncated): customers matching `text`, best match first, as a
+    list, and whether matches beyond the MAX_CANDIDATES newest were left out.
+
+    Name matches rank above email and contact matches, which rank above
+    address matches; ties go to the newest customer.
+    """
+    terms = [fold(term) for term in search_terms(text)]
+    if not terms:
+        return [], False
+
+    if connection.vendor != 'sqlite':
+        queryset = CustomerDetails.objects.filter(text_filter(CustomerDetails, text))
+        return list(queryset.order_by('customer_name', 'pk')[offset:offset + limit]), False
+
+    # reading rowids newest first stops after the cap instead of scoring the
+    # whole doclist the way bm25 does; one past the cap tells whether any were left out
+    table = FTS_INDEXES[CustomerDetails][0]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM "{table}" WHERE "{table}" MATCH %s ORDER BY rowid DESC LIMIT %s',
+            [match_expression((term[:LONGEST_PREFIX] for term in terms), MIN_PREFIX), MAX_CANDIDATES + 1],
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+    truncated = len(ids) > MAX_CANDIDATES
+    candidates = CustomerDetails.objects.filter(pk__in=ids[:MAX_CANDIDATES]).values_list('pk', *WEIGHTS)
+
+    patterns = []
+    for term in terms:
+        start = r'(?<![^\W_])' + re.escape(term)
+        patterns.append((re.compile(start + r'(?![^\W_])'), re.compile(start) if len(term) >= MIN_PREFIX else None))
+    ranked = []
+    for pk, *row in candidates:
+        points = score([fold(value or '') for value in row], patterns)
+        if points is not None:
+            ranked.append((-points, -pk))
+    ranked.sort()
+
+    ids = [-pk for _, pk in ranked[offset:offset + limit]]
+    customers = CustomerDetails.objects.in_bulk(ids)
+    return [customers[pk] for pk in ids if pk in customers], truncated
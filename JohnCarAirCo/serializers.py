@@ -1,9 +1,14 @@
 from django.contrib.auth.models import User, Group
+from collections import Counter
+
 from JohnCarAirCo.models import (
+  InsufficientStock,
   AirconType,
   ProductUnit,
   CustomerDetails,
   TechnicianDetails,
+  TechnicianAvailability,
+  TechnicianAvailabilityException,
   ServiceType,
   SalesOrder,
   SalesOrderEntry,
@@ -11,11 +16,76 @@ from JohnCarAirCo.models import (
   ServiceOrderEntry,
   SalesOrderPayment,
   ServiceOrderPayment,
+  Job,
 )
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
 from rest_framework import serializers
+from rest_framework.reverse import reverse
 from rest_framework.validators import UniqueValidator
+from JohnCarAirCo import jobs
+from JohnCarAirCo.rollups import record_sales, record_services, sales_lines, service_lines
+from JohnCarAirCo.schedules import ScheduleError, parse_schedule
 from django.contrib.auth.password_validation import validate_password
 
+def preload(queryset, values):
+  """
+  Fetch every object referenced by `values` in one query, keyed by pk.
+  Values that can't be a pk are skipped and left for the field to reject.
+  """
+  pks = set()
+  for value in values:
+    try:
+      pks.add(queryset.model._meta.pk.to_python(value))
+    except (DjangoValidationError, TypeError):
+      continue
+  pks.discard(None)
+  return queryset.in_bulk(pks)
+
+def reserve_stock(quantities, field='quantity', kind='Sale'):
+  try:
+    ProductUnit.objects.reserve(quantities, kind)
+  except InsufficientStock as exc:
+    raise serializers.ValidationError({field: [f"Not enough stock for product {exc.product_id}."]})
+
+class PreloadedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+  """
+  Resolves pks against context['preloaded'][model] when the caller has
+  preloaded that model, instead of running one query per value.
+  """
+  def to_internal_value(self, data):
+    preloaded = self.context.get('preloaded', {}).get(self.queryset.model)
+    if preloaded is None:
+      return super().to_internal_value(data)
+    if isinstance(data, bool):
+      self.fail('incorrect_type', data_type=type(data).__name__)
+    try:
+      pk = self.queryset.model._meta.pk.to_python(data)
+    except (DjangoValidationError, TypeError):
+      self.fail('incorrect_type', data_type=type(data).__name__)
+    try:
+      return preloaded[pk]
+    except (KeyError, TypeError):
+      self.fail('does_not_exist', pk_value=data)
+
+class SparseFieldsSerializerMixin:
+  """
+  Serializer taking fields= (the names to keep) and expand= (which of its
+  `expandable_fields` to embed as well). Expandable fields are only left
+  out when fields= is given, so the default payload is unchanged.
+  """
+  expandable_fields = ()
+  # relations the model's __str__ reads, kept joined when expanded rows render it
+  str_relations = ()
+
+  def __init__(self, *args, fields=None, expand=(), **kwargs):
+    super().__init__(*args, **kwargs)
+    if fields is not None:
+      keep = set(fields) | set(expand)
+      for name in list(self.fields):
+        if name not in keep:
+          self.fields.pop(name)
+
 class UserSerializer(serializers.ModelSerializer):
   class Meta:
     model = User
@@ -63,11 +133,14 @@ class GroupSerializer(serializers.ModelSerializer):
 class ProductUnitSerializer(serializers.ModelSerializer):
 
   unit_type = serializers.StringRelatedField(many=False)
-  unit_type_id = serializers.PrimaryKeyRelatedField(
+  unit_type_id = PreloadedPrimaryKeyRelatedField(
     queryset=AirconType.objects.all(),
     source='unit_type',
   )
 
+  # read from ProductUnit.objects.with_stock(); writes become ledger movements
+  unit_stock = serializers.IntegerField()
+
   class Meta:
     model = ProductUnit
     fields = [
@@ -79,6 +152,30 @@ class ProductUnitSerializer(serializers.ModelSerializer):
       'unit_type_id'
     ]
 
+  def create(self, validated_data):
+    opening_stock = validated_data.pop('unit_stock')
+    with transaction.atomic():
+      instance = super().create(validated_data)
+      ProductUnit.objects.release({instance.pk: opening_stock}, kind='Receipt')
+    instance.unit_stock = opening_stock
+    return instance
+
+  def update(self, instance, validated_data):
+    stock = validated_data.pop('unit_stock', None)
+    with transaction.atomic():
+      instance = super().update(instance, validated_data)
+      current = ProductUnit.objects.with_stock().values_list('unit_stock', flat=True).get(pk=instance.pk)
+      if stock is not None and stock != current:
+        # an absolute count from a stocktake is recorded as the difference
+        ProductUnit.objects.release({instance.pk: stock - current}, kind='Adjustment')
+        current = stock
+    instance.unit_stock = current
+    return instance
+
+class StockAdjustmentSerializer(serializers.Serializer):
+  delta = serializers.IntegerField()
+  kind = serializers.ChoiceField(choices=['Receipt', 'Adjustment'], default='Adjustment')
+
 class CustomerDetailsSerializer(serializers.ModelSerializer):
   class Meta:
     model = CustomerDetails
@@ -101,6 +198,65 @@ class TechnicianDetailsSerializer(serializers.ModelSerializer):
       'tech_sched'
     ]
 
+  # parsed windows of a new or changed tech_sched; None leaves the stored ones alone
+  windows = None
+
+  def validate_tech_sched(self, value):
+    try:
+      self.windows = parse_schedule(value)
+    except ScheduleError as exc:
+      # legacy text that never parsed may be sent back unchanged with the rest of a PUT
+      if self.instance is not None and value == self.instance.tech_sched:
+        return value
+      raise serializers.ValidationError(str(exc))
+    return value
+
+  @transaction.atomic
+  def create(self, validated_data):
+    technician = super().create(validated_data)
+    if self.windows is not None:
+      self.set_availability(technician)
+    return technician
+
+  @transaction.atomic
+  def update(self, instance, validated_data):
+    technician = super().update(instance, validated_data)
+    if self.windows is not None:
+      self.set_availability(technician)
+    return technician
+
+  def set_availability(self, technician):
+    # the weekly windows always mirror tech_sched
+    TechnicianAvailability.objects.filter(technician=technician).delete()
+    TechnicianAvailability.objects.bulk_create(
+      TechnicianAvailability(technician=technician, weekday=weekday, start_time=start, end_time=end)
+      for weekday, start, end in self.windows
+    )
+
+class TechnicianAvailabilityExceptionSerializer(serializers.ModelSerializer):
+  technician_id = PreloadedPrimaryKeyRelatedField(
+    queryset=TechnicianDetails.objects.all(),
+    source='technician'
+  )
+
+  class Meta:
+    model = TechnicianAvailabilityException
+    fields = [
+      'id',
+      'technician_id',
+      'date',
+      'available',
+      'start_time',
+      'end_time'
+    ]
+
+  def validate(self, data):
+    start = data.get('start_time', getattr(self.instance, 'start_time', None))
+    end = data.get('end_time', getattr(self.instance, 'end_time', None))
+    if start is not None and end is not None and end <= start:
+      raise serializers.ValidationError({'end_time': ['Must be after start_time.']})
+    return data
+
 class ServiceTypeSerializer(serializers.ModelSerializer):
   class Meta:
     model = ServiceType
@@ -116,9 +272,9 @@ class AirconTypeSerializer(serializers.ModelSerializer):
       'type_name',
     ]
 
-class SalesOrderEntrySerializer(serializers.ModelSerializer):
+class SalesOrderEntrySerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
   product = serializers.StringRelatedField(many=False)
-  product_id = serializers.PrimaryKeyRelatedField(
+  product_id = PreloadedPrimaryKeyRelatedField(
     queryset=ProductUnit.objects.all(),
     source='product',
   )
@@ -145,28 +301,44 @@ class SalesOrderEntrySerializer(serializers.ModelSerializer):
 
   # add price to sales order total price
   def create(self, validated_data):
-    order = validated_data['order']
     validated_data['entry_price'] = validated_data['product'].unit_price * validated_data['quantity']
-    order.total_price += validated_data['entry_price']
-    order.save()
-    
-    return SalesOrderEntry.objects.create(**validated_data)
+    with transaction.atomic():
+      # cancelled orders hold no stock
+      if validated_data['order'].status != 'Cancelled':
+        reserve_stock({validated_data['product'].pk: validated_data['quantity']})
+      entry = SalesOrderEntry.objects.create(**validated_data)
+      SalesOrder.objects.filter(pk=entry.order_id).add_to_total(entry.entry_price)
+      if entry.order.status != 'Cancelled':
+        record_sales(sales_lines([entry], 1))
+    return entry
 
   def update(self, instance, validated_data):
-    order = validated_data['order']
-    order.total_price -= instance.product.unit_price * instance.quantity
-    
-    validated_data['entry_price'] = validated_data['product'].unit_price * validated_data['quantity']
-    order.total_price += validated_data['entry_price']
-    order.save()
+    old_order_id, old_price = instance.order_id, instance.entry_price
+    old_stock = {instance.product_id: instance.quantity} if instance.order.status != 'Cancelled' else {}
+    old_lines = sales_lines([instance], -1) if old_stock else []
 
+    instance.order = validated_data.get('order', instance.order)
     instance.product = validated_data.get('product', instance.product)
     instance.quantity = validated_data.get('quantity', instance.quantity)
-    instance.save()
+    instance.entry_price = instance.product.unit_price * instance.quantity
+
+    with transaction.atomic():
+      ProductUnit.objects.release(old_stock)
+      if instance.order.status != 'Cancelled':
+        reserve_stock({instance.product_id: instance.quantity})
+      instance.save(update_fields=['order', 'product', 'quantity', 'entry_price'])
+      # lower order id first, so two entries moving between the same orders can't deadlock
+      for order_id, amount in sorted([(old_order_id, -old_price), (instance.order_id, instance.entry_price)]):
+        SalesOrder.objects.filter(pk=order_id).add_to_total(amount)
+      new_lines = sales_lines([instance], 1) if instance.order.status != 'Cancelled' else []
+      record_sales(old_lines + new_lines)
     return instance
 
 
-class SalesOrderSerializer(serializers.ModelSerializer):
+class SalesOrderSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
+  expandable_fields = ('entries',)
+  str_relations = ('customer',)
+
   customer = serializers.StringRelatedField(many=False)
   customer_id = serializers.PrimaryKeyRelatedField(
     queryset=CustomerDetails.objects.all(),
@@ -190,6 +362,91 @@ class SalesOrderSerializer(serializers.ModelSerializer):
       'total_price'
     ]
 
+  def update(self, instance, validated_data):
+    status = validated_data.get('status', instance.status)
+    with transaction.atomic():
+      if (status == 'Cancelled') != (instance.status == 'Cancelled'):
+        # claim the transition first so two requests can't both release or reserve
+        claimed = SalesOrder.objects.filter(pk=instance.pk, status=instance.status).update(status=status)
+        if not claimed:
+          raise serializers.ValidationError({'status': ['Order status was changed by another request.']})
+
+        quantities = instance.entries.stock_quantities()
+        entries = instance.entries.select_related('product')
+        if status == 'Cancelled':
+          ProductUnit.objects.release(quantities)
+          record_sales(sales_lines(entries, -1))
+        else:
+          reserve_stock(quantities, 'status')
+          record_sales(sales_lines(entries, 1))
+      return super().update(instance, validated_data)
+
+class CheckoutItemSerializer(serializers.Serializer):
+  product_id = PreloadedPrimaryKeyRelatedField(
+    queryset=ProductUnit.objects.all(),
+    source='product',
+  )
+  quantity = serializers.IntegerField(min_value=1)
+
+class CheckoutPaymentSerializer(serializers.ModelSerializer):
+  class Meta:
+    model = SalesOrderPayment
+    fields = [
+      'amount_paid',
+      'is_cash',
+      'cc_number',
+      'cc_name',
+      'cc_expiry',
+      'cc_cvv',
+    ]
+
+class CheckoutSerializer(serializers.Serializer):
+  """
+  Creates a sales order with all of its entries and an optional payment in
+  one transaction. Products for every line are fetched in a single query.
+  """
+  customer_id = serializers.PrimaryKeyRelatedField(
+    queryset=CustomerDetails.objects.all(),
+    source='customer',
+  )
+  items = CheckoutItemSerializer(many=True, allow_empty=False)
+  payment = CheckoutPaymentSerializer(required=False)
+
+  def to_internal_value(self, data):
+    items = data.get('items') if hasattr(data, 'get') else None
+    if isinstance(items, list):
+      product_ids = [item.get('product_id') for item in items if isinstance(item, dict)]
+      self._context.setdefault('preloaded', {})[ProductUnit] = preload(ProductUnit.objects.all(), product_ids)
+    return super().to_internal_value(data)
+
+  def create(self, validated_data):
+    entries = [
+      SalesOrderEntry(
+        product=item['product'],
+        quantity=item['quantity'],
+        entry_price=item['product'].unit_price * item['quantity'],
+      )
+      for item in validated_data['items']
+    ]
+    quantities = Counter()
+    for entry in entries:
+      quantities[entry.product.pk] += entry.quantity
+
+    with transaction.atomic():
+      reserve_stock(quantities, 'items')
+      order = SalesOrder.objects.create(
+        customer=validated_data['customer'],
+        total_price=sum(entry.entry_price for entry in entries),
+      )
+      for entry in entries:
+        entry.order = order
+      SalesOrderEntry.objects.bulk_create(entries)
+      record_sales(sales_lines(entries, 1))
+
+      if validated_data.get('payment'):
+        SalesOrderPayment.objects.create(order=order, **validated_data['payment'])
+    return order
+
 class ServiceTypeSerializer(serializers.ModelSerializer):
   class Meta:
     model = ServiceType
@@ -199,16 +456,16 @@ class ServiceTypeSerializer(serializers.ModelSerializer):
       'service_cost'
     ]
 
-class ServiceOrderEntrySerializer(serializers.ModelSerializer):
+class ServiceOrderEntrySerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
   service = serializers.StringRelatedField(many=False)
-  service_id = serializers.PrimaryKeyRelatedField(
+  service_id = PreloadedPrimaryKeyRelatedField(
     queryset=ServiceType.objects.all(),
     source='service',
   )
 
   order = serializers.StringRelatedField(many=False)
-  order_id = serializers.PrimaryKeyRelatedField(
-    queryset=ServiceOrder.objects.all(),
+  order_id = PreloadedPrimaryKeyRelatedField(
+    queryset=ServiceOrder.objects.select_related('customer'),
     source='order',
   )
 
@@ -226,29 +483,38 @@ class ServiceOrderEntrySerializer(serializers.ModelSerializer):
       'entry_price',
     ]
 
-  # add price to sales order total price
+  # add price to service order total price
   def create(self, validated_data):
-    order = validated_data['order']
-    
     validated_data['entry_price'] = validated_data['service'].service_cost * validated_data['quantity']
-    order.total_price += validated_data['entry_price']
-    order.save()
-    return ServiceOrderEntry.objects.create(**validated_data)
-  
-  def update(self, instance, validated_data):
-    order = validated_data['order']
-    order.total_price -= instance.service.service_cost * instance.quantity
+    with transaction.atomic():
+      entry = ServiceOrderEntry.objects.create(**validated_data)
+      ServiceOrder.objects.filter(pk=entry.order_id).add_to_total(entry.entry_price)
+      if entry.order.status != 'Cancelled':
+        record_services(service_lines([entry], 1))
+    return entry
 
-    validated_data['entry_price'] = validated_data['service'].service_cost * validated_data['quantity']
-    order.total_price += validated_data['entry_price']
-    order.save()
+  def update(self, instance, validated_data):
+    old_order_id, old_price = instance.order_id, instance.entry_price
+    old_lines = service_lines([instance], -1) if instance.order.status != 'Cancelled' else []
 
+    instance.order = validated_data.get('order', instance.order)
     instance.service = validated_data.get('service', instance.service)
     instance.quantity = validated_data.get('quantity', instance.quantity)
-    instance.save()
+    instance.entry_price = instance.service.service_cost * instance.quantity
+
+    with transaction.atomic():
+      instance.save(update_fields=['order', 'service', 'quantity', 'entry_price'])
+      # lower order id first, so two entries moving between the same orders can't deadlock
+      for order_id, amount in sorted([(old_order_id, -old_price), (instance.order_id, instance.entry_price)]):
+        ServiceOrder.objects.filter(pk=order_id).add_to_total(amount)
+      new_lines = service_lines([instance], 1) if instance.order.status != 'Cancelled' else []
+      record_services(old_lines + new_lines)
     return instance
 
-class ServiceOrderSerializer(serializers.ModelSerializer):
+class ServiceOrderSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
+  expandable_fields = ('entries',)
+  str_relations = ('customer',)
+
   customer = serializers.StringRelatedField(many=False)
   customer_id = serializers.PrimaryKeyRelatedField(
     queryset=CustomerDetails.objects.all(),
@@ -282,10 +548,22 @@ class ServiceOrderSerializer(serializers.ModelSerializer):
       'total_price',
     ]
 
-class SalesOrderPaymentSerializer(serializers.ModelSerializer):
+  def update(self, instance, validated_data):
+    status = validated_data.get('status', instance.status)
+    with transaction.atomic():
+      if (status == 'Cancelled') != (instance.status == 'Cancelled'):
+        claimed = ServiceOrder.objects.filter(pk=instance.pk, status=instance.status).update(status=status)
+        if not claimed:
+          raise serializers.ValidationError({'status': ['Order status was changed by another request.']})
+        # cancelled orders drop out of the revenue rollups
+        sign = -1 if status == 'Cancelled' else 1
+        record_services(service_lines(instance.entries.all(), sign))
+      return super().update(instance, validated_data)
+
+class SalesOrderPaymentSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
   order = serializers.StringRelatedField(many=False)
-  order_id = serializers.PrimaryKeyRelatedField(
-    queryset=SalesOrder.objects.all(),
+  order_id = PreloadedPrimaryKeyRelatedField(
+    queryset=SalesOrder.objects.select_related('customer'),
     source='order',
   )
 
@@ -303,10 +581,10 @@ class SalesOrderPaymentSerializer(serializers.ModelSerializer):
       'cc_cvv',
     ]
 
-class ServiceOrderPaymentSerializer(serializers.ModelSerializer):
+class ServiceOrderPaymentSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
   order = serializers.StringRelatedField(many=False)
-  order_id = serializers.PrimaryKeyRelatedField(
-    queryset=ServiceOrder.objects.all(),
+  order_id = PreloadedPrimaryKeyRelatedField(
+    queryset=ServiceOrder.objects.select_related('customer'),
     source='order',
   )
 
@@ -322,4 +600,62 @@ class ServiceOrderPaymentSerializer(serializers.ModelSerializer):
       'cc_name',
       'cc_expiry',
       'cc_cvv',
-    ]
\ No newline at end of file
+    ]
+
+class JobSerializer(serializers.ModelSerializer):
+  """
+  A background job: POST kind and params to queue one, then poll it until
+  status is Succeeded or Failed. result_url downloads the file it wrote.
+  """
+  result_url = serializers.SerializerMethodField()
+  error = serializers.SerializerMethodField()
+
+  class Meta:
+    model = Job
+    fields = [
+      'id',
+      'kind',
+      'params',
+      'status',
+      'attempts',
+      'max_attempts',
+      'run_after',
+      'created_at',
+      'started_at',
+      'finished_at',
+      'result',
+      'result_url',
+      'error',
+    ]
+    read_only_fields = [
+      'status', 'attempts', 'max_attempts', 'run_after', 'created_at', 'started_at', 'finished_at', 'result',
+    ]
+
+  def to_representation(self, job):
+    data = super().to_representation(job)
+    if job.kind == 'bulk_import':
+      # the posted items can run to thousands; listing jobs only needs how many
+      data['params'] = {'viewset': job.params.get('viewset'), 'items': len(job.params.get('items') or [])}
+    return data
+
+  def get_result_url(self, job):
+    if not job.result_file:
+      return None
+    return reverse('job-result', args=[job.pk], request=self.context.get('request'))
+
+  def get_error(self, job):
+    # the last line of the traceback; the whole of it stays in the table and the worker's log
+    lines = job.error.strip().splitlines()
+    return lines[-1] if lines else ''
+
+  def validate(self, data):
+    tasks = {name: task for name, task in jobs.get_tasks().items() if task.params is not None}
+    task = tasks.get(data['kind'])
+    if task is None:
+      raise serializers.ValidationError({'kind': [f"Choose one of {', '.join(sorted(tasks))}."]})
+    params = task.params(data=data.get('params') or {})
+    if not params.is_valid():
+      raise serializers.ValidationError({'params': params.errors})
+    # stored as JSON, so dates and decimals go in as their API strings
+    data['params'] = params.data
+    return data
@@ -0,0 +1,237 @@
+"""
+Opt-in log of slow SQL statements, with their query plans.
+
+When SLOW_QUERY_LOG['ENABLED'] is set, an execute_wrapper on every
+connection times each statement. One that takes THRESHOLD_MS or longer is
+logged as a warning on the "JohnCarAirCo.slow_queries" logger, with:
+- the route it ran for (when MetricsMiddleware is measuring the request)
+  and the app code that issued it, e.g.
+  JohnCarAirCo.payloads.OrderPayload.fetch:89;
+- the SQL with whitespace collapsed, and its parameters. A statement that
+  mentions any of REDACT (table or column names, case-insensitively: the
+  payment tables with their cc_* card columns, users and their password
+  hashes) is logged with its literals folded, its parameters' types only
+  and the string literals of its plan folded, so no cardholder data or
+  credentials reach the log or the aggregates;
+- the driver's row count, where it reports one: PostgreSQL does for
+  SELECTs, SQLite only for writes;
+- the plan, from `EXPLAIN QUERY PLAN` on SQLite or `EXPLAIN` on PostgreSQL.
+  The plan is run on a bare driver cursor, so it is neither timed nor
+  counted nor logged itself, and never executes the statement.
+
+Statements are also grouped by fingerprint, the SQL with literals and
+parameter lists folded, so the same query with other values or another
+number of IN items is one entry. top() (and GET /slow_queries/ for staff)
+lists the entries of this process by total, maximum or count, each with
+its slowest sample. A fingerprint's plan is captured when it is first seen
+and again whenever it runs slower than before, at most once per
+EXPLAIN_INTERVAL seconds.
+"""
+import hashlib
+import logging
+import re
+import sys
+import threading
+import time
+
+from django.conf import settings
+
+from JohnCarAirCo.metrics import current_request, route_of
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    'THRESHOLD_MS': 100,
+    'EXPLAIN': True,
+    'EXPLAIN_INTERVAL': 60,
+    'MAX_FINGERPRINTS': 200,
+    'REDACT': ('payment', 'cc_', 'auth_user', 'password'),
+}
+
+EXPLAINABLE = re.compile(r'\s*(?:SELECT|INSERT|UPDATE|DELETE|WITH)\b', re.IGNORECASE)
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+PLACEHOLDER_LIST = re.compile(r'\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)')
+ROW_LIST = re.compile(r'\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+')
+WHITESPACE = re.compile(r'\s+')
+# frames in these are the instrumentation, not the code that issued the query
+SKIPPED_MODULES = ('JohnCarAirCo.slow_queries', 'JohnCarAirCo.metrics', 'JohnCarAirCo.versions', 'JohnCarAirCo.backends')
+
+_entries = {}
+_lock = threading.Lock()
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'SLOW_QUERY_LOG', {})}
+
+
+def normalize(sql):
+    return WHITESPACE.sub(' ', sql).strip()
+
+
+def fingerprint(sql):
+    shape = STRING_LITERAL.sub('?', normalize(sql))
+    shape = NUMBER_LITERAL.sub('?', shape)
+    shape = PLACEHOLDER_LIST.sub('(...)', shape)
+    return ROW_LIST.sub('(...)', shape)
+
+
+def log_slow_queries(execute, sql, params, many, context):
+    config = getattr(settings, 'SLOW_QUERY_LOG', None)
+    if not config or not config.get('ENABLED'):
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    result = execute(sql, params, many, context)
+    duration_ms = (time.perf_counter() - started) * 1000
+    if duration_ms >= get_config()['THRESHOLD_MS']:
+        record(sql, params, many, context, duration_ms)
+    return result
+
+
+def install(sender, connection, **kwargs):
+    # connection_created receiver
+    if log_slow_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(log_slow_queries)
+
+
+def record(sql, params, many, context, duration_ms):
+    config = get_config()
+    connection, cursor = context['connection'], context['cursor']
+    shape = fingerprint(sql)
+    key = hashlib.sha1(shape.encode('utf-8')).hexdigest()[:12]
+    redact = is_sensitive(sql, config['REDACT'])
+    rowcount = getattr(cursor, 'rowcount', -1)
+    sample = {
+        'duration_ms': round(duration_ms, 3),
+        'view': origin_view(),
+        'source': origin_source(),
+        'sql': shape if redact else normalize(sql),
+        'params': format_params(params, many, redact),
+        'rows': rowcount if rowcount is not None and rowcount >= 0 else None,
+        'plan': None,
+        'at': time.time(),
+    }
+
+    with _lock:
+        entry = _entries.get(key)
+        explain = config['EXPLAIN'] and not many and (
+            entry is None or (
+                duration_ms > entry['max_ms']
+                and sample['at'] - entry['explained_at'] >= config['EXPLAIN_INTERVAL']
+            )
+        )
+    if explain:
+        sample['plan'] = explain_plan(connection, sql, params)
+        if redact and sample['plan']:
+            # PostgreSQL prints the bound values into filter conditions
+            sample['plan'] = STRING_LITERAL.sub('?', sample['plan'])
+
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None:
+            if len(_entries) >= config['MAX_FINGERPRINTS']:
+                # make room by dropping the entry that has cost the least so far
+                del _entries[min(_entries, key=lambda k: _entries[k]['total_ms'])]
+            entry = _entries[key] = {
+                'fingerprint': key, 'query': shape, 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                'plan': None, 'explained_at': 0.0, 'slowest': None,
+            }
+        entry['count'] += 1
+        entry['total_ms'] += duration_ms
+        if sample['plan'] is not None:
+            entry['plan'], entry['explained_at'] = sample['plan'], sample['at']
+        if duration_ms > entry['max_ms']:
+            entry['max_ms'], entry['slowest'] = duration_ms, sample
+
+    logger.warning(
+        "Slow query %s (%.1f ms, %s rows) in %s from %s: %s %s%s",
+        key, duration_ms, 'unknown' if sample['rows'] is None else sample['rows'],
+        sample['view'] or 'no request', sample['source'] or 'unknown code', sample['sql'], sample['params'],
+        f"\nplan:\n{sample['plan']}" if sample['plan'] else '',
+        extra={'slow_query': {'fingerprint': key, **sample}},
+    )
+
+
+def origin_view():
+    request = current_request()
+    if request is None:
+        return None
+    return f'{request.method} {route_of(request)}'
+
+
+def origin_source():
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if module.startswith('JohnCarAirCo') and not module.startswith(SKIPPED_MODULES):
+            # co_qualname is new in Python 3.11; older versions only name the function
+            name = getattr(frame.f_code, 'co_qualname', frame.f_code.co_name)
+            return f'{module}.{name}:{frame.f_lineno}'
+        frame = frame.f_back
+    return None
+
+
+def is_sensitive(sql, redact):
+    sql = sql.lower()
+    return any(name.lower() in sql for name in redact)
+
+
+def format_params(params, many, redact=False):
+    if many:
+        params = list(params or ())
+        return [f'{len(params)} parameter sets']
+    values = params.values() if isinstance(params, dict) else params or ()
+    if redact:
+        return [f'<{type(value).__name__}>' for value in values]
+    return [value if isinstance(value, (int, float, bool)) or value is None else str(value)[:200] for value in values]
+
+
+def explain_plan(connection, sql, params):
+    """The plan of `sql` as text, or None when it can't be explained."""
+    if not EXPLAINABLE.match(sql):
+        return None
+    # the driver's own cursor, with the backend's placeholder handling but
+    # none of the execute_wrappers, so the EXPLAIN isn't instrumented itself
+    cursor = connection.create_cursor()
+    # a failed EXPLAIN mustn't abort the transaction the query ran in
+    in_transaction = not connection.get_autocommit()
+    try:
+        if in_transaction:
+            cursor.execute('SAVEPOINT slow_query_explain')
+        try:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params)
+            plan = '\n'.join(str(row[-1]) for row in cursor.fetchall())
+        except Exception:
+            if in_transaction:
+                cursor.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+            raise
+        finally:
+            if in_transaction:
+                cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+        return plan
+    except Exception:
+        logger.debug("Could not explain %s", sql, exc_info=True)
+        return None
+    finally:
+        cursor.close()
+
+
+def top(limit=20, order='total'):
+    """The `limit` costliest fingerprints, by 'total' time, 'max' time or 'count'."""
+    field = {'total': 'total_ms', 'max': 'max_ms', 'count': 'count'}[order]
+    with _lock:
+        entries = sorted(_entries.values(), key=lambda entry: entry[field], reverse=True)[:limit]
+        return [
+            {
+                **{name: value for name, value in entry.items() if name != 'explained_at'},
+                'total_ms': round(entry['total_ms'], 3),
+                'max_ms': round(entry['max_ms'], 3),
+            }
+            for entry in entries
+        ]
+
+
+def reset():
+    with _lock:
+        _entries.clear()
@@ -0,0 +1,118 @@
+"""
+The kinds of background job `manage.py run_jobs` knows how to run; see
+JohnCarAirCo/jobs.py. Those with a params serializer can be queued with
+POST /jobs/.
+"""
+import csv
+from io import StringIO
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management import call_command
+from django.test import RequestFactory
+from django.utils.module_loading import import_string
+from rest_framework import serializers
+from rest_framework.request import Request
+
+from JohnCarAirCo.exports import EXPORTS, FORMATS, stream_export
+from JohnCarAirCo.jobs import JobError, result_file, task
+from JohnCarAirCo.mixins import BulkModelMixin
+from JohnCarAirCo.views import SalesReportViewSet, ServiceReportViewSet
+
+REPORTS = {
+    'sales': SalesReportViewSet,
+    'services': ServiceReportViewSet,
+}
+
+
+class ExportParams(serializers.Serializer):
+    name = serializers.ChoiceField(choices=sorted(EXPORTS))
+    format = serializers.ChoiceField(choices=sorted(FORMATS), default='csv')
+
+
+@task('export', params=ExportParams)
+def export(job, name, format='csv'):
+    """The same file as GET /exports/<name>.<format>, written to disk for download."""
+    size = 0
+    with result_file(job, f'{name}.{format}', FORMATS[format]) as output:
+        for chunk in stream_export(name, format):
+            size += output.write(chunk)
+    return {'name': name, 'format': format, 'characters': size}
+
+
+class ReportParams(serializers.Serializer):
+    report = serializers.ChoiceField(choices=sorted(REPORTS))
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    group_by = serializers.CharField(required=False, allow_blank=True)
+
+    def validate(self, data):
+        REPORTS[data['report']]().get_group_columns(data)
+        return data
+
+
+@task('report', params=ReportParams)
+def report(job, report, **params):
+    """GET /reports/<report>/ with the same parameters, as a CSV file."""
+    rows = REPORTS[report]().get_rows(params)
+    with result_file(job, f'{report}-report.csv', FORMATS['csv']) as output:
+        writer = csv.DictWriter(output, fieldnames=list(rows[0]) if rows else ['units', 'revenue'])
+        writer.writeheader()
+        writer.writerows(rows)
+    return {'report': report, 'rows': len(rows)}
+
+
+class RecomputeParams(serializers.Serializer):
+    check = serializers.BooleanField(default=False)
+
+
+@task('recompute_order_totals', params=RecomputeParams, staff_only=True)
+def recompute_order_totals(job, check=False):
+    return run_command('recompute_order_totals', check=check)
+
+
+class RollupParams(serializers.Serializer):
+    batch_size = serializers.IntegerField(min_value=1, default=2000)
+
+
+@task('rebuild_rollups', params=RollupParams, staff_only=True)
+def rebuild_rollups(job, batch_size=2000):
+    return run_command('rebuild_rollups', batch_size=batch_size)
+
+
+class NoParams(serializers.Serializer):
+    pass
+
+
+@task('compact_stock_ledger', params=NoParams, staff_only=True)
+def compact_stock_ledger(job):
+    return run_command('compact_stock_ledger')
+
+
+def run_command(name, **options):
+    out = StringIO()
+    call_command(name, stdout=out, **options)
+    return {'output': out.getvalue()}
+
+
+@task('bulk_import')
+def bulk_import(job, viewset, items):
+    """
+    A list POSTed with ?background=true to a BulkModelMixin endpoint, written
+    bulk_max_items at a time. Errors are reported by index, as in the
+    synchronous response.
+    """
+    view_class = import_string(viewset)
+    if not issubclass(view_class, BulkModelMixin):
+        raise JobError(f"{viewset} does not take bulk writes.")
+    # an empty GET from whoever queued the job, for the view code that reads the request
+    request = Request(RequestFactory().get('/'))
+    request.user = job.created_by or AnonymousUser()
+    view = view_class(action='create', request=request, format_kwarg=None, args=(), kwargs={})
+
+    created, errors = 0, []
+    for start in range(0, len(items), view.bulk_max_items):
+        valid, invalid = view.validate_bulk_items(items[start:start + view.bulk_max_items])
+        if valid:
+            created += len(view.perform_bulk_create(valid))
+        errors += [{**error, 'index': error['index'] + start} for error in invalid]
+    return {'created': created, 'errors': errors}
@@ -1,3 +1,1582 @@
-from django.test import TestCase
+import asyncio
+import base64
+import datetime
+import gzip
+import json
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from decimal import Decimal
 
-# Create your tests here.
+from io import StringIO
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db.models import Sum
+from django.core.exceptions import ImproperlyConfigured
+from django.db import OperationalError, connection, transaction
+from django.utils import timezone
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from JohnCarAirCo import cache as reference_cache
+from JohnCarAirCo import jobs
+from JohnCarAirCo import metrics
+from JohnCarAirCo import search
+from JohnCarAirCo import slow_queries
+from JohnCarAirCo import versions
+from JohnCarAirCo.backends.sqlite3.base import DatabaseWrapper
+from JohnCarAirCo.benchmarks import api_urlconf, endpoint_suite, plan_kind, regressions
+from JohnCarAirCo.middleware import brotli
+from JohnCarAirCo.payloads import SalesOrderPayload, ServiceOrderPayload
+from JohnCarAirCo.renderers import FastJSONRenderer
+from JohnCarAirCo.serializers import SalesOrderSerializer, ServiceOrderSerializer
+from JohnCarAirCo.views import SalesOrderViewSet, ServiceOrderViewSet
+
+from JohnCarAirCo.models import (
+    AirconType,
+    ProductUnit,
+    CustomerDetails,
+    TechnicianDetails,
+    ServiceType,
+    SalesOrder,
+    SalesOrderEntry,
+    ServiceOrder,
+    ServiceOrderEntry,
+    SalesOrderPayment,
+    ServiceOrderPayment,
+    StockMovement,
+    TechnicianAvailability,
+    TableVersion,
+    Job,
+)
+
+
+class APITestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='cashier', password='cashier-pass')
+        cls.customer = CustomerDetails.objects.create(
+            customer_name='Juan Dela Cruz',
+            customer_contact='09170000000',
+            customer_email='juan@example.com',
+            customer_address='Cebu City',
+        )
+        cls.technician = TechnicianDetails.objects.create(
+            tech_name='Dodi Bori',
+            tech_phone='09277390988',
+            tech_email='dodibori@gmail.com',
+            tech_sched='MW 3PM - 5PM',
+        )
+        cls.aircon_type = AirconType.objects.create(type_name='Split')
+        cls.product = ProductUnit.objects.create(
+            unit_name='Split 1.5HP',
+            unit_price=Decimal('25000.00'),
+            unit_type=cls.aircon_type,
+        )
+        ProductUnit.objects.release({cls.product.pk: 100}, kind='Receipt')
+        cls.service = ServiceType.objects.create(service_name='Cleaning', service_cost=Decimal('800.00'))
+
+    def setUp(self):
+        # rolled-back rows never send the signals that would drop them from the cache
+        reference_cache.get_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_sales_orders(self, count, **kwargs):
+        orders = SalesOrder.objects.bulk_create(
+            SalesOrder(customer=self.customer, **kwargs) for _ in range(count)
+        )
+        return sorted(orders, key=lambda order: order.id)
+
+
+@override_settings(PAGINATION_LEGACY_MODE=False)
+class KeysetPaginationTests(APITestCase):
+    def test_pages_walk_every_order_newest_first(self):
+        orders = self.create_sales_orders(7)
+        # spread the orders over two dates so the seek has to use both columns
+        SalesOrder.objects.filter(id__in=[o.id for o in orders[:3]]).update(
+            date_ordered=datetime.date(2023, 1, 1)
+        )
+
+        seen = []
+        url = '/sales_orders/?page_size=3'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(row['id'] for row in response.data['results'])
+            url = response.data['next']
+
+        expected = [o.id for o in reversed(orders[3:])] + [o.id for o in reversed(orders[:3])]
+        self.assertEqual(seen, expected)
+
+    def test_previous_link_returns_the_same_page(self):
+        self.create_sales_orders(5)
+        first = self.client.get('/sales_orders/?page_size=2').data
+        second = self.client.get(first['next']).data
+        back = self.client.get(second['previous']).data
+
+        self.assertIsNone(first['previous'])
+        self.assertEqual(back['results'], first['results'])
+
+    def test_invalid_cursor_is_not_found(self):
+        response = self.client.get('/sales_orders/?cursor=bm90LWpzb24')
+        self.assertEqual(response.status_code, 404)
+
+    def test_tampered_cursor_positions_are_not_found(self):
+        self.create_sales_orders(2)
+        for position in ([None, None], [{'a': 1}, [1]], [5, 'x']):
+            cursor = base64.urlsafe_b64encode(json.dumps({'p': position}).encode()).decode()
+            response = self.client.get('/sales_orders/', {'cursor': cursor})
+            self.assertEqual(response.status_code, 404, position)
+
+    @override_settings(PAGINATION_LEGACY_MODE=True)
+    def test_legacy_mode_keeps_plain_list_for_old_clients(self):
+        self.create_sales_orders(3)
+        response = self.client.get('/sales_orders/')
+        self.assertEqual(len(response.data), 3)
+
+        response = self.client.get('/sales_orders/?page_size=2')
+        self.assertEqual(len(response.data['results']), 2)
+
+
+class QueryBudgetTests(APITestCase):
+    """
+    List endpoints must run a fixed number of queries however many rows they
+    return; each budget is checked with one row and with many. Every budget
+    includes the table-version lookup behind the ETag.
+    """
+    budgets = {
+        '/product_units/': 2,
+        '/sales_orders/': 2,
+        '/sales_order_entries/': 2,
+        '/service_orders/': 2,
+        '/service_order_entries/': 2,
+        '/sales_order_payments/': 2,
+        '/service_order_payments/': 2,
+    }
+
+    def seed(self, count):
+        for _ in range(count):
+            sales_order = SalesOrder.objects.create(customer=self.customer)
+            SalesOrderEntry.objects.create(order=sales_order, product=self.product, quantity=1)
+            SalesOrderEntry.objects.create(order=sales_order, product=self.product, quantity=2)
+            SalesOrderPayment.objects.create(order=sales_order, amount_paid=Decimal('1.00'))
+
+            service_order = ServiceOrder.objects.create(
+                customer=self.customer,
+                technician=self.technician,
+                service_date=datetime.date(2023, 4, 1),
+            )
+            ServiceOrderEntry.objects.create(order=service_order, service=self.service, quantity=1)
+            ServiceOrderPayment.objects.create(order=service_order, amount_paid=Decimal('1.00'))
+
+    def assert_budgets(self):
+        for url, budget in self.budgets.items():
+            with self.subTest(url=url), self.assertNumQueries(budget):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_budget_with_one_row(self):
+        self.seed(1)
+        self.assert_budgets()
+
+    def test_budget_with_many_rows(self):
+        self.seed(25)
+        self.assert_budgets()
+
+
+class OrderTotalTests(APITestCase):
+    def test_entry_writes_keep_total_in_step(self):
+        order = SalesOrder.objects.create(customer=self.customer)
+        created = self.client.post('/sales_order_entries/', {
+            'product_id': self.product.id, 'order_id': order.id, 'quantity': 2,
+        }).data
+        self.client.post('/sales_order_entries/', {
+            'product_id': self.product.id, 'order_id': order.id, 'quantity': 1,
+        })
+        order.refresh_from_db()
+        self.assertEqual(order.total_price, Decimal('75000.00'))
+
+        self.client.patch(f"/sales_order_entries/{created['id']}/", {'quantity': 1})
+        order.refresh_from_db()
+        self.assertEqual(order.total_price, Decimal('50000.00'))
+
+        self.client.delete(f"/sales_order_entries/{created['id']}/")
+        order.refresh_from_db()
+        self.assertEqual(order.total_price, Decimal('25000.00'))
+
+    def test_recompute_command_repairs_drift(self):
+        sales_order = SalesOrder.objects.create(customer=self.customer, total_price=Decimal('1.00'))
+        SalesOrderEntry.objects.create(
+            order=sales_order, product=self.product, quantity=2, entry_price=Decimal('50000.00'),
+        )
+        empty_order = SalesOrder.objects.create(customer=self.customer, total_price=Decimal('9.00'))
+        service_order = ServiceOrder.objects.create(customer=self.customer, service_date=datetime.date(2023, 4, 1))
+        ServiceOrderEntry.objects.create(
+            order=service_order, service=self.service, quantity=1, entry_price=Decimal('800.00'),
+        )
+
+        out = StringIO()
+        call_command('recompute_order_totals', '--check', stdout=out)
+        self.assertIn('sales orders: 2 drifted', out.getvalue())
+
+        call_command('recompute_order_totals', stdout=StringIO())
+        self.assertEqual(SalesOrder.objects.get(pk=sales_order.pk).total_price, Decimal('50000.00'))
+        self.assertEqual(SalesOrder.objects.get(pk=empty_order.pk).total_price, Decimal('0.00'))
+        self.assertEqual(ServiceOrder.objects.get(pk=service_order.pk).total_price, Decimal('800.00'))
+        self.assertFalse(SalesOrder.objects.drifted().exists())
+
+
+class CheckoutTests(APITestCase):
+    def checkout(self, items, **extra):
+        return self.client.post('/sales_orders/checkout/', {
+            'customer_id': self.customer.id, 'items': items, **extra,
+        }, format='json')
+
+    def test_checkout_creates_order_entries_and_payment(self):
+        response = self.checkout(
+            [{'product_id': self.product.id, 'quantity': 2}, {'product_id': self.product.id, 'quantity': 1}],
+            payment={'amount_paid': '75000.00', 'is_cash': True},
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['total_price'], '75000.00')
+        self.assertEqual([e['entry_price'] for e in response.data['entries']], ['50000.00', '25000.00'])
+
+        payment = SalesOrderPayment.objects.get(order_id=response.data['id'])
+        self.assertTrue(payment.is_cash)
+        self.assertFalse(SalesOrder.objects.drifted().exists())
+
+    def test_unknown_product_rejects_whole_checkout(self):
+        response = self.checkout([{'product_id': self.product.id, 'quantity': 1}, {'product_id': 999, 'quantity': 1}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('product_id', response.data['items'][1])
+        self.assertFalse(SalesOrder.objects.exists())
+
+    def test_query_count_does_not_grow_with_lines(self):
+        # one product lookup, one stock check, one movement insert and one
+        # rollup upsert cover every line, and one more upsert counts the order
+        # for the day; the first checkout of the day also creates the rollup
+        # row. Databases with row locks lock the products in a statement of
+        # their own.
+        budget = 13 + connection.features.has_select_for_update
+        self.checkout([{'product_id': self.product.id, 'quantity': 1}])
+        with self.assertNumQueries(budget):
+            self.checkout([{'product_id': self.product.id, 'quantity': 1}])
+        with self.assertNumQueries(budget):
+            self.checkout([{'product_id': self.product.id, 'quantity': 1}] * 20)
+
+
+class BulkEndpointTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.order = ServiceOrder.objects.create(customer=self.customer, service_date=datetime.date(2023, 4, 1))
+
+    def test_bulk_create_reports_bad_items_and_writes_the_rest(self):
+        response = self.client.post('/service_order_entries/', [
+            {'service_id': self.service.id, 'order_id': self.order.id, 'quantity': 2},
+            {'service_id': 999, 'order_id': self.order.id, 'quantity': 1},
+            {'service_id': self.service.id, 'order_id': self.order.id, 'quantity': 1},
+        ], format='json')
+
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(response.data['errors'][0]['index'], 1)
+        self.assertIn('service_id', response.data['errors'][0]['errors'])
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_price, Decimal('2400.00'))
+
+    def test_bulk_update_and_destroy_adjust_total_once(self):
+        entries = self.client.post('/service_order_entries/', [
+            {'service_id': self.service.id, 'order_id': self.order.id, 'quantity': 1},
+            {'service_id': self.service.id, 'order_id': self.order.id, 'quantity': 1},
+        ], format='json').data['results']
+
+        response = self.client.patch('/service_order_entries/', [
+            {'id': entries[0]['id'], 'quantity': 3},
+            {'id': 999, 'quantity': 3},
+        ], format='json')
+        self.assertEqual(response.status_code, 207)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_price, Decimal('3200.00'))
+
+        response = self.client.delete('/service_order_entries/', [entries[0]['id']], format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['deleted'], [entries[0]['id']])
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_price, Decimal('800.00'))
+        self.assertFalse(ServiceOrder.objects.drifted().exists())
+
+    def test_bulk_payment_queries_do_not_grow_with_batch(self):
+        def post(count):
+            items = [{'order_id': self.order.id, 'amount_paid': '100.00'}] * count
+            return self.client.post('/service_order_payments/', items, format='json')
+
+        with self.assertNumQueries(2):
+            self.assertEqual(post(1).status_code, 201)
+        with self.assertNumQueries(2):
+            self.assertEqual(post(20).status_code, 201)
+        self.assertEqual(ServiceOrderPayment.objects.count(), 21)
+
+
+class StockReservationTests(APITestCase):
+    def stock(self):
+        return ProductUnit.objects.with_stock().get(pk=self.product.pk).unit_stock
+
+    def test_entry_lifecycle_moves_stock(self):
+        order = SalesOrder.objects.create(customer=self.customer)
+        entry = self.client.post('/sales_order_entries/', {
+            'product_id': self.product.id, 'order_id': order.id, 'quantity': 4,
+        }).data
+        self.assertEqual(self.stock(), 96)
+
+        self.client.patch(f"/sales_order_entries/{entry['id']}/", {'quantity': 10})
+        self.assertEqual(self.stock(), 90)
+
+        self.client.patch(f'/sales_orders/{order.id}/', {'status': 'Cancelled'})
+        self.assertEqual(self.stock(), 100)
+        self.client.patch(f'/sales_orders/{order.id}/', {'status': 'Active'})
+        self.assertEqual(self.stock(), 90)
+
+        self.client.delete(f"/sales_order_entries/{entry['id']}/")
+        self.assertEqual(self.stock(), 100)
+
+    def test_insufficient_stock_fails_without_writing(self):
+        order = SalesOrder.objects.create(customer=self.customer)
+        response = self.client.post('/sales_order_entries/', {
+            'product_id': self.product.id, 'order_id': order.id, 'quantity': 101,
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('quantity', response.data)
+        self.assertEqual(self.stock(), 100)
+        self.assertFalse(SalesOrderEntry.objects.exists())
+
+    def test_adjust_stock_is_relative(self):
+        response = self.client.post(f'/product_units/{self.product.id}/adjust_stock/', {'delta': -30})
+        self.assertEqual(response.data['unit_stock'], 70)
+        response = self.client.post(f'/product_units/{self.product.id}/adjust_stock/', {'delta': -71})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.stock(), 70)
+
+
+class StockLedgerTests(APITestCase):
+    def stock(self, **params):
+        return self.client.get(f'/product_units/{self.product.id}/', params).data['unit_stock']
+
+    def test_writes_are_movements_and_put_records_the_difference(self):
+        self.client.patch(f'/product_units/{self.product.id}/', {'unit_stock': 90})
+        self.client.post(f'/product_units/{self.product.id}/adjust_stock/', {'delta': 5, 'kind': 'Receipt'})
+
+        kinds = list(self.product.stock_movements.order_by('id').values_list('kind', 'quantity'))
+        self.assertEqual(kinds, [('Receipt', 100), ('Adjustment', -10), ('Receipt', 5)])
+        self.assertEqual(self.stock(), 95)
+
+    def test_compaction_folds_movements_into_snapshots(self):
+        ProductUnit.objects.release({self.product.pk: 3}, kind='Return')
+        call_command('compact_stock_ledger', stdout=StringIO())
+        snapshot = self.product.stock_snapshots.get()
+        self.assertEqual(snapshot.quantity, 103)
+
+        # later movements stack on the snapshot, and a second run only adds one more snapshot
+        ProductUnit.objects.release({self.product.pk: -4}, kind='Adjustment')
+        self.assertEqual(self.stock(), 99)
+        call_command('compact_stock_ledger', stdout=StringIO())
+        call_command('compact_stock_ledger', stdout=StringIO())
+        self.assertEqual(list(self.product.stock_snapshots.order_by('id').values_list('quantity', flat=True)), [103, 99])
+        self.assertEqual(self.stock(), 99)
+
+    def test_stock_as_of_a_past_moment(self):
+        StockMovement.objects.create(
+            product=self.product, kind='Sale', quantity=-10,
+            created_at=timezone.make_aware(datetime.datetime(2030, 1, 2, 12)),
+        )
+        self.assertEqual(self.stock(as_of='2030-01-01'), 100)
+        self.assertEqual(self.stock(as_of='2030-01-02'), 90)
+        self.assertEqual(self.client.get('/product_units/', {'as_of': 'soon'}).status_code, 400)
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    """
+    Many threads check out the same popular unit at once; whatever the
+    interleaving, the units sold must equal the stock that was taken.
+    """
+    threads = 8
+    checkouts_per_thread = 10
+    initial_stock = 25
+
+    def test_no_oversell_under_contention(self):
+        reference_cache.get_cache().clear()
+        user = User.objects.create_user(username='cashier')
+        customer = CustomerDetails.objects.create(
+            customer_name='Walk-in', customer_contact='0', customer_email='-', customer_address='-',
+        )
+        product = ProductUnit.objects.create(unit_name='Window 1HP', unit_price=Decimal('1.00'))
+        ProductUnit.objects.release({product.pk: self.initial_stock}, kind='Receipt')
+        results = []
+
+        def cashier():
+            client = APIClient()
+            client.force_authenticate(user)
+            for _ in range(self.checkouts_per_thread):
+                try:
+                    response = client.post('/sales_orders/checkout/', {
+                        'customer_id': customer.id, 'items': [{'product_id': product.id, 'quantity': 1}],
+                    }, format='json')
+                    results.append(response.status_code)
+                except OperationalError:
+                    # sqlite rejects a writer outright when the database is busy
+                    results.append(None)
+            connection.close()
+
+        workers = [threading.Thread(target=cashier) for _ in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        sold = SalesOrderEntry.objects.aggregate(total=Sum('quantity'))['total'] or 0
+        product = ProductUnit.objects.with_stock().get(pk=product.pk)
+        self.assertGreaterEqual(product.unit_stock, 0)
+        self.assertEqual(sold, self.initial_stock - product.unit_stock)
+        # every order that exists got its unit; a request that errored after
+        # committing still sold one, so 201s can only undercount
+        self.assertEqual(SalesOrder.objects.count(), sold)
+        self.assertLessEqual(results.count(201), sold)
+        self.assertGreater(sold, 0)
+
+
+@skipUnless(connection.vendor == 'sqlite', "SQLite backend profile")
+class SQLiteProfileTests(TransactionTestCase):
+    def test_pragmas_applied_to_new_connections(self):
+        connection.close()
+        pragmas = {}
+        with connection.cursor() as cursor:
+            # journal_mode and mmap_size don't apply to the in-memory test database
+            for name in ('synchronous', 'cache_size', 'temp_store'):
+                cursor.execute(f'PRAGMA {name}')
+                pragmas[name] = cursor.fetchone()[0]
+        self.assertEqual(pragmas, {'synchronous': 1, 'cache_size': -64000, 'temp_store': 2})
+
+    def test_transactions_take_the_write_lock_up_front(self):
+        with CaptureQueriesContext(connection) as queries:
+            with transaction.atomic():
+                AirconType.objects.create(type_name='Split')
+        self.assertEqual(queries[0]['sql'], 'BEGIN IMMEDIATE')
+
+    def test_unknown_transaction_mode(self):
+        settings_dict = {**connection.settings_dict, 'OPTIONS': {'transaction_mode': 'LAZY'}}
+        with self.assertRaises(ImproperlyConfigured):
+            DatabaseWrapper(settings_dict, alias='other')
+
+
+
+class MigrationTests(TestCase):
+    def test_models_match_migrations(self):
+        # the test database itself is built by running every migration on the configured backend
+        call_command('makemigrations', 'JohnCarAirCo', check=True, dry_run=True, stdout=StringIO())
+
+
+class RollupTests(APITestCase):
+    def report(self, kind, **params):
+        return self.client.get(f'/reports/{kind}/', params).data
+
+    def checkout(self, quantity):
+        return self.client.post('/sales_orders/checkout/', {
+            'customer_id': self.customer.id, 'items': [{'product_id': self.product.id, 'quantity': quantity}],
+        }, format='json').data
+
+    def test_sales_rollup_follows_entry_writes_and_cancellation(self):
+        first = self.checkout(2)
+        self.checkout(1)
+        entry = first['entries'][0]
+        self.client.post('/sales_order_entries/', {
+            'product_id': self.product.id, 'order_id': first['id'], 'quantity': 1,
+        })
+
+        row, = self.report('sales', group_by='product')
+        self.assertEqual((row['product'], row['units'], row['revenue'], row['order_count']),
+                         ('Split 1.5HP', 4, '100000.00', 2))
+
+        self.client.delete(f"/sales_order_entries/{entry['id']}/")
+        self.client.patch(f"/sales_orders/{first['id']}/", {'status': 'Cancelled'})
+        row, = self.report('sales', group_by='date,aircon_type')
+        self.assertEqual((row['aircon_type'], row['units']), ('Split', 1))
+        self.assertNotIn('order_count', row)
+        row, = self.report('sales', group_by='product')
+        self.assertEqual(row['order_count'], 1)
+
+    def test_service_rollup_and_rebuild_agree(self):
+        order = ServiceOrder.objects.create(customer=self.customer, service_date=datetime.date(2023, 4, 1))
+        self.client.post('/service_order_entries/', [
+            {'service_id': self.service.id, 'order_id': order.id, 'quantity': 2},
+            {'service_id': self.service.id, 'order_id': order.id, 'quantity': 1},
+        ], format='json')
+        self.checkout(3)
+
+        incremental = (self.report('services', group_by='date,service'), self.report('sales', group_by='date,product'))
+        call_command('rebuild_rollups', stdout=StringIO())
+        rebuilt = (self.report('services', group_by='date,service'), self.report('sales', group_by='date,product'))
+        self.assertEqual(incremental, rebuilt)
+        self.assertEqual(incremental[0][0]['revenue'], '2400.00')
+        self.assertEqual(incremental[0][0]['order_count'], 1)
+
+    def test_orders_with_several_products_count_once(self):
+        other = ProductUnit.objects.create(unit_name='Window 1HP', unit_price=Decimal('15000.00'), unit_type=self.aircon_type)
+        ProductUnit.objects.release({other.pk: 10}, kind='Receipt')
+        order = self.client.post('/sales_orders/checkout/', {
+            'customer_id': self.customer.id,
+            'items': [{'product_id': self.product.id, 'quantity': 1}, {'product_id': other.id, 'quantity': 1}],
+        }, format='json').data
+        self.checkout(1)
+
+        def counts():
+            return (
+                self.report('sales')[0]['order_count'],
+                [row['order_count'] for row in self.report('sales', group_by='date')],
+                sorted(row['order_count'] for row in self.report('sales', group_by='product')),
+            )
+
+        self.assertEqual(counts(), (2, [2], [1, 2]))
+        call_command('rebuild_rollups', stdout=StringIO())
+        self.assertEqual(counts(), (2, [2], [1, 2]))
+
+        # the order only stops counting once its last line is gone
+        first, second = order['entries']
+        self.client.delete(f"/sales_order_entries/{first['id']}/")
+        self.assertEqual(counts()[0], 2)
+        self.client.delete(f"/sales_order_entries/{second['id']}/")
+        self.assertEqual(counts()[0], 1)
+
+    def test_date_range_and_bad_parameters(self):
+        self.checkout(1)
+        self.assertEqual(self.report('sales', end='2000-01-01'), [{'units': 0, 'revenue': '0.00', 'order_count': 0}])
+        self.assertEqual(self.client.get('/reports/sales/', {'group_by': 'customer'}).status_code, 400)
+        self.assertEqual(self.client.get('/reports/sales/', {'start': 'yesterday'}).status_code, 400)
+
+
+class ExportTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.orders = self.create_sales_orders(5)
+        SalesOrderPayment.objects.create(
+            order=self.orders[0], amount_paid=Decimal('10.50'),
+            cc_number='4111111111111111', cc_cvv='123', cc_name='JUAN',
+        )
+
+    def test_csv_export_streams_every_row(self):
+        response = self.client.get('/exports/sales_orders.csv', HTTP_ACCEPT='text/csv')
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,customer_id,customer,date_ordered,status,total_price')
+        self.assertEqual(len(lines), 6)
+        self.assertTrue(lines[1].startswith(f'{self.orders[0].id},{self.customer.id},Juan Dela Cruz,'))
+
+    def test_ndjson_export_leaves_out_card_details(self):
+        response = self.client.get('/exports/sales_order_payments.ndjson')
+        body = b''.join(response.streaming_content).decode()
+        self.assertEqual(json.loads(body.splitlines()[0])['amount_paid'], '10.50')
+        self.assertNotIn('4111', body)
+        self.assertNotIn('cc_cvv', body)
+
+    def test_unknown_export_and_command(self):
+        self.assertEqual(self.client.get('/exports/users.csv').status_code, 404)
+
+        out = StringIO()
+        call_command('export_data', 'sales_orders', '--format', 'ndjson', '--chunk-size', '2', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 5)
+
+
+class OrderFilterTests(APITestCase):
+    def test_status_and_date_filters(self):
+        orders = self.create_sales_orders(4)
+        SalesOrder.objects.filter(pk=orders[0].pk).update(status='Cancelled')
+        SalesOrder.objects.filter(pk=orders[1].pk).update(date_ordered=datetime.date(2023, 1, 1))
+
+        response = self.client.get('/sales_orders/?status=Active&date_from=2023-06-01')
+        self.assertEqual(sorted(row['id'] for row in response.data), [o.id for o in orders[2:]])
+
+        response = self.client.get('/sales_orders/?date_to=2023-01-31')
+        self.assertEqual([row['id'] for row in response.data], [orders[1].id])
+
+    def test_service_schedule_and_payment_filters(self):
+        tomorrow = timezone.localdate() + datetime.timedelta(days=1)
+        scheduled = ServiceOrder.objects.create(
+            customer=self.customer, technician=self.technician, service_date=tomorrow,
+        )
+        ServiceOrder.objects.create(customer=self.customer, service_date=tomorrow)
+        ServiceOrderPayment.objects.create(order=scheduled, amount_paid=Decimal('800.00'))
+
+        response = self.client.get(f'/service_orders/?technician={self.technician.pk}&service_date={tomorrow}')
+        self.assertEqual([row['id'] for row in response.data], [scheduled.id])
+
+        response = self.client.get(f'/service_order_payments/?date_paid_from={timezone.localdate()}')
+        self.assertEqual(len(response.data), 1)
+
+    def test_malformed_filter_value_is_a_bad_request(self):
+        response = self.client.get('/sales_orders/?date_from=yesterday')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('date_from', response.data)
+
+    def test_filters_are_index_range_scans(self):
+        if connection.vendor == 'postgresql':
+            # the planner rightly scans tables this small; check an index can serve the filters at all
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = SalesOrder.objects.filter(status='Active', date_ordered__gte=datetime.date(2023, 1, 1)).explain()
+        self.assertEqual(plan_kind(plan), 'index range scan')
+        plan = ServiceOrderPayment.objects.filter(date_paid__gte=datetime.date(2023, 1, 1)).explain()
+        self.assertEqual(plan_kind(plan), 'index range scan')
+
+
+class TechnicianAvailabilityTests(APITestCase):
+    # 2024-05-06 is a Monday, 2024-05-07 a Tuesday
+    monday = datetime.date(2024, 5, 6)
+
+    def setUp(self):
+        super().setUp()
+        response = self.client.post('/technician_details/', {
+            'tech_name': 'Ana Reyes', 'tech_phone': '09170000001',
+            'tech_email': 'ana@example.com', 'tech_sched': 'TTh 1PM - 3PM',
+        })
+        self.assertEqual(response.status_code, 201)
+        self.tuesday_tech = TechnicianDetails.objects.get(pk=response.data['id'])
+        # the fixture technician predates the windows; give them theirs
+        self.client.patch(f'/technician_details/{self.technician.pk}/', {'tech_sched': 'MW 3PM - 5PM'})
+
+    def available(self, **params):
+        response = self.client.get('/technician_details/available/', params)
+        self.assertEqual(response.status_code, 200)
+        return [row['id'] for row in response.data]
+
+    def test_schedule_text_becomes_weekly_windows(self):
+        windows = TechnicianAvailability.objects.filter(technician=self.tuesday_tech)
+        self.assertEqual(sorted(windows.values_list('weekday', flat=True)), [1, 3])
+        self.assertEqual(self.available(date='2024-05-06'), [self.technician.pk])
+        self.assertEqual(self.available(date='2024-05-07'), [self.tuesday_tech.pk])
+        self.assertEqual(self.available(date='2024-05-07', start='14:00', end='16:00'), [])
+
+        response = self.client.patch(f'/technician_details/{self.technician.pk}/', {'tech_sched': 'whenever'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_unreadable_legacy_schedule_can_be_sent_back_unchanged(self):
+        TechnicianDetails.objects.filter(pk=self.tuesday_tech.pk).update(tech_sched='Call first')
+        details = self.client.get(f'/technician_details/{self.tuesday_tech.pk}/').data
+        response = self.client.put(f'/technician_details/{self.tuesday_tech.pk}/', {**details, 'tech_name': 'Ana R.'})
+        self.assertEqual(response.status_code, 200)
+        # the windows from the last schedule that did parse are kept
+        self.assertEqual(TechnicianAvailability.objects.filter(technician=self.tuesday_tech).count(), 2)
+
+    def test_bookings_and_exceptions(self):
+        ServiceOrder.objects.create(customer=self.customer, technician=self.technician, service_date=self.monday)
+        self.assertEqual(self.available(date='2024-05-06'), [])
+
+        response = self.client.post('/technician_availability_exceptions/', {
+            'technician_id': self.tuesday_tech.pk, 'date': '2024-05-06', 'available': True,
+        })
+        self.assertEqual(response.status_code, 201)
+        self.client.post('/technician_availability_exceptions/', {
+            'technician_id': self.tuesday_tech.pk, 'date': '2024-05-07', 'available': False,
+        })
+        self.assertEqual(self.available(date='2024-05-06'), [self.tuesday_tech.pk])
+        self.assertEqual(self.available(date='2024-05-07'), [])
+
+    def test_lookup_is_one_query(self):
+        with self.assertNumQueries(1):
+            TechnicianDetails.objects.available_on(self.monday).count()
+        response = self.client.get('/technician_details/available/', {'date': 'soon'})
+        self.assertEqual(response.status_code, 400)
+
+
+class CustomerSearchTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        CustomerDetails.objects.bulk_create([
+            CustomerDetails(
+                customer_name='Maria Santos', customer_contact='09181234567',
+                customer_email='maria.santos@example.com', customer_address='Mandaue City',
+            ),
+            CustomerDetails(
+                customer_name='Jose Rizal', customer_contact='09190000000',
+                customer_email='jose@example.com', customer_address='Juan Luna St, Cebu City',
+            ),
+        ])
+
+    def search(self, query, **params):
+        response = self.client.get('/customer_details/search/', {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    @skipUnless(connection.vendor == 'sqlite', "FTS5 index; other databases fall back to substring matching")
+    def test_prefix_and_token_matching_across_columns(self):
+        self.assertEqual([row['customer_name'] for row in self.search('mar sant')['results']], ['Maria Santos'])
+        self.assertEqual([row['customer_name'] for row in self.search('0918')['results']], ['Maria Santos'])
+        self.assertEqual(self.search('maria.santos@example')['results'][0]['customer_name'], 'Maria Santos')
+        self.assertEqual(self.search('"juan" OR')['results'], [])
+
+    @skipUnless(connection.vendor == 'sqlite', "FTS5 index; other databases fall back to substring matching")
+    def test_name_match_ranks_above_address_match(self):
+        names = [row['customer_name'] for row in self.search('juan')['results']]
+        self.assertEqual(names, ['Juan Dela Cruz', 'Jose Rizal'])
+
+    def test_index_follows_updates_and_deletes(self):
+        CustomerDetails.objects.filter(customer_name='Maria Santos').update(customer_address='Lapu-Lapu City')
+        self.assertEqual(self.search('mandaue')['results'], [])
+        self.assertEqual(len(self.search('lapu')['results']), 1)
+        CustomerDetails.objects.filter(customer_name='Maria Santos').delete()
+        self.assertEqual(self.search('lapu')['results'], [])
+
+    def test_pages(self):
+        first = self.search('cebu', page_size=1)
+        second = self.client.get(first['next']).data
+        self.assertIsNone(first['previous'])
+        self.assertIsNone(second['next'])
+        self.assertNotEqual(first['results'], second['results'])
+        self.assertEqual(self.client.get('/customer_details/search/?q=').status_code, 400)
+
+    @skipUnless(connection.vendor == 'sqlite', "FTS5 index; other databases fall back to substring matching")
+    def test_broad_queries_say_they_were_truncated(self):
+        CustomerDetails.objects.bulk_create(
+            CustomerDetails(
+                customer_name=f'Cebu Customer {number}', customer_contact='09170000000',
+                customer_email=f'customer{number}@example.com', customer_address='Talisay',
+            )
+            for number in range(search.MAX_CANDIDATES + 1)
+        )
+        customers, truncated = search.search_customers('talisay', search.MAX_CANDIDATES - 10, 50)
+        self.assertEqual((len(customers), truncated), (10, True))
+        self.assertTrue(self.search('talisay')['truncated'])
+        newest = search.MAX_CANDIDATES
+        self.assertFalse(self.search(f'talisay {newest}')['truncated'])
+        # words longer than the prefix indexes are still matched in full
+        self.assertEqual(
+            [row['customer_email'] for row in self.search(f'customer{newest}')['results']],
+            [f'customer{newest}@example.com'],
+        )
+        # one letter is a whole word, not every word starting with it
+        self.assertEqual(self.search('c')['results'], [])
+
+
+@override_settings(PAGINATION_LEGACY_MODE=False)
+class ProductCatalogTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        window = AirconType.objects.create(type_name='Window')
+        cls.window_1hp = ProductUnit.objects.create(unit_name='Window 1HP', unit_price=Decimal('12000.00'), unit_type=window)
+        cls.window_2hp = ProductUnit.objects.create(unit_name='Window 2HP', unit_price=Decimal('18000.00'), unit_type=window)
+        ProductUnit.objects.release({cls.window_1hp.pk: 3}, kind='Receipt')
+
+    def names(self, **params):
+        response = self.client.get('/product_units/', params)
+        self.assertEqual(response.status_code, 200)
+        return [row['unit_name'] for row in response.data['results']]
+
+    def test_filters(self):
+        self.assertEqual(self.names(unit_type=self.window_1hp.unit_type_id), ['Window 1HP', 'Window 2HP'])
+        self.assertEqual(self.names(price_min='15000', price_max='20000'), ['Window 2HP'])
+        self.assertEqual(self.names(in_stock='true'), ['Split 1.5HP', 'Window 1HP'])
+        self.assertEqual(self.names(in_stock='false'), ['Window 2HP'])
+        self.assertEqual(self.client.get('/product_units/', {'price_min': 'cheap'}).status_code, 400)
+
+    def test_name_search_matches_word_prefixes(self):
+        self.assertEqual(self.names(q='win 2'), ['Window 2HP'])
+        self.assertEqual(self.names(q='1.5'), ['Split 1.5HP'])
+        ProductUnit.objects.filter(pk=self.window_2hp.pk).update(unit_name='Inverter 2HP')
+        self.assertEqual(self.names(q='win'), ['Window 1HP'])
+
+    def test_sorting_pages_through_every_product(self):
+        self.assertEqual(self.names(ordering='-unit_price'), ['Split 1.5HP', 'Window 2HP', 'Window 1HP'])
+        first = self.client.get('/product_units/', {'ordering': 'unit_price', 'page_size': 2}).data
+        second = self.client.get(first['next']).data
+        self.assertEqual([row['unit_name'] for row in second['results']], ['Split 1.5HP'])
+        self.assertEqual(self.client.get('/product_units/', {'ordering': 'unit_type'}).status_code, 400)
+        self.assertEqual(self.client.get('/product_units/', {'ordering': '--id'}).status_code, 400)
+
+    def test_catalog_page_is_one_query(self):
+        # plus the table-version lookup
+        with self.assertNumQueries(2):
+            self.client.get('/product_units/', {'q': 'window', 'in_stock': 'true', 'ordering': 'unit_name'})
+
+
+class ReferenceCacheTests(APITestCase):
+    def test_list_is_cached_until_a_write(self):
+        self.client.get('/services/')
+        # only the table-version lookup
+        with self.assertNumQueries(1):
+            self.assertEqual(len(self.client.get('/services/').data), 1)
+
+        self.client.post('/services/', {'service_name': 'Repair', 'service_cost': '2500.00'})
+        self.assertEqual(len(self.client.get('/services/').data), 2)
+
+    def test_stock_movements_and_type_deletes_refresh_products(self):
+        self.assertEqual(self.client.get('/product_units/').data[0]['unit_stock'], 100)
+        self.client.post(f'/product_units/{self.product.pk}/adjust_stock/', {'delta': -5})
+        self.assertEqual(self.client.get('/product_units/').data[0]['unit_stock'], 95)
+
+        # products are detached by a queryset update that sends no signal of its own
+        self.aircon_type.delete()
+        self.assertIsNone(self.client.get('/product_units/').data[0]['unit_type'])
+
+    def test_writes_read_prices_and_keys_from_the_database(self):
+        order = SalesOrder.objects.create(customer=self.customer)
+        self.client.get('/product_units/')
+        # as if another worker changed the price and added a product: no signal reaches this process
+        ProductUnit.objects.filter(pk=self.product.pk).update(unit_price=Decimal('30000.00'))
+        new_product, = ProductUnit.objects.bulk_create([
+            ProductUnit(unit_name='Window 1HP', unit_price=Decimal('15000.00'), unit_type=self.aircon_type),
+        ])
+        ProductUnit.objects.release({new_product.pk: 10}, kind='Receipt')
+
+        for product, price in [(self.product, '30000.00'), (new_product, '15000.00')]:
+            response = self.client.post('/sales_order_entries/', {
+                'product_id': product.pk, 'order_id': order.pk, 'quantity': 1,
+            })
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(response.data['entry_price'], price)
+
+    def test_list_follows_table_versions_written_elsewhere(self):
+        versions.flush(connection)
+        self.assertEqual(self.client.get('/services/').data[0]['service_cost'], '800.00')
+        # another worker's committed write: its version bump, but no invalidation here
+        ServiceType.objects.filter(pk=self.service.pk).update(service_cost=Decimal('900.00'))
+        versions.flush(connection)
+        self.assertEqual(self.client.get('/services/').data[0]['service_cost'], '900.00')
+
+    def test_concurrent_misses_build_once(self):
+        builds = []
+
+        def build():
+            builds.append(1)
+            time.sleep(0.2)
+            return 'payload'
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(reference_cache.get_or_build(ServiceType, 'slow', build)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['payload'] * 5)
+        self.assertEqual(len(builds), 1)
+
+    def test_warm_up_fills_the_default_lists(self):
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            reference_cache.warm_up()
+        # one table-version lookup each
+        with self.assertNumQueries(3):
+            self.client.get('/aircon_types/')
+            self.client.get('/services/')
+            self.client.get('/product_units/')
+
+    def test_warm_up_command_needs_a_shared_cache(self):
+        with self.assertRaisesMessage(CommandError, 'LocMemCache'):
+            call_command('warm_reference_cache', stdout=StringIO())
+        with tempfile.TemporaryDirectory() as directory:
+            shared = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory}}
+            with override_settings(CACHES=shared, ALLOWED_HOSTS=['testserver']):
+                call_command('warm_reference_cache', stdout=StringIO())
+                with self.assertNumQueries(1):
+                    self.client.get('/services/')
+
+
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        # the fixtures' writes are still pending in the test transaction
+        versions.flush(connection)
+
+    @contextmanager
+    def committing(self):
+        # TestCase never commits; do what COMMIT would
+        with self.captureOnCommitCallbacks(execute=True):
+            yield
+        versions.flush(connection)
+
+    def test_unchanged_list_is_not_modified(self):
+        response = self.client.get('/product_units/')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        # answered from the version rows alone
+        with self.assertNumQueries(1):
+            response = self.client.get('/product_units/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+        self.assertNotEqual(self.client.get('/product_units/', {'ordering': '-id'})['ETag'], etag)
+
+    def test_any_write_to_a_listed_table_changes_the_etag(self):
+        etag = self.client.get('/product_units/')['ETag']
+        with self.committing():
+            self.client.post(f'/product_units/{self.product.pk}/adjust_stock/', {'delta': -5})
+        response = self.client.get('/product_units/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['unit_stock'], 95)
+
+        # queryset updates send no signals but are still seen
+        etag = response['ETag']
+        with self.committing():
+            AirconType.objects.filter(pk=self.aircon_type.pk).update(type_name='Split')
+        self.assertEqual(self.client.get('/product_units/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        # writes to unrelated tables leave it alone
+        etag = self.client.get('/product_units/')['ETag']
+        with self.committing():
+            SalesOrder.objects.create(customer=self.customer)
+        self.assertEqual(self.client.get('/product_units/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_rolled_back_writes_do_not_bump(self):
+        etag = self.client.get('/sales_orders/')['ETag']
+        with self.committing():
+            response = self.client.post('/sales_orders/checkout/', {
+                'customer_id': self.customer.id, 'items': [{'product_id': self.product.id, 'quantity': 1000}],
+            }, format='json')
+        # the order row was inserted before the stock check failed
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(SalesOrder.objects.exists())
+        self.assertEqual(self.client.get('/sales_orders/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_if_modified_since(self):
+        with self.committing():
+            SalesOrder.objects.create(customer=self.customer)
+        response = self.client.get('/sales_orders/')
+        last_modified = response['Last-Modified']
+        self.assertEqual(self.client.get('/sales_orders/', HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        self.assertEqual(self.client.post('/sales_orders/', {}, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 400)
+
+
+class TableVersionCommitTests(TransactionTestCase):
+    def setUp(self):
+        self.customer = CustomerDetails.objects.create(
+            customer_name='Juan Dela Cruz', customer_contact='09170000000',
+            customer_email='juan@example.com', customer_address='Cebu City',
+        )
+
+    def version(self):
+        row = TableVersion.objects.filter(table_name=SalesOrder._meta.db_table).first()
+        return row.version if row else 0
+
+    def test_versions_commit_with_the_data(self):
+        before = self.version()
+        with transaction.atomic():
+            SalesOrder.objects.create(customer=self.customer)
+            with transaction.atomic():
+                SalesOrder.objects.create(customer=self.customer)
+            # not bumped until the transaction commits
+            self.assertEqual(self.version(), before)
+        self.assertEqual(self.version(), before + 1)
+
+        # a savepoint rolled back takes its tables with it
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    SalesOrder.objects.create(customer=self.customer)
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertEqual(self.version(), before + 1)
+
+    def test_failed_bump_rolls_the_write_back(self):
+        before = self.version()
+        with mock.patch('JohnCarAirCo.versions.bump', side_effect=OperationalError('database table is locked')):
+            with self.assertRaises(OperationalError):
+                with transaction.atomic():
+                    SalesOrder.objects.create(customer=self.customer)
+        self.assertFalse(SalesOrder.objects.exists())
+        self.assertEqual(self.version(), before)
+
+
+class SparseFieldsTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.order = SalesOrder.objects.create(customer=self.customer, total_price=Decimal('25000.00'))
+        SalesOrderEntry.objects.create(order=self.order, product=self.product, quantity=1)
+        SalesOrderPayment.objects.create(order=self.order, amount_paid=Decimal('25000.00'))
+
+    def get(self, url, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        # the first query is the table-version lookup
+        return response, [query['sql'] for query in queries.captured_queries[1:]]
+
+    def test_default_payload_is_unchanged(self):
+        response, _ = self.get('/sales_orders/')
+        self.assertIn('entries', response.data[0])
+        self.assertEqual(len(response.data[0]), len(SalesOrderSerializer().fields))
+
+    def test_order_board_reads_only_its_columns(self):
+        response, queries = self.get('/sales_orders/', fields='id,customer_id,status,total_price')
+        self.assertEqual(response.data, [
+            {'id': self.order.id, 'customer_id': self.customer.id, 'total_price': '25000.00', 'status': 'Active'},
+        ])
+        # no prefetch of the entries and no join
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('JOIN', queries[0])
+        self.assertNotIn('customer_name', queries[0])
+
+    def test_string_relations_keep_their_join(self):
+        response, queries = self.get('/sales_order_entries/', fields='id,order')
+        self.assertEqual(response.data, [{'id': self.order.entries.get().id, 'order': str(self.order)}])
+        self.assertEqual(len(queries), 1)
+        self.assertIn('customer_name', queries[0])
+        self.assertNotIn('unit_name', queries[0])
+
+    def test_expand_embeds_entries(self):
+        response, queries = self.get('/sales_orders/', fields='id', expand='entries')
+        self.assertEqual(list(response.data[0]), ['id', 'entries'])
+        self.assertEqual(response.data[0]['entries'][0]['product'], 'Split 1.5HP')
+        self.assertEqual(len(queries), 2)
+
+    def test_expanded_orders_read_only_what_the_entries_render(self):
+        order = ServiceOrder.objects.create(
+            customer=self.customer, technician=self.technician, service_date=datetime.date(2024, 5, 6),
+        )
+        ServiceOrderEntry.objects.create(order=order, service=self.service, quantity=1)
+        response, queries = self.get('/service_orders/', fields='id', expand='entries')
+        self.assertEqual(response.data[0]['entries'][0]['order'], str(order))
+        self.assertEqual(len(queries), 2)
+        # the entries print their order with its customer; nothing else of the order is read
+        self.assertIn('customer_name', queries[0])
+        self.assertNotIn('tech_name', queries[0])
+        self.assertNotIn('service_date', queries[0])
+
+    def test_pages_and_retrieve(self):
+        response, _ = self.get('/sales_orders/', fields='id', page_size=1)
+        self.assertEqual(response.data['results'], [{'id': self.order.id}])
+        response, queries = self.get(f'/sales_order_payments/{SalesOrderPayment.objects.get().id}/', fields='amount_paid')
+        self.assertEqual(response.data, {'amount_paid': '25000.00'})
+        self.assertNotIn('JOIN', queries[0])
+
+    def test_unknown_names_are_rejected(self):
+        response, _ = self.get('/sales_orders/', fields='id,bogus', expand='payments')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data), {'fields', 'expand'})
+        self.assertEqual(self.get('/service_order_entries/', expand='entries')[0].status_code, 400)
+
+
+class OrderPayloadTests(APITestCase):
+    """
+    The values() read path must render exactly what the serializers would,
+    byte for byte.
+    """
+
+    def setUp(self):
+        super().setUp()
+        other = CustomerDetails.objects.create(
+            customer_name='Zoë “Quotes” Ñino', customer_contact='0', customer_email='-', customer_address='-',
+        )
+        for customer, status in [(self.customer, 'Active'), (other, 'Cancelled'), (None, 'Finished')]:
+            # only service orders outlive their customer
+            order = SalesOrder.objects.create(customer=customer or other, status=status, total_price=Decimal('1234.50'))
+            for quantity in (1, 3):
+                SalesOrderEntry.objects.create(
+                    order=order, product=self.product, quantity=quantity, entry_price=Decimal('25000.00') * quantity,
+                )
+            service_order = ServiceOrder.objects.create(
+                customer=customer, technician=self.technician if customer else None,
+                service_date=datetime.date(2024, 2, 29), status=status, total_price=Decimal('0.10'),
+            )
+            ServiceOrderEntry.objects.create(order=service_order, service=self.service, quantity=2, entry_price=Decimal('1600.00'))
+        SalesOrder.objects.create(customer=other)
+
+    def assert_same_bytes(self, payload_class, queryset):
+        payload = payload_class()
+        expected = JSONRenderer().render(payload.serializer_class(queryset, many=True).data)
+        self.assertEqual(JSONRenderer().render(payload.build(payload.rows(queryset))), expected)
+
+    def test_sales_orders_match_the_serializer(self):
+        self.assert_same_bytes(SalesOrderPayload, SalesOrderViewSet.queryset.order_by('id'))
+
+    def test_service_orders_match_the_serializer(self):
+        self.assert_same_bytes(ServiceOrderPayload, ServiceOrderViewSet.queryset.order_by('id'))
+
+    def test_item_names_are_read_with_the_entries(self):
+        self.assert_same_bytes(SalesOrderPayload, SalesOrderViewSet.queryset.order_by('id'))
+        # a rename another process made: no signal here, nothing cached may answer for it
+        ProductUnit.objects.filter(pk=self.product.pk).update(unit_name='Split 2HP')
+        ServiceType.objects.filter(pk=self.service.pk).update(service_name='Deep Cleaning')
+        self.assert_same_bytes(SalesOrderPayload, SalesOrderViewSet.queryset.order_by('id'))
+        self.assert_same_bytes(ServiceOrderPayload, ServiceOrderViewSet.queryset.order_by('id'))
+
+    def test_endpoints_match_the_serializer_path(self):
+        # naming every field sends the request through the serializer instead
+        for url, serializer_class in [('/sales_orders/', SalesOrderSerializer), ('/service_orders/', ServiceOrderSerializer)]:
+            everything = ','.join(serializer_class().fields)
+            order_id = self.client.get(url).data[0]['id']
+            for path in [url, f'{url}{order_id}/']:
+                with self.subTest(path=path):
+                    fast = self.client.get(path, HTTP_ACCEPT='application/json')
+                    slow = self.client.get(path, {'fields': everything}, HTTP_ACCEPT='application/json')
+                    self.assertEqual(fast.content, slow.content)
+            self.assertEqual(self.client.get(f'{url}999/').status_code, 404)
+
+    @override_settings(PAGINATION_LEGACY_MODE=False)
+    def test_pages_through_values_rows(self):
+        # the page and its entries are one query, after the table-version lookup
+        with self.assertNumQueries(2):
+            first = self.client.get('/sales_orders/', {'page_size': 3}).data
+        second = self.client.get(first['next']).data
+        self.assertEqual([len(row['entries']) for row in first['results']], [0, 2, 2])
+        ids = [row['id'] for row in first['results'] + second['results']]
+        self.assertEqual(ids, list(SalesOrder.objects.order_by('-date_ordered', '-id').values_list('id', flat=True)))
+
+
+class RenderingTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_sales_orders(30, total_price=Decimal('1234.50'))
+
+    def test_fast_renderer_matches_the_stock_renderer(self):
+        data = {
+            'price': Decimal('10.50'), 'date': datetime.date(2024, 2, 29),
+            'at': timezone.make_aware(datetime.datetime(2024, 2, 29, 8, 30, 0, 123456)),
+            'name': 'Zoë ', 'rows': [{'n': 1, 'ok': True, 'none': None}], 1: 2 ** 70,
+        }
+        expected = JSONRenderer().render(data)
+        self.assertEqual(FastJSONRenderer().render(data), expected)
+        with mock.patch('JohnCarAirCo.renderers.orjson', None):
+            self.assertEqual(FastJSONRenderer().render(data), expected)
+        indented = 'application/json; indent=2'
+        self.assertEqual(FastJSONRenderer().render(data, indented), JSONRenderer().render(data, indented))
+
+    def test_lists_are_compressed_when_accepted(self):
+        plain = self.client.get('/sales_orders/')
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', plain['Vary'])
+
+        response = self.client.get('/sales_orders/', HTTP_ACCEPT_ENCODING='deflate, gzip;q=0.8')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertEqual(int(response['Content-Length']), len(response.content))
+        self.assertEqual(response['ETag'], 'W/' + plain['ETag'])
+        # the weakened ETag still validates
+        self.assertEqual(
+            self.client.get('/sales_orders/', HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag']).status_code,
+            304,
+        )
+
+        self.assertFalse(self.client.get('/sales_orders/', HTTP_ACCEPT_ENCODING='gzip;q=0').has_header('Content-Encoding'))
+        small = self.client.get(f'/sales_orders/{SalesOrder.objects.first().pk}/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(small.has_header('Content-Encoding'))
+
+    @skipUnless(brotli, "brotli is not installed")
+    def test_brotli_is_preferred(self):
+        response = self.client.get('/sales_orders/', HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.content), self.client.get('/sales_orders/').content)
+        with self.settings(RESPONSE_COMPRESSION={'ENCODINGS': ['gzip']}):
+            response = self.client.get('/sales_orders/', HTTP_ACCEPT_ENCODING='br, gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_streamed_exports_are_compressed(self):
+        response = self.client.get('/exports/sales_orders.csv', HTTP_ACCEPT='text/csv', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual(len(lines), 31)
+
+
+class AsyncReadTests(APITestCase):
+    """The async read endpoints answer exactly as the sync views do."""
+    urlconf = api_urlconf(async_reads=True)
+
+    def setUp(self):
+        super().setUp()
+        self.token = str(AccessToken.for_user(self.user))
+        self.client.post('/sales_orders/checkout/', {
+            'customer_id': self.customer.id, 'items': [{'product_id': self.product.id, 'quantity': 2}],
+        }, format='json')
+        self.create_sales_orders(2)
+        order = ServiceOrder.objects.create(customer=self.customer, technician=self.technician, service_date=datetime.date(2024, 3, 1))
+        ServiceOrderEntry.objects.create(order=order, service=self.service, quantity=1, entry_price=Decimal('800.00'))
+
+    def async_request(self, method, path, authenticated=True, **kwargs):
+        if authenticated:
+            kwargs['AUTHORIZATION'] = f'Bearer {self.token}'
+
+        async def send():
+            return await getattr(AsyncClient(), method)(path, **kwargs)
+        with override_settings(ROOT_URLCONF=self.urlconf):
+            return async_to_sync(send)()
+
+    def test_reads_match_the_sync_views(self):
+        ids = {
+            'sales_orders': SalesOrder.objects.first().pk,
+            'service_orders': ServiceOrder.objects.first().pk,
+            'product_units': self.product.pk,
+            'customer_details': self.customer.pk,
+        }
+        for name, pk in ids.items():
+            self.assertTrue(asyncio.iscoroutinefunction(resolve(f'/{name}/', self.urlconf).func))
+            for path in [f'/{name}/', f'/{name}/?page_size=1', f'/{name}/{pk}/']:
+                with self.subTest(path=path):
+                    expected = self.client.get(path)
+                    response = self.async_request('get', path)
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(response.content, expected.content)
+                    self.assertEqual(response['ETag'], expected['ETag'])
+
+        # the serializer path, and a page reached through a cursor
+        for path in ['/sales_orders/?fields=id,status&expand=entries', self.client.get('/sales_orders/?page_size=1').data['next']]:
+            with self.subTest(path=path):
+                self.assertEqual(self.async_request('get', path).content, self.client.get(path).content)
+
+    def test_errors_and_not_modified(self):
+        self.assertEqual(self.async_request('get', '/sales_orders/999/').status_code, 404)
+        self.assertEqual(self.async_request('get', '/sales_orders/abc/').status_code, 404)
+        self.assertEqual(self.async_request('get', '/sales_orders/?fields=nope').status_code, 400)
+        self.assertEqual(
+            self.async_request('get', '/product_units/', authenticated=False).status_code,
+            APIClient().get('/product_units/').status_code,
+        )
+        etag = self.async_request('get', '/customer_details/')['ETag']
+        self.assertEqual(self.async_request('get', '/customer_details/', if_none_match=etag).status_code, 304)
+
+    def test_writes_and_other_actions_use_the_sync_views(self):
+        self.assertFalse(asyncio.iscoroutinefunction(resolve('/customer_details/search/', self.urlconf).func))
+        response = self.async_request('post', '/customer_details/', data=json.dumps({
+            'customer_name': 'Maria Santos', 'customer_contact': '0', 'customer_email': '-', 'customer_address': '-',
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(CustomerDetails.objects.filter(customer_name='Maria Santos').exists())
+
+
+class JobQueueTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        results = tempfile.TemporaryDirectory()
+        self.addCleanup(results.cleanup)
+        settings_override = override_settings(JOB_QUEUE={'RESULTS_DIR': results.name, 'RETRY_DELAY': 60})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def run_jobs(self):
+        out = StringIO()
+        call_command('run_jobs', '--inline', '--once', stdout=out)
+        return out.getvalue()
+
+    def test_background_bulk_import_of_payments(self):
+        # payments views trim their queryset by the request's ?fields=, which the job has to supply
+        order = SalesOrder.objects.create(customer=self.customer)
+        response = self.client.post('/sales_order_payments/?background=true', [
+            {'order_id': order.id, 'amount_paid': '100.00'},
+            {'order_id': 999, 'amount_paid': '50.00'},
+        ], format='json')
+        self.assertEqual(response.status_code, 202)
+
+        self.run_jobs()
+        job = self.client.get(response['Location']).data
+        self.assertEqual(job['status'], 'Succeeded')
+        self.assertEqual(job['result']['created'], 1)
+        self.assertEqual(SalesOrderPayment.objects.get().order, order)
+
+    def test_export_job_runs_and_its_file_downloads(self):
+        self.create_sales_orders(3)
+        response = self.client.post('/jobs/', {'kind': 'export', 'params': {'name': 'sales_orders'}}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], 'Queued')
+        self.assertTrue(response['Location'].endswith(f"/jobs/{response.data['id']}/"))
+
+        self.assertIn('Ran 1 jobs.', self.run_jobs())
+        job = self.client.get(response['Location']).data
+        self.assertEqual((job['status'], job['attempts'], job['result']['format']), ('Succeeded', 1, 'csv'))
+
+        download = self.client.get(job['result_url'], HTTP_ACCEPT='text/csv')
+        self.assertEqual(download['Content-Disposition'], 'attachment; filename="sales_orders.csv"')
+        lines = b''.join(download.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 4)
+
+        # other users neither see the job nor get its file
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user(username='other'))
+        self.assertEqual(other.get(job['result_url']).status_code, 404)
+        self.assertEqual(other.get('/jobs/').data, [])
+
+    def test_failing_job_is_retried_with_backoff_then_fails(self):
+        calls = []
+
+        def flaky(job):
+            calls.append(job.attempts)
+            raise RuntimeError("upstream unavailable")
+
+        jobs.get_tasks()
+        with mock.patch.dict(jobs.TASKS, {'flaky': jobs.Task('flaky', flaky)}):
+            job = jobs.enqueue('flaky', user=self.user, max_attempts=2)
+            with self.assertLogs('JohnCarAirCo.jobs', 'WARNING'):
+                self.run_jobs()
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), ('Queued', 1))
+            self.assertGreater(job.run_after, timezone.now() + datetime.timedelta(seconds=50))
+            # not due yet
+            self.assertIn('Ran 0 jobs.', self.run_jobs())
+
+            Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            with self.assertLogs('JohnCarAirCo.jobs', 'WARNING'):
+                self.run_jobs()
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts, calls), ('Failed', 2, [1, 2]))
+        self.assertEqual(self.client.get(f'/jobs/{job.pk}/').data['error'], 'RuntimeError: upstream unavailable')
+
+    def test_stale_running_job_is_given_another_attempt(self):
+        job = jobs.enqueue('compact_stock_ledger')
+        self.assertEqual(jobs.claim('lost-worker'), [job.pk])
+        self.assertEqual(jobs.claim('other-worker'), [])
+        Job.objects.filter(pk=job.pk).update(started_at=timezone.now() - datetime.timedelta(hours=2))
+
+        self.assertEqual(jobs.reclaim_stale(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('Queued', 1))
+        self.assertIn('lost-worker', job.error)
+
+    def test_invalid_jobs_are_rejected(self):
+        for data in [
+            {'kind': 'bulk_import', 'params': {}},
+            {'kind': 'export', 'params': {'name': 'users'}},
+            {'kind': 'report', 'params': {'report': 'sales', 'group_by': 'customer'}},
+        ]:
+            with self.subTest(data=data):
+                self.assertEqual(self.client.post('/jobs/', data, format='json').status_code, 400)
+        self.assertFalse(Job.objects.exists())
+
+    def test_maintenance_jobs_are_for_staff(self):
+        for kind in ('recompute_order_totals', 'rebuild_rollups', 'compact_stock_ledger'):
+            with self.subTest(kind=kind):
+                self.assertEqual(self.client.post('/jobs/', {'kind': kind}, format='json').status_code, 403)
+        self.assertFalse(Job.objects.exists())
+
+        staff = APIClient()
+        staff.force_authenticate(User.objects.create_user(username='manager', is_staff=True))
+        self.assertEqual(staff.post('/jobs/', {'kind': 'rebuild_rollups'}, format='json').status_code, 202)
+
+    def test_background_bulk_import_and_report(self):
+        order = ServiceOrder.objects.create(customer=self.customer, service_date=datetime.date(2023, 4, 1))
+        response = self.client.post('/service_order_entries/?background=true', [
+            {'service_id': self.service.id, 'order_id': order.id, 'quantity': 2},
+            {'service_id': 999, 'order_id': order.id, 'quantity': 1},
+            {'service_id': self.service.id, 'order_id': order.id, 'quantity': 1},
+        ], format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['params']['items'], 3)
+        self.assertEqual(ServiceOrderEntry.objects.count(), 0)
+        report = self.client.post('/jobs/', {'kind': 'report', 'params': {'report': 'services', 'group_by': 'service'}}, format='json')
+
+        self.run_jobs()
+        result = self.client.get(response['Location']).data['result']
+        self.assertEqual(result['created'], 2)
+        self.assertEqual([error['index'] for error in result['errors']], [1])
+        order.refresh_from_db()
+        self.assertEqual(order.total_price, Decimal('2400.00'))
+
+        download = self.client.get(f"/jobs/{report.data['id']}/result/")
+        self.assertEqual(
+            b''.join(download.streaming_content).decode().splitlines(),
+            ['service_id,service,units,revenue,order_count', f'{self.service.id},Cleaning,3,2400.00,1'],
+        )
+
+
+class MetricsTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        metrics.reset()
+        self.scraper = APIClient()
+        self.scraper.force_authenticate(User.objects.create_user(username='monitor', is_staff=True))
+
+    @staticmethod
+    def sample(text, name, **labels):
+        prefix = name + metrics.format_labels(labels.items())
+        values = [line.rpartition(' ')[2] for line in text.splitlines() if line.startswith(prefix + ' ')]
+        return float(values[0]) if values else None
+
+    def test_requests_are_recorded_per_route(self):
+        self.create_sales_orders(3)
+        for _ in range(2):
+            self.assertEqual(self.client.get('/sales_orders/').status_code, 200)
+        self.assertEqual(self.client.get('/sales_orders/999/').status_code, 404)
+        self.assertEqual(self.client.get('/no/such/page/').status_code, 404)
+
+        text = self.scraper.get('/metrics').content.decode()
+        route = {'route': 'salesorder-list', 'method': 'GET'}
+        self.assertEqual(self.sample(text, 'pos_http_requests_total', **route, status='200'), 2)
+        self.assertEqual(self.sample(text, 'pos_http_requests_total', route='salesorder-detail', method='GET', status='404'), 1)
+        self.assertEqual(self.sample(text, 'pos_http_requests_total', route='unmatched', method='GET', status='404'), 1)
+        self.assertEqual(self.sample(text, 'pos_http_request_duration_seconds_count', **route), 2)
+        self.assertEqual(self.sample(text, 'pos_http_request_duration_seconds_bucket', **route, le='+Inf'), 2)
+        self.assertGreater(self.sample(text, 'pos_http_response_size_bytes_sum', **route), 0)
+
+        executed = []
+
+        def count(execute, sql, params, many, context):
+            executed.append(sql)
+            return execute(sql, params, many, context)
+
+        before = self.sample(text, 'pos_http_request_db_queries_sum', **route)
+        with connection.execute_wrapper(count):
+            self.client.get('/sales_orders/')
+        text = self.scraper.get('/metrics').content.decode()
+        self.assertEqual(self.sample(text, 'pos_http_request_db_queries_sum', **route) - before, len(executed))
+        self.assertEqual(self.sample(text, 'pos_jobs', status='Queued'), 0)
+
+    def test_streamed_size_and_token(self):
+        self.create_sales_orders(2)
+        response = self.client.get('/exports/sales_orders.csv')
+        size = len(b''.join(response.streaming_content))
+        text = self.scraper.get('/metrics').content.decode()
+        self.assertEqual(self.sample(text, 'pos_http_response_size_bytes_sum', route='export', method='GET'), size)
+
+        anonymous = APIClient()
+        with override_settings(METRICS={'TOKEN': 'scrape-secret'}):
+            self.assertEqual(anonymous.get('/metrics').status_code, 403)
+            self.assertEqual(anonymous.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+            response = anonymous.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-secret')
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+
+    def test_staff_only_unless_public(self):
+        self.assertEqual(APIClient().get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        token = str(AccessToken.for_user(User.objects.get(username='monitor')))
+        self.assertEqual(APIClient().get('/metrics', HTTP_AUTHORIZATION=f'Bearer {token}').status_code, 200)
+        with override_settings(METRICS={'PUBLIC': True}):
+            self.assertEqual(APIClient().get('/metrics').status_code, 200)
+
+    def test_async_views_count_their_queries(self):
+        client = AsyncClient()
+        token = str(AccessToken.for_user(self.user))
+        self.create_sales_orders(2)
+
+        async def send():
+            return await client.get('/sales_orders/', AUTHORIZATION=f'Bearer {token}')
+
+        with override_settings(ROOT_URLCONF=api_urlconf(async_reads=True)):
+            self.assertEqual(async_to_sync(send)().status_code, 200)
+        text = self.scraper.get('/metrics').content.decode()
+        route = {'route': 'salesorder-list', 'method': 'GET'}
+        self.assertEqual(self.sample(text, 'pos_http_requests_total', **route, status='200'), 1)
+        self.assertGreaterEqual(self.sample(text, 'pos_http_request_db_queries_sum', **route), 3)
+
+
+class SlowQueryLogTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        slow_queries.reset()
+        self.addCleanup(slow_queries.reset)
+
+    def logging_all_queries(self):
+        return self.settings(SLOW_QUERY_LOG={'ENABLED': True, 'THRESHOLD_MS': 0})
+
+    def test_slow_queries_are_logged_with_origin_and_plan(self):
+        self.create_sales_orders(3)
+        with self.logging_all_queries(), self.assertLogs('JohnCarAirCo.slow_queries', 'WARNING') as logs:
+            self.client.get('/sales_orders/')
+            self.client.get('/sales_orders/?status=Active')
+
+        orders_table = SalesOrder._meta.db_table
+        entries = [
+            entry for entry in slow_queries.top(50)
+            if entry['query'].startswith(f'SELECT "{orders_table}"."id"')
+        ]
+        # the filtered and unfiltered lists are different statements
+        self.assertEqual([entry['count'] for entry in entries], [1, 1])
+        for entry in entries:
+            sample = entry['slowest']
+            self.assertEqual(sample['view'], 'GET salesorder-list')
+            self.assertTrue(sample['source'].startswith('JohnCarAirCo.payloads.'))
+            self.assertTrue(entry['plan'])
+            self.assertTrue(any(entry['fingerprint'] in line and 'plan:' in line for line in logs.output))
+
+    def test_same_statement_is_one_entry(self):
+        self.create_sales_orders(3)
+        with self.logging_all_queries(), self.assertLogs('JohnCarAirCo.slow_queries', 'WARNING'):
+            for order in SalesOrder.objects.all():
+                SalesOrder.objects.filter(pk=order.pk).exists()
+        entry, = [entry for entry in slow_queries.top(50) if 'LIMIT' in entry['query']]
+        self.assertEqual(entry['count'], 3)
+        self.assertGreaterEqual(entry['total_ms'], entry['max_ms'])
+
+    def test_disabled_by_default(self):
+        self.client.get('/customer_details/')
+        self.assertEqual(slow_queries.top(), [])
+
+    def test_card_data_is_redacted(self):
+        order = SalesOrder.objects.create(customer=self.customer)
+        with self.logging_all_queries(), self.assertLogs('JohnCarAirCo.slow_queries', 'WARNING') as logs:
+            response = self.client.post('/sales_order_payments/', {
+                'order_id': order.id, 'amount_paid': '100.00', 'is_cash': False,
+                'cc_number': '4111111111111111', 'cc_name': 'Juan Dela Cruz', 'cc_expiry': '12/29', 'cc_cvv': '123',
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        reported = json.dumps(slow_queries.top(50), default=str) + '\n'.join(logs.output)
+        for secret in ('4111111111111111', 'Juan Dela Cruz', '12/29', '"123"', "'123'"):
+            self.assertNotIn(secret, reported)
+        entry, = [entry for entry in slow_queries.top(50) if entry['query'].startswith('INSERT INTO "JohnCarAirCo_salesorderpayment"')]
+        self.assertIn('<str>', entry['slowest']['params'])
+
+    def test_fingerprint_folds_values_and_lists(self):
+        self.assertEqual(
+            slow_queries.fingerprint('SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = \'x\'  LIMIT 21'),
+            slow_queries.fingerprint('SELECT * FROM t WHERE id IN (%s) AND name = \'y\' LIMIT 5'),
+        )
+        self.assertEqual(
+            slow_queries.fingerprint('INSERT INTO t VALUES (%s, %s), (%s, %s)'),
+            'INSERT INTO t VALUES (...)',
+        )
+
+    def test_failed_explain_leaves_the_transaction_usable(self):
+        with transaction.atomic():
+            self.assertIsNone(slow_queries.explain_plan(connection, 'SELECT * FROM no_such_table', None))
+            self.assertEqual(CustomerDetails.objects.count(), 1)
+
+    def test_report_is_for_staff(self):
+        with self.logging_all_queries(), self.assertLogs('JohnCarAirCo.slow_queries', 'WARNING'):
+            self.client.get('/customer_details/')
+        self.assertEqual(self.client.get('/slow_queries/').status_code, 403)
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get('/slow_queries/', {'order': 'count', 'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(self.client.get('/slow_queries/', {'order': 'rows'}).status_code, 400)
+
+
+class EndpointBenchmarkTests(TransactionTestCase):
+    def test_every_endpoint_answers_without_errors(self):
+        reference_cache.get_cache().clear()
+        self.addCleanup(reference_cache.get_cache().clear)
+        report = endpoint_suite({'scale': 20, 'repeat': 2})
+
+        self.assertEqual(
+            set(report['endpoints']),
+            {'sales_orders', 'sales_order_entries', 'sales_order_payments', 'service_orders',
+             'service_order_entries', 'service_order_payments', 'token'},
+        )
+        for name, operations in report['endpoints'].items():
+            for operation, result in operations.items():
+                self.assertEqual((name, operation, result['errors']), (name, operation, 0))
+                self.assertEqual(result['requests'], 2)
+        self.assertEqual(set(report['endpoints']['sales_orders']), {'list', 'retrieve', 'create', 'delete'})
+        # what was created was deleted again
+        self.assertEqual(SalesOrder.objects.count(), 20)
+
+    def test_regressions_against_baseline(self):
+        def measurement(**values):
+            return {'requests': 20, 'per_second': 100.0, 'p50_ms': 10.0, 'p95_ms': 20.0, 'queries_per_request': 3.0, **values}
+
+        baseline = {'endpoints': {'sales_orders': {'list': measurement()}}, 'scale': 1000}
+        self.assertEqual(regressions(baseline, {**baseline, 'scale': 100000}), [])
+        # within the noise floor, and tail percentiles of a short run
+        self.assertEqual(regressions(baseline, {'endpoints': {'sales_orders': {'list': measurement(p50_ms=14.0, p95_ms=60.0)}}}), [])
+
+        report = {'endpoints': {'sales_orders': {'list': measurement(p50_ms=25.0, queries_per_request=4.0)}}}
+        self.assertEqual(
+            [(found['metric'], found['current']) for found in regressions(baseline, report)],
+            [('endpoints.sales_orders.list.p50_ms', 25.0), ('endpoints.sales_orders.list.queries_per_request', 4.0)],
+        )
@@ -0,0 +1,100 @@
+"""
+Per-table write versions for conditional GETs.
+
+An execute_wrapper installed on every database connection notices each
+INSERT, UPDATE and DELETE, so bulk_create, queryset.update(), cascades and
+management commands are all covered without signals. Inside a transaction
+it only notes the table; the backend (JohnCarAirCo/backends) bumps every
+table noted as the transaction's last statement before COMMIT, so the new
+versions commit or roll back together with the data, and a failed bump
+fails the commit rather than leaving readers with 304s for data that has
+changed. Tables written under a savepoint that is rolled back are dropped
+again. A write in autocommit mode is bumped right after it, and a failure
+there is raised too.
+"""
+import re
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+from django.utils import timezone
+
+from JohnCarAirCo.backends import TableVersionsMixin
+from JohnCarAirCo.models import TableVersion
+
+WRITE_PATTERN = re.compile(
+    r'\s*(?:INSERT\s+(?:OR\s+\w+\s+)?INTO|UPDATE|DELETE\s+FROM)\s+"?(?P<table>[^\s"(]+)', re.IGNORECASE
+)
+
+
+def track_writes(execute, sql, params, many, context):
+    result = execute(sql, params, many, context)
+    connection = context['connection']
+    match = WRITE_PATTERN.match(sql)
+    if match and match['table'] != TableVersion._meta.db_table and not getattr(connection, 'migrating', False):
+        if connection.get_autocommit():
+            bump({match['table']}, connection.alias)
+        else:
+            connection.written_tables.add((tuple(connection.savepoint_ids), match['table']))
+    return result
+
+
+def flush(connection):
+    """Bump the tables the open transaction wrote to; the backend calls this just before COMMIT."""
+    tables = {table for _, table in connection.written_tables}
+    connection.written_tables = set()
+    bump(tables, connection.alias)
+
+
+def install(sender, connection, **kwargs):
+    # connection_created receiver; runs again whenever a connection reopens
+    if not isinstance(connection, TableVersionsMixin):
+        raise ImproperlyConfigured(
+            f"DATABASES['{connection.alias}'] must use a JohnCarAirCo.backends engine for conditional GETs."
+        )
+    if track_writes not in connection.execute_wrappers:
+        connection.execute_wrappers.append(track_writes)
+
+
+def pause(sender, using, **kwargs):
+    # pre_migrate receiver: schema changes may run before the TableVersion table exists
+    connections[using].migrating = True
+
+
+def resume(sender, using, **kwargs):
+    connections[using].migrating = False
+
+
+def bump(tables, using='default'):
+    tables = sorted(set(tables))
+    if not tables:
+        return
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    # one upsert for all of them, in table order, so two transactions
+    # bumping the same tables can't deadlock on the version rows
+    sql = (
+        f'INSERT INTO {quote(TableVersion._meta.db_table)} ("table_name", "version", "updated_at") '
+        f'VALUES {", ".join(["(%s, 1, %s)"] * len(tables))} '
+        f'ON CONFLICT ("table_name") DO UPDATE SET "version" = {quote(TableVersion._meta.db_table)}."version" + 1, '
+        f'"updated_at" = excluded."updated_at"'
+    )
+    params = [value for table in tables for value in (table, now)]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def table_versions(models):
+    """
+    (token, last_modified) for the tables of `models`: a string that changes
+    whenever any of them is written, and the latest write time (or None).
+    """
+    tables = sorted({model._meta.db_table for model in models})
+    rows = {
+        table: (version, updated_at)
+        for table, version, updated_at in TableVersion.objects.filter(table_name__in=tables)
+        .values_list('table_name', 'version', 'updated_at')
+    }
+    token = ','.join(f'{table}:{rows.get(table, (0, None))[0]}' for table in tables)
+    last_modified = max((updated_at for _, updated_at in rows.values()), default=None)
+    return token, last_modified
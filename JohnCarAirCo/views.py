@@ -1,11 +1,23 @@
+from collections import Counter, defaultdict
+from datetime import datetime, time
+from decimal import Decimal
+
 from django.contrib.auth.models import User, Group
-from rest_framework import viewsets
+from django.db import transaction
+from django.db.models import Prefetch, Sum
+from django.db.models.functions import Coalesce
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime, parse_time
+from rest_framework import serializers, viewsets
 from rest_framework import permissions
 from JohnCarAirCo.models import (
     AirconType,
     ProductUnit,
     CustomerDetails,
     TechnicianDetails,
+    TechnicianAvailability,
+    TechnicianAvailabilityException,
     ServiceType,
     SalesOrder,
     SalesOrderEntry,
@@ -13,6 +25,13 @@ from JohnCarAirCo.models import (
     ServiceOrderEntry,
     SalesOrderPayment,
     ServiceOrderPayment,
+    DailySalesRollup,
+    DailyServiceRollup,
+    DailySalesOrderRollup,
+    DailyServiceOrderRollup,
+    StockMovement,
+    StockSnapshot,
+    Job,
 )
 from JohnCarAirCo.serializers import (
     AirconTypeSerializer,
@@ -22,19 +41,42 @@ from JohnCarAirCo.serializers import (
     ProductUnitSerializer,
     CustomerDetailsSerializer,
     TechnicianDetailsSerializer,
+    TechnicianAvailabilityExceptionSerializer,
     ServiceTypeSerializer,
     SalesOrderSerializer,
     SalesOrderEntrySerializer,
+    CheckoutSerializer,
     ServiceOrderSerializer,
     ServiceOrderEntrySerializer,
     SalesOrderPaymentSerializer,
     ServiceOrderPaymentSerializer,
+    StockAdjustmentSerializer,
+    JobSerializer,
+    reserve_stock,
 )
 from rest_framework import mixins
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
+from JohnCarAirCo import jobs, slow_queries
+from JohnCarAirCo.exports import EXPORTS, FORMATS, stream_export
+from JohnCarAirCo.filters import QueryParamFilter
+from JohnCarAirCo.mixins import (
+    AsyncReadMixin,
+    BulkModelMixin,
+    CachedListMixin,
+    ConditionalGetMixin,
+    PayloadReadMixin,
+    SparseFieldsViewMixin,
+)
+from JohnCarAirCo.payloads import SalesOrderPayload, ServiceOrderPayload
+from JohnCarAirCo.rollups import record_sales, record_services, sales_lines, service_lines
+from JohnCarAirCo.search import search_customers, search_terms, text_filter
 from rest_framework.views import APIView
 from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
+from rest_framework.utils.urls import replace_query_param
 from rest_framework import generics
 
 class UserDetailAPIView(APIView):
@@ -64,13 +106,23 @@ class GroupViewSet(viewsets.ModelViewSet):
     def delete(self, request, *args, **kwargs):
         return self.destroy(request, *args, **kwargs)
 
-class ProductUnitViewSet(viewsets.ModelViewSet):
+class ProductUnitViewSet(ConditionalGetMixin, CachedListMixin, AsyncReadMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows groups to be viewed or edited.
     """
-    queryset = ProductUnit.objects.all()
+    queryset = ProductUnit.objects.select_related('unit_type')
     serializer_class = ProductUnitSerializer
+    version_models = (ProductUnit, AirconType, StockMovement, StockSnapshot)
     permission_classes = [permissions.IsAuthenticated]
+    filter_backends = [QueryParamFilter]
+    filter_params = {
+        'unit_type': 'unit_type',
+        'price_min': 'unit_price__gte',
+        'price_max': 'unit_price__lte',
+    }
+    ordering_fields = ['id', 'unit_name', 'unit_price', 'unit_stock']
+    # the list shows stock, so stock movements drop cached pages too
+    cache_scopes = ('rows', 'stock')
 
     def put(self, request, *args, **kwargs):
         return self.update(request, *args, **kwargs)
@@ -78,12 +130,78 @@ class ProductUnitViewSet(viewsets.ModelViewSet):
     def delete(self, request, *args, **kwargs):
         return self.destroy(request, *args, **kwargs)
 
-class CustomerDetailsViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['post'])
+    def adjust_stock(self, request, pk=None):
+        # relative correction, so concurrent stock counts don't overwrite each other
+        serializer = StockAdjustmentSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        delta, kind = serializer.validated_data['delta'], serializer.validated_data['kind']
+
+        product = self.get_object()
+        if delta < 0:
+            with transaction.atomic():
+                reserve_stock({product.pk: -delta}, 'delta', kind)
+        else:
+            ProductUnit.objects.release({product.pk: delta}, kind)
+
+        return Response(self.get_serializer(self.get_queryset().get(pk=product.pk)).data)
+
+    def get_queryset(self):
+        # ?q= matches word prefixes of the name, ?in_stock=true|false filters on
+        # the ledger stock and ?ordering= picks the sort (and keyset) order.
+        # Stock is summed from the ledger per product, so in_stock and
+        # ordering=unit_stock have no index to use and scan every product
+        # matched so far; narrow with ?q= on large catalogues.
+        params = self.request.query_params
+        queryset = super().get_queryset().with_stock(as_of=self.get_as_of())
+        if params.get('q'):
+            queryset = queryset.filter(text_filter(ProductUnit, params['q']))
+
+        in_stock = params.get('in_stock')
+        if in_stock in serializers.BooleanField.TRUE_VALUES:
+            queryset = queryset.filter(unit_stock__gt=0)
+        elif in_stock in serializers.BooleanField.FALSE_VALUES:
+            queryset = queryset.filter(unit_stock__lte=0)
+        elif in_stock:
+            raise ValidationError({'in_stock': ['Expected true or false.']})
+
+        self.pagination_ordering = self.get_ordering()
+        return queryset.order_by(*self.pagination_ordering)
+
+    def get_ordering(self):
+        ordering = self.request.query_params.get('ordering', 'id')
+        field = ordering[1:] if ordering.startswith('-') else ordering
+        if field not in self.ordering_fields:
+            raise ValidationError({'ordering': [f"Choose one of {', '.join(self.ordering_fields)}, optionally prefixed with '-'."]})
+        if field == 'id':
+            return (ordering,)
+        # id breaks ties in the same direction so the (column, id) indexes serve
+        # the sort; unit_stock is computed, so it always sorts every row
+        return (ordering, '-id' if ordering.startswith('-') else 'id')
+
+    def get_as_of(self):
+        # ?as_of= reports stock at a past moment from the nearest snapshot and the movements since
+        as_of = self.request.query_params.get('as_of')
+        if as_of is None:
+            return None
+        try:
+            day = parse_date(as_of)
+            moment = datetime.combine(day, time.max) if day else parse_datetime(as_of)
+        except ValueError:
+            moment = None
+        if moment is None:
+            raise ValidationError({'as_of': ['Expected a date or datetime.']})
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return moment
+
+class CustomerDetailsViewSet(ConditionalGetMixin, AsyncReadMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows groups to be viewed or edited.
     """
     queryset = CustomerDetails.objects.all()
     serializer_class = CustomerDetailsSerializer
+    conditional_actions = ('list', 'retrieve', 'search')
     permission_classes = [permissions.IsAuthenticated]
 
     def put(self, request, *args, **kwargs):
@@ -92,12 +210,34 @@ class CustomerDetailsViewSet(viewsets.ModelViewSet):
     def delete(self, request, *args, **kwargs):
         return self.destroy(request, *args, **kwargs)
 
-class TechnicianDetailsViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        # ?q=juan ceb -> ranked matches, paged with ?page= and ?page_size=;
+        # "truncated" says only the newest search.MAX_CANDIDATES matches were ranked
+        if not search_terms(request.query_params.get('q')):
+            raise ValidationError({'q': ['Enter at least one word to search for.']})
+        page_size = self.paginator.get_page_size(request)
+        try:
+            page = max(int(request.query_params.get('page', 1)), 1)
+        except ValueError:
+            raise ValidationError({'page': ['Expected a page number.']})
+
+        customers, truncated = search_customers(request.query_params['q'], (page - 1) * page_size, page_size + 1)
+        url = request.build_absolute_uri()
+        return Response({
+            'next': replace_query_param(url, 'page', page + 1) if len(customers) > page_size else None,
+            'previous': replace_query_param(url, 'page', page - 1) if page > 1 else None,
+            'truncated': truncated,
+            'results': self.get_serializer(customers[:page_size], many=True).data,
+        })
+
+class TechnicianDetailsViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows groups to be viewed or edited.
     """
     queryset = TechnicianDetails.objects.all()
     serializer_class = TechnicianDetailsSerializer
+    conditional_actions = ('list', 'retrieve', 'available')
     permission_classes = [permissions.IsAuthenticated]
 
     def put(self, request, *args, **kwargs):
@@ -106,7 +246,52 @@ class TechnicianDetailsViewSet(viewsets.ModelViewSet):
     def delete(self, request, *args, **kwargs):
         return self.destroy(request, *args, **kwargs)
 
-class ServiceTypeViewSet(viewsets.ModelViewSet):
+    def get_version_models(self):
+        if self.action == 'available':
+            return (TechnicianDetails, TechnicianAvailability, TechnicianAvailabilityException, ServiceOrder)
+        return super().get_version_models()
+
+    @action(detail=False, methods=['get'])
+    def available(self, request):
+        # ?date=YYYY-MM-DD, optionally narrowed to a ?start=HH:MM / ?end=HH:MM window
+        params = request.query_params
+        errors = {}
+        try:
+            day = parse_date(params.get('date', ''))
+        except ValueError:
+            day = None
+        if day is None:
+            errors['date'] = ['Expected a date.']
+        times = {}
+        for name in ('start', 'end'):
+            if params.get(name):
+                try:
+                    times[name] = parse_time(params[name])
+                except ValueError:
+                    times[name] = None
+                if times[name] is None:
+                    errors[name] = ['Expected a time.']
+        if errors:
+            raise ValidationError(errors)
+
+        technicians = self.get_queryset().available_on(day, **times).order_by('tech_name', 'pk')
+        return Response(self.get_serializer(technicians, many=True).data)
+
+class TechnicianAvailabilityExceptionViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    """
+    Days off and extra working days that override a technician's weekly schedule.
+    """
+    queryset = TechnicianAvailabilityException.objects.all()
+    serializer_class = TechnicianAvailabilityExceptionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    filter_backends = [QueryParamFilter]
+    filter_params = {
+        'technician': 'technician',
+        'date_from': 'date__gte',
+        'date_to': 'date__lte',
+    }
+
+class ServiceTypeViewSet(ConditionalGetMixin, CachedListMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows groups to be viewed or edited.
     """
@@ -120,7 +305,7 @@ class ServiceTypeViewSet(viewsets.ModelViewSet):
     def delete(self, request, *args, **kwargs):
         return self.destroy(request, *args, **kwargs)
 
-class AirconTypeViewSet(viewsets.ModelViewSet):
+class AirconTypeViewSet(ConditionalGetMixin, CachedListMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows groups to be viewed or edited.
     """
@@ -134,36 +319,51 @@ class AirconTypeViewSet(viewsets.ModelViewSet):
     def delete(self, request, *args, **kwargs):
         return self.destroy(request, *args, **kwargs)
 
-class SalesOrderEntryViewSet(viewsets.ModelViewSet):
+class SalesOrderEntryViewSet(ConditionalGetMixin, SparseFieldsViewMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows groups to be viewed or edited.
     """
-    queryset = SalesOrderEntry.objects.all()
+    queryset = SalesOrderEntry.objects.select_related('product', 'order__customer')
     serializer_class = SalesOrderEntrySerializer
+    version_models = (SalesOrderEntry, SalesOrder, ProductUnit, CustomerDetails)
     permission_classes = [permissions.IsAuthenticated]
 
     def put(self, request, *args, **kwargs):
         return self.update(request, *args, **kwargs)
 
     def destroy(self, request, *args, **kwargs):
-        # subtract price to sales order total
+        # subtract price from sales order total
         sales_order_entry = self.get_object()
-        sales_order = SalesOrder.objects.get(id=sales_order_entry.order.id)
-
-        sales_order.total_price -= sales_order_entry.quantity * sales_order_entry.product.unit_price
-        sales_order.save()
-
-        sales_order_entry.delete()
+        with transaction.atomic():
+            deleted, _ = sales_order_entry.delete()
+            if deleted:
+                SalesOrder.objects.filter(pk=sales_order_entry.order_id).add_to_total(-sales_order_entry.entry_price)
+                if sales_order_entry.order.status != 'Cancelled':
+                    ProductUnit.objects.release({sales_order_entry.product_id: sales_order_entry.quantity})
+                    record_sales(sales_lines([sales_order_entry], -1))
 
         return Response(request.data, status=200)
 
-class SalesOrderViewSet(viewsets.ModelViewSet):
+class SalesOrderViewSet(ConditionalGetMixin, SparseFieldsViewMixin, PayloadReadMixin, AsyncReadMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows groups to be viewed or edited.
     """
-    queryset = SalesOrder.objects.all()
+    queryset = SalesOrder.objects.select_related('customer').prefetch_related(
+        # entry.order is filled from the parent by the prefetch, so only the product needs joining
+        Prefetch('entries', queryset=SalesOrderEntry.objects.select_related('product').order_by('id')),
+    )
     serializer_class = SalesOrderSerializer
+    payload_class = SalesOrderPayload
+    version_models = (SalesOrder, SalesOrderEntry, ProductUnit, CustomerDetails)
     permission_classes = [permissions.IsAuthenticated]
+    pagination_ordering = ('-date_ordered', '-id')
+    filter_backends = [QueryParamFilter]
+    filter_params = {
+        'status': 'status',
+        'customer': 'customer',
+        'date_from': 'date_ordered__gte',
+        'date_to': 'date_ordered__lte',
+    }
 
     def put(self, request, *args, **kwargs):
         return self.update(request, *args, **kwargs)
@@ -171,50 +371,162 @@ class SalesOrderViewSet(viewsets.ModelViewSet):
     def delete(self, request, *args, **kwargs):
         return self.destroy(request, *args, **kwargs)
 
-class ServiceOrderEntryViewSet(viewsets.ModelViewSet):
+    def perform_destroy(self, instance):
+        # deleting an order gives back the stock its lines were holding
+        with transaction.atomic():
+            entries = list(instance.entries.select_related('product'))
+            instance.delete()
+            if instance.status != 'Cancelled':
+                quantities = Counter()
+                for entry in entries:
+                    quantities[entry.product_id] += entry.quantity
+                ProductUnit.objects.release(quantities)
+                record_sales(sales_lines(entries, -1))
+
+    @action(detail=False, methods=['post'])
+    def checkout(self, request):
+        # customer, every line and the payment in one request and one transaction
+        serializer = CheckoutSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        order = serializer.save()
+
+        order = self.get_queryset().get(pk=order.pk)
+        return Response(self.get_serializer(order).data, status=201)
+
+class ServiceOrderEntryViewSet(ConditionalGetMixin, SparseFieldsViewMixin, BulkModelMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows groups to be viewed or edited.
     """
-    queryset = ServiceOrderEntry.objects.all()
+    queryset = ServiceOrderEntry.objects.select_related('service', 'order__customer')
     serializer_class = ServiceOrderEntrySerializer
+    version_models = (ServiceOrderEntry, ServiceOrder, ServiceType, CustomerDetails)
     permission_classes = [permissions.IsAuthenticated]
 
     def put(self, request, *args, **kwargs):
         return self.update(request, *args, **kwargs)
 
     def destroy(self, request, *args, **kwargs):
-        # subtract price to sales order total
+        # subtract price from service order total
         service_order_entry = self.get_object()
-        service_order = ServiceOrder.objects.get(id=service_order_entry.order.id)
-        
-        service_order.total_price -= service_order_entry.quantity * service_order_entry.service.service_cost
-        service_order.save()
-
-        service_order_entry.delete()
+        with transaction.atomic():
+            deleted, _ = service_order_entry.delete()
+            if deleted:
+                ServiceOrder.objects.filter(pk=service_order_entry.order_id).add_to_total(-service_order_entry.entry_price)
+                if service_order_entry.order.status != 'Cancelled':
+                    record_services(service_lines([service_order_entry], -1))
 
         return Response(request.data, status=200)
 
-class ServiceOrderViewSet(viewsets.ModelViewSet):
+    def perform_bulk_create(self, serializers):
+        entries = [ServiceOrderEntry(**s.validated_data) for s in serializers]
+        for entry in entries:
+            entry.entry_price = entry.service.service_cost * entry.quantity
+
+        with transaction.atomic():
+            ServiceOrderEntry.objects.bulk_create(entries)
+            self.adjust_totals((entry.order_id, entry.entry_price) for entry in entries)
+            record_services(service_lines(self.counted(entries), 1))
+        return entries
+
+    def perform_bulk_update(self, serializers):
+        changes, lines = [], []
+        for serializer in serializers:
+            entry = serializer.instance
+            changes.append((entry.order_id, -entry.entry_price))
+            lines += service_lines(self.counted([entry]), -1)
+            self.apply_validated_data(serializer)
+            entry.entry_price = entry.service.service_cost * entry.quantity
+            changes.append((entry.order_id, entry.entry_price))
+            lines += service_lines(self.counted([entry]), 1)
+
+        with transaction.atomic():
+            ServiceOrderEntry.objects.bulk_update(
+                [s.instance for s in serializers],
+                ['order', 'service', 'quantity', 'entry_price'],
+            )
+            self.adjust_totals(changes)
+            record_services(lines)
+
+    def perform_bulk_destroy(self, entries):
+        with transaction.atomic():
+            # re-read under lock so a concurrent delete can't be subtracted twice
+            rows = list(
+                ServiceOrderEntry.objects.select_for_update(of=('self',))
+                .select_related('order')
+                .filter(pk__in=[entry.pk for entry in entries])
+                .order_by('pk')
+            )
+            ServiceOrderEntry.objects.filter(pk__in=[row.pk for row in rows]).delete()
+            self.adjust_totals((row.order_id, -row.entry_price) for row in rows)
+            record_services(service_lines(self.counted(rows), -1))
+
+    @staticmethod
+    def counted(entries):
+        # lines on cancelled orders are kept out of the revenue rollups
+        return [entry for entry in entries if entry.order.status != 'Cancelled']
+
+    @staticmethod
+    def adjust_totals(changes):
+        # one UPDATE per affected service order, however many lines changed
+        totals = defaultdict(Decimal)
+        for order_id, amount in changes:
+            totals[order_id] += amount
+        # in id order, so concurrent bulk writes lock the order rows in the same order
+        for order_id, amount in sorted(totals.items()):
+            if amount:
+                ServiceOrder.objects.filter(pk=order_id).add_to_total(amount)
+
+class ServiceOrderViewSet(ConditionalGetMixin, SparseFieldsViewMixin, PayloadReadMixin, AsyncReadMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows groups to be viewed or edited.
     """
-    queryset = ServiceOrder.objects.all()
+    queryset = ServiceOrder.objects.select_related('customer', 'technician').prefetch_related(
+        Prefetch('entries', queryset=ServiceOrderEntry.objects.select_related('service').order_by('id')),
+    )
     serializer_class = ServiceOrderSerializer
+    payload_class = ServiceOrderPayload
+    version_models = (ServiceOrder, ServiceOrderEntry, ServiceType, CustomerDetails, TechnicianDetails)
     permission_classes = [permissions.IsAuthenticated]
+    pagination_ordering = ('-date_ordered', '-id')
+    filter_backends = [QueryParamFilter]
+    filter_params = {
+        'status': 'status',
+        'customer': 'customer',
+        'technician': 'technician',
+        'service_date': 'service_date',
+        'service_date_from': 'service_date__gte',
+        'service_date_to': 'service_date__lte',
+        'date_from': 'date_ordered__gte',
+        'date_to': 'date_ordered__lte',
+    }
 
     def put(self, request, *args, **kwargs):
         return self.update(request, *args, **kwargs)
 
     def delete(self, request, *args, **kwargs):
         return self.destroy(request, *args, **kwargs)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            entries = list(instance.entries.all())
+            instance.delete()
+            if instance.status != 'Cancelled':
+                record_services(service_lines(entries, -1))
     
-class SalesOrderPaymentViewSet(viewsets.ModelViewSet):
+class SalesOrderPaymentViewSet(ConditionalGetMixin, SparseFieldsViewMixin, BulkModelMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows groups to be viewed or edited.
     """
-    queryset = SalesOrderPayment.objects.all()
+    queryset = SalesOrderPayment.objects.select_related('order__customer')
     serializer_class = SalesOrderPaymentSerializer
+    version_models = (SalesOrderPayment, SalesOrder, CustomerDetails)
     permission_classes = [permissions.IsAuthenticated]
+    filter_backends = [QueryParamFilter]
+    filter_params = {
+        'order': 'order',
+        'date_paid_from': 'date_paid__gte',
+        'date_paid_to': 'date_paid__lte',
+    }
 
     def put(self, request, *args, **kwargs):
         return self.update(request, *args, **kwargs)
@@ -222,16 +534,232 @@ class SalesOrderPaymentViewSet(viewsets.ModelViewSet):
     def delete(self, request, *args, **kwargs):
         return self.destroy(request, *args, **kwargs)
 
-class ServiceOrderPaymentViewSet(viewsets.ModelViewSet):
+class ServiceOrderPaymentViewSet(ConditionalGetMixin, SparseFieldsViewMixin, BulkModelMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows groups to be viewed or edited.
     """
-    queryset = ServiceOrderPayment.objects.all()
+    queryset = ServiceOrderPayment.objects.select_related('order__customer')
     serializer_class = ServiceOrderPaymentSerializer
+    version_models = (ServiceOrderPayment, ServiceOrder, CustomerDetails)
     permission_classes = [permissions.IsAuthenticated]
+    filter_backends = [QueryParamFilter]
+    filter_params = {
+        'order': 'order',
+        'date_paid_from': 'date_paid__gte',
+        'date_paid_to': 'date_paid__lte',
+    }
 
     def put(self, request, *args, **kwargs):
         return self.update(request, *args, **kwargs)
 
     def delete(self, request, *args, **kwargs):
-        return self.destroy(request, *args, **kwargs)
\ No newline at end of file
+        return self.destroy(request, *args, **kwargs)
+
+
+class RollupReportViewSet(ConditionalGetMixin, viewsets.ViewSet):
+    """
+    Read-only totals from a daily rollup table.
+
+    ?start= and ?end= (YYYY-MM-DD, inclusive) bound the dates and ?group_by=
+    takes a comma separated list of the keys in `group_fields`. Without
+    group_by the whole range is one row. The rollup counts an order once per
+    item it contains, so order_count is summed from it when grouped by
+    `item_group` and from `order_rollup_model`, which counts each order once
+    a day, when grouped by nothing but the date. Other groupings (such as
+    aircon_type) have no exact order count and leave it out.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    rollup_model = None
+    order_rollup_model = None
+    # group_by key -> (rollup column, name in the response)
+    group_fields = {}
+    item_group = None
+    revenue_field = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+    def list(self, request):
+        return Response(self.get_rows(request.query_params))
+
+    def get_rows(self, params):
+        """The report for query `params` (start, end, group_by); also used by the report job."""
+        date_range = self.get_date_range(params)
+        rows = self.rollup_model.objects.filter(**date_range)
+        columns = self.get_group_columns(params)
+        totals = {
+            'units': Coalesce(Sum('units'), 0),
+            'revenue': Coalesce(Sum('revenue'), Decimal('0')),
+        }
+        counted_from = self.order_count_source(params)
+        if counted_from == 'items':
+            totals['order_count'] = Coalesce(Sum('order_count'), 0)
+        elif counted_from == 'days':
+            order_counts = self.get_daily_order_counts(columns, date_range)
+        if columns:
+            rows = rows.values(*columns).order_by(*columns).annotate(**totals)
+        else:
+            rows = [rows.aggregate(**totals)]
+
+        names = dict(pair for pairs in self.group_fields.values() for pair in pairs)
+        data = []
+        for row in rows:
+            item = {names[column]: row[column] for column in columns}
+            item['units'] = row['units']
+            item['revenue'] = self.revenue_field.to_representation(row['revenue'])
+            if counted_from == 'items':
+                item['order_count'] = row['order_count']
+            elif counted_from == 'days':
+                item['order_count'] = order_counts.get(row.get('date'), 0)
+            data.append(item)
+        return data
+
+    def order_count_source(self, params):
+        """'items' or 'days', the rollup whose order_count is exact for the grouping, or None."""
+        keys = {key for key in (params.get('group_by') or '').split(',') if key}
+        if self.item_group in keys:
+            return 'items'
+        if keys <= {'date'}:
+            return 'days'
+        return None
+
+    def get_daily_order_counts(self, columns, date_range):
+        # {date: orders}, or {None: orders} for the whole range
+        orders = self.order_rollup_model.objects.filter(**date_range)
+        if columns:
+            return dict(orders.values_list('date', 'order_count'))
+        return {None: orders.aggregate(total=Coalesce(Sum('order_count'), 0))['total']}
+
+    def get_date_range(self, params):
+        bounds = {}
+        for param, lookup in (('start', 'date__gte'), ('end', 'date__lte')):
+            value = params.get(param)
+            if value is None:
+                continue
+            try:
+                bounds[lookup] = parse_date(value)
+            except ValueError:
+                bounds[lookup] = None
+            if bounds[lookup] is None:
+                raise ValidationError({param: ['Expected a date in YYYY-MM-DD format.']})
+        return bounds
+
+    def get_group_columns(self, params):
+        keys = [key for key in (params.get('group_by') or '').split(',') if key]
+        unknown = [key for key in keys if key not in self.group_fields]
+        if unknown:
+            raise ValidationError({'group_by': [f"Unknown group {key!r}." for key in unknown]})
+        columns = []
+        for key in keys:
+            columns.extend(column for column, _ in self.group_fields[key])
+        return list(dict.fromkeys(columns))
+
+class SalesReportViewSet(RollupReportViewSet):
+    """
+    Sales revenue, units and order counts, grouped by any of date, product
+    and aircon_type.
+    """
+    rollup_model = DailySalesRollup
+    order_rollup_model = DailySalesOrderRollup
+    version_models = (DailySalesRollup, DailySalesOrderRollup, ProductUnit)
+    group_fields = {
+        'date': [('date', 'date')],
+        'product': [('product_id', 'product_id'), ('product__unit_name', 'product')],
+        'aircon_type': [('aircon_type_id', 'aircon_type')],
+    }
+    item_group = 'product'
+
+class ServiceReportViewSet(RollupReportViewSet):
+    """
+    Service revenue, units and order counts, grouped by any of date and
+    service.
+    """
+    rollup_model = DailyServiceRollup
+    order_rollup_model = DailyServiceOrderRollup
+    version_models = (DailyServiceRollup, DailyServiceOrderRollup, ServiceType)
+    group_fields = {
+        'date': [('date', 'date')],
+        'service': [('service_id', 'service_id'), ('service__service_name', 'service')],
+    }
+    item_group = 'service'
+
+class ExportView(APIView):
+    """
+    Streams a full export as CSV or NDJSON, e.g. /exports/sales_orders.csv.
+    Memory use doesn't depend on the table size.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def perform_content_negotiation(self, request, force=False):
+        # the format comes from the URL, so don't reject text/csv Accept headers
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, name, fmt):
+        if name not in EXPORTS or fmt not in FORMATS:
+            raise NotFound()
+        response = StreamingHttpResponse(stream_export(name, fmt), content_type=FORMATS[fmt])
+        response['Content-Disposition'] = f'attachment; filename="{name}.{fmt}"'
+        return response
+
+class JobViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Background jobs (see JohnCarAirCo/jobs.py), run by `manage.py run_jobs`.
+    POST {"kind": "export", "params": {"name": "sales_orders"}} queues one
+    and answers 202; poll GET /jobs/<id>/ until its status is Succeeded or
+    Failed, then download GET /jobs/<id>/result/. Users who aren't staff
+    only see their own jobs, and cannot queue the maintenance tasks.
+    """
+    queryset = Job.objects.all()
+    serializer_class = JobSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_ordering = ('-id',)
+
+    def get_queryset(self):
+        queryset = super().get_queryset().order_by('-id')
+        if not self.request.user.is_staff:
+            queryset = queryset.filter(created_by=self.request.user)
+        return queryset
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        if jobs.get_tasks()[serializer.validated_data['kind']].staff_only and not request.user.is_staff:
+            raise PermissionDenied(f"Only staff can queue {serializer.validated_data['kind']} jobs.")
+        job = jobs.enqueue(serializer.validated_data['kind'], serializer.validated_data['params'], user=request.user)
+        location = reverse('job-detail', args=[job.pk], request=request)
+        return Response(self.get_serializer(job).data, status=202, headers={'Location': location})
+
+    def perform_content_negotiation(self, request, force=False):
+        # the result file has its own type, whatever Accept asks for
+        return super().perform_content_negotiation(request, force=force or self.action == 'result')
+
+    @action(detail=True, methods=['get'])
+    def result(self, request, pk=None):
+        job = self.get_object()
+        path = jobs.result_path(job)
+        if job.status != jobs.SUCCEEDED or path is None or not path.exists():
+            raise NotFound('This job has no result file.')
+        # stored as "<job id>-<file name>"
+        filename = path.name.partition('-')[2]
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=filename, content_type=job.result_content_type)
+
+class SlowQueryView(APIView):
+    """
+    The slow statements this process has seen, grouped by fingerprint, with
+    the plan and slowest sample of each (see JohnCarAirCo/slow_queries.py).
+    ?order=total|max|count picks the ranking and ?limit= how many to list.
+    """
+    permission_classes = [permissions.IsAdminUser]
+    orders = ('total', 'max', 'count')
+
+    def get(self, request):
+        order = request.query_params.get('order', 'total')
+        if order not in self.orders:
+            raise ValidationError({'order': [f"Choose one of {', '.join(self.orders)}."]})
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), 200)
+        except ValueError:
+            raise ValidationError({'limit': ['Expected a number.']})
+        config = slow_queries.get_config()
+        return Response({
+            'enabled': config['ENABLED'],
+            'threshold_ms': config['THRESHOLD_MS'],
+            'results': slow_queries.top(limit, order),
+        })
@@ -12,5 +12,12 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'POSProject.settings')
+# serve the order, product and customer reads from async views
+os.environ.setdefault('ASYNC_READ_ENDPOINTS', '1')
 
 application = get_asgi_application()
+
+# fill this process's reference cache before the first request arrives
+from JohnCarAirCo.cache import warm_up  # noqa: E402
+
+warm_up()
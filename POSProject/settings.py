@@ -15,6 +15,8 @@ from datetime import timedelta
 
 import os
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -48,19 +50,38 @@ INSTALLED_APPS = [
     'corsheaders'
 ]
 
+# The HTML browsable API is only offered while debugging.
+BROWSABLE_API = DEBUG
+
 REST_FRAMEWORK = {
-    'DEFAULT_PAGINATION_CLASS': None,
+    'DEFAULT_PAGINATION_CLASS': 'JohnCarAirCo.pagination.KeysetPagination',
     'PAGE_SIZE': 10,
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
         'rest_framework_simplejwt.authentication.JWTAuthentication',
-    ]
+    ],
+    # orjson-backed when orjson is installed; see JohnCarAirCo/renderers.py
+    'DEFAULT_RENDERER_CLASSES': ['JohnCarAirCo.renderers.FastJSONRenderer'] + (
+        ['rest_framework.renderers.BrowsableAPIRenderer'] if BROWSABLE_API else []
+    ),
 }
 
+# Requests without ?cursor= or ?page_size= still get the full unpaginated list.
+# Turn this off once every POS terminal has moved to cursor pagination.
+PAGINATION_LEGACY_MODE = True
+
+# Native async views for the GET list/retrieve actions of the order, product
+# and customer endpoints (see JohnCarAirCo.mixins.AsyncReadMixin).
+# POSProject/asgi.py turns this on; under WSGI the sync views are cheaper.
+ASYNC_READ_ENDPOINTS = os.environ.get('ASYNC_READ_ENDPOINTS', '') == '1'
+
 MIDDLEWARE = [
+    # first, so its timings and sizes include all the other middleware
+    'JohnCarAirCo.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'JohnCarAirCo.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -69,6 +90,39 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Accept-Encoding negotiation for responses of at least MIN_LENGTH bytes, in
+# order of preference; "br" needs the brotli package and is skipped without it.
+RESPONSE_COMPRESSION = {
+    'ENCODINGS': ['br', 'gzip'],
+    'MIN_LENGTH': 1024,
+    'GZIP_LEVEL': 6,
+    'BROTLI_QUALITY': 5,
+}
+
+# Per-route latency, query and response size metrics, served in the
+# Prometheus text format at /metrics; see JohnCarAirCo/metrics.py. Only
+# staff may read it, and scrapers sending "Authorization: Bearer <TOKEN>"
+# when a TOKEN is set; PUBLIC (METRICS_PUBLIC=1) lets anyone read it.
+METRICS = {
+    'ENABLED': True,
+    'TOKEN': os.environ.get('METRICS_TOKEN', ''),
+    'PUBLIC': os.environ.get('METRICS_PUBLIC', '') == '1',
+}
+
+# Opt-in (SLOW_QUERY_LOG=1): statements taking THRESHOLD_MS or longer are
+# logged with their EXPLAIN plan and grouped by fingerprint, viewable by staff
+# at /slow_queries/; see JohnCarAirCo/slow_queries.py.
+SLOW_QUERY_LOG = {
+    'ENABLED': os.environ.get('SLOW_QUERY_LOG', '') == '1',
+    'THRESHOLD_MS': int(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 100)),
+    'EXPLAIN': True,
+    # seconds between EXPLAINs of the same statement
+    'EXPLAIN_INTERVAL': 60,
+    'MAX_FINGERPRINTS': 200,
+    # statements mentioning any of these log parameter types, not values
+    'REDACT': ('payment', 'cc_', 'auth_user', 'password'),
+}
+
 # ALLOWED_HOSTS=['*']
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
@@ -102,12 +156,88 @@ WSGI_APPLICATION = 'POSProject.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
-DATABASES = {
+# SQLite by default. Set DB_ENGINE=postgresql, with DB_NAME, DB_USER,
+# DB_PASSWORD, DB_HOST and DB_PORT, to run on PostgreSQL (needs psycopg2).
+# The test suite runs on either; against a throwaway server:
+#   docker run --rm -d -p 5432:5432 -e POSTGRES_PASSWORD=pos postgres:15
+#   DB_ENGINE=postgresql DB_PASSWORD=pos python manage.py test
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgresql':
+    # JohnCarAirCo/backends/postgresql is Django's backend plus the
+    # table-version bump before COMMIT (see JohnCarAirCo/versions.py)
+    DATABASES = {
+        'default': {
+            'ENGINE': 'JohnCarAirCo.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'pos'),
+            'USER': os.environ.get('DB_USER', 'postgres'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            # keep each worker thread's connection open across requests
+            # instead of reconnecting every time, and check it still works
+            # before reusing it after an error or a server restart
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 600)),
+            'CONN_HEALTH_CHECKS': True,
+            # required behind PgBouncer in transaction pooling mode
+            'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('DB_DISABLE_SERVER_SIDE_CURSORS', '') == '1',
+            'OPTIONS': {
+                'connect_timeout': 5,
+            },
+        }
+    }
+elif DB_ENGINE == 'sqlite':
+    # The SQLite backend in JohnCarAirCo/backends/sqlite3 applies 'pragmas' to
+    # every new connection and starts transactions with BEGIN IMMEDIATE, so
+    # concurrent writers queue on the busy timeout instead of failing with
+    # "database is locked", while WAL lets readers run alongside a writer.
+    DATABASES = {
+        'default': {
+            'ENGINE': 'JohnCarAirCo.backends.sqlite3',
+            'NAME': BASE_DIR / 'sql.db',
+            'OPTIONS': {
+                # seconds a connection waits for another's write lock
+                'timeout': 20,
+                'transaction_mode': 'IMMEDIATE',
+                'pragmas': {
+                    'journal_mode': 'WAL',
+                    # durable as of the last checkpoint; with WAL this can't corrupt the database
+                    'synchronous': 'NORMAL',
+                    # negative: in KiB, i.e. 64 MB of page cache per connection
+                    'cache_size': -64000,
+                    'mmap_size': 256 * 1024 * 1024,
+                    'temp_store': 'MEMORY',
+                },
+            },
+        }
+    }
+else:
+    raise ImproperlyConfigured(f"Unsupported DB_ENGINE {DB_ENGINE!r}; use 'sqlite' or 'postgresql'.")
+
+
+# The list payloads of the reference data (aircon types, services, products)
+# are cached here; see JohnCarAirCo/cache.py. Writes never read them. Each
+# serving process warms this cache as it starts. Use a shared backend (Redis,
+# Memcached) to share them between worker processes; `manage.py
+# warm_reference_cache` can then fill it on deploy.
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'sql.db',
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
+REFERENCE_CACHE_TIMEOUT = 300
+
+# Background jobs, run by `manage.py run_jobs`; see JohnCarAirCo/jobs.py.
+# RESULTS_DIR (relative to BASE_DIR) holds the files jobs write for download,
+# so it must be shared by the workers and the web processes. A failed attempt
+# is retried after RETRY_DELAY seconds, doubled each time, up to MAX_ATTEMPTS;
+# a job still running after STALE_AFTER seconds is assumed lost with its worker.
+JOB_QUEUE = {
+    'RESULTS_DIR': 'job_results',
+    'MAX_ATTEMPTS': 3,
+    'RETRY_DELAY': 30,
+    'STALE_AFTER': 3600,
+}
 
 
 # Password validation
@@ -14,18 +14,20 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.urls import include, path
-from rest_framework import routers
 from JohnCarAirCo import views
+from JohnCarAirCo.metrics import metrics_view
+from JohnCarAirCo.routers import BulkRouter
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
     TokenVerifyView
 )
 
-router = routers.DefaultRouter()
+router = BulkRouter()
 router.register(r'product_units', views.ProductUnitViewSet)
 router.register(r'customer_details', views.CustomerDetailsViewSet)
 router.register(r'technician_details', views.TechnicianDetailsViewSet)
+router.register(r'technician_availability_exceptions', views.TechnicianAvailabilityExceptionViewSet)
 router.register(r'services', views.ServiceTypeViewSet)
 router.register(r'sales_orders', views.SalesOrderViewSet)
 router.register(r'sales_order_entries', views.SalesOrderEntryViewSet)
@@ -34,6 +36,9 @@ router.register(r'service_order_entries', views.ServiceOrderEntryViewSet)
 router.register(r'aircon_types', views.AirconTypeViewSet)
 router.register(r'service_order_payments', views.ServiceOrderPaymentViewSet)
 router.register(r'sales_order_payments', views.SalesOrderPaymentViewSet)
+router.register(r'reports/sales', views.SalesReportViewSet, basename='sales-report')
+router.register(r'reports/services', views.ServiceReportViewSet, basename='service-report')
+router.register(r'jobs', views.JobViewSet)
 
 # Wire up our API using automatic URL routing.
 # Additionally, we include login URLs for the browsable API.
@@ -45,4 +50,7 @@ urlpatterns = [
     path('api-auth/', include('rest_framework.urls', namespace='rest_framework')),
     path('get_details/', views.UserDetailAPIView.as_view(), name="get-details"),
     path('register/', views.RegisterUserAPIView.as_view(), name="register"),
+    path('exports/<str:name>.<str:fmt>', views.ExportView.as_view(), name="export"),
+    path('metrics', metrics_view, name="metrics"),
+    path('slow_queries/', views.SlowQueryView.as_view(), name="slow-queries"),
 ]
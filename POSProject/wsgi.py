@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'POSProject.settings')
 
 application = get_wsgi_application()
+
+# fill this process's reference cache before the first request arrives
+from JohnCarAirCo.cache import warm_up  # noqa: E402
+
+warm_up()